@@ -0,0 +1,143 @@
+"""
+Téléchargement des pièces jointes cliniques (consultations, actes, référencements).
+
+Les fichiers sont servis en flux, avec prise en charge des requêtes partielles (Range, If-Range)
+et de la revalidation (ETag / If-None-Match) : un PDF d'imagerie interrompu reprend là où il
+s'était arrêté et un fichier déjà en cache côté client n'est pas renvoyé. En production, l'envoi
+peut être délégué au serveur web (ATTACHMENT_SENDFILE = 'x-accel-redirect' ou 'x-sendfile').
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date
+
+from .storage import digest_of
+
+# Taille des blocs lus sur le disque
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(fieldfile):
+    """
+    ETag fort : l'empreinte du contenu pour un blob adressé par contenu (storage.py), sinon la
+    taille et la date de modification du fichier.
+    """
+    digest = digest_of(fieldfile.name)
+    if digest:
+        return f'"{digest}"'
+    stat = os.stat(fieldfile.path)
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Comparaison faible, comme le veut If-None-Match
+    return any(candidate.strip().removeprefix('W/') == etag for candidate in header.split(','))
+
+
+def parse_range(header, size):
+    """
+    Retourne (début, fin incluse) pour un en-tête Range à un seul intervalle, None s'il est absent
+    ou non pris en charge (intervalles multiples : le fichier entier est alors servi), ou
+    'unsatisfiable' si l'intervalle est hors du fichier.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            block = fileobj.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        fileobj.close()
+
+
+def _offload(response, fieldfile):
+    mode = getattr(settings, 'ATTACHMENT_SENDFILE', '')
+    if mode == 'x-accel-redirect':
+        # Chemin réel sous MEDIA_ROOT : pour un blob, différent du nom enregistré en base
+        relative = os.path.relpath(fieldfile.path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.ATTACHMENT_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = fieldfile.path
+    return response
+
+
+def serve_attachment(request, fieldfile):
+    """Réponse de téléchargement pour `fieldfile` (fichier présent sur le disque)."""
+    size = fieldfile.size
+    etag = file_etag(fieldfile)
+    filename = os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    # Nom échappé (guillemets, caractères non ASCII en filename*=) comme le fait FileResponse
+    disposition = content_disposition_header(False, filename)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(os.stat(fieldfile.path).st_mtime),
+        'Accept-Ranges': 'bytes',
+        # Conservé par le navigateur, mais revalidé à chaque usage (données de santé : cache privé)
+        'Cache-Control': 'private, no-cache',
+    }
+
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        return HttpResponse(status=304, headers=headers)
+
+    if getattr(settings, 'ATTACHMENT_SENDFILE', ''):
+        # Le serveur web lit le fichier et gère lui-même les intervalles
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['Content-Disposition'] = disposition
+        return _offload(response, fieldfile)
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range.strip() != etag:
+        # Le fichier a changé depuis le début du téléchargement : on renvoie tout
+        byte_range = None
+
+    if byte_range == 'unsatisfiable':
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    if byte_range is None:
+        response = FileResponse(fieldfile.open('rb'), content_type=content_type, filename=filename, headers=headers)
+        response.block_size = BLOCK_SIZE
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _read_range(fieldfile.open('rb'), start, length), status=206, content_type=content_type, headers=headers,
+    )
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Disposition'] = disposition
+    return response
@@ -0,0 +1,116 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache
+
+
+class _UserCache:
+    """
+    Cache LRU en mémoire du processus, avec durée de vie : (user_id, jti) -> utilisateur
+    chargé avec son médecin. Chaque processus (worker) a le sien ; une entrée n'est servie
+    que si la génération de l'utilisateur (cache partagé, voir cache.py) n'a pas changé
+    depuis sa mise en cache, si bien qu'une modification faite par un autre worker est vue.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires, entry_generation = entry
+            if expires <= time.monotonic() or entry_generation != generation:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, key, user, generation):
+        ttl = getattr(settings, 'AUTH_CACHE_TTL', 60)
+        size = getattr(settings, 'AUTH_CACHE_SIZE', 1024)
+        if ttl <= 0 or size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + ttl, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = _UserCache()
+
+
+def invalidate_user(user_id):
+    """
+    Invalide le cache d'authentification d'un utilisateur dans tous les processus (génération
+    partagée), et libère tout de suite les entrées du processus courant. Appelé par les signaux
+    post_save / post_delete de User et Doctor.
+    """
+    cache.bump(cache.USER, [user_id])
+    user_cache.invalidate_user(user_id)
+
+
+def _request_copy(user):
+    """
+    Copie de l'utilisateur en cache et de son médecin : une vue qui modifie request.user ou
+    request.user.doctor n'altère pas l'entrée partagée entre les requêtes.
+    """
+    user = copy.copy(user)
+    doctor = user._state.fields_cache.get('doctor')
+    if doctor is not None:
+        doctor = copy.copy(doctor)
+        doctor._state.fields_cache['user'] = user
+        user._state.fields_cache['doctor'] = doctor
+    return user
+
+
+class DoctorJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication dont la résolution utilisateur + médecin est mise en cache par
+    (user_id, jti) : une requête authentifiée avec un jeton déjà vu ne fait aucune requête
+    SQL, y compris pour IsDoctor et request.user.doctor.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Le jeton ne contient aucune identification d'utilisateur reconnaissable.")
+        key = (str(user_id), validated_token.get(api_settings.JTI_CLAIM))
+        generation = cache.generation(cache.USER, str(user_id))
+
+        user = user_cache.get(key, generation)
+        if user is None:
+            try:
+                user = User.objects.select_related('doctor').get(**{api_settings.USER_ID_FIELD: user_id})
+            except User.DoesNotExist:
+                raise AuthenticationFailed("Utilisateur introuvable.", code='user_not_found')
+            if not user.is_active:
+                raise AuthenticationFailed("Utilisateur inactif.", code='user_inactive')
+            # Un médecin absent est mis en cache aussi : hasattr(user, 'doctor') reste sans requête
+            if not hasattr(user, 'doctor'):
+                user._state.fields_cache['doctor'] = None
+            user_cache.set(key, user, generation)
+
+        return _request_copy(user)
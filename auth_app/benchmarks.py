@@ -0,0 +1,167 @@
+"""
+Outils partagés par les commandes de benchmark (`manage.py bench_*`).
+Les benchmarks tournent sur une base SQLite jetable, jamais sur la base configurée.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from .models import (
+    Patient, Doctor, Appointment, Consultation, MedicalProcedure, Referral, ForumPost, ForumComment,
+    Workplace, DeletedAppointment, Note
+)
+from .stats import rebuild_counters
+
+
+@contextmanager
+def scratch_database(path=None, keep=False):
+    """
+    Crée une base SQLite de travail (migrée) à `path` et y redirige la connexion par défaut,
+    comme le fait le lanceur de tests. La base d'origine est restaurée à la sortie.
+    """
+    path = path or os.path.join(tempfile.gettempdir(), 'altheon_bench.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': path}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield path
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keep)
+
+
+def timed(function, repeat=5):
+    """Exécute `function` `repeat` fois et retourne la latence médiane en millisecondes."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def _batched(objects, size):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _spread_dates(table, column, days=3650):
+    """Répartit les dates d'une colonne auto_now_add sur les `days` derniers jours."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {column} = datetime('now', '-' || (abs(random()) % {days * 86400}) || ' seconds')"
+        )
+
+
+def seed_dataset(consultations=1_000_000, doctors=50, workplaces=10, batch_size=10_000, log=print, seed=42):
+    """
+    Remplit la base courante avec un jeu de données proportionnel au nombre de consultations.
+    Les insertions passent par bulk_create (sans signaux) : les tables dénormalisées
+    (visibilité, compteurs) sont reconstruites à la fin.
+    Retourne le médecin le plus chargé, à utiliser comme utilisateur du benchmark.
+    """
+    rnd = random.Random(seed)
+    patients_count = max(1000, consultations // 50)
+
+    log(f"Création de {doctors} médecins, {workplaces} cliniques et {patients_count} patients...")
+    workplace_objs = Workplace.objects.bulk_create(
+        [Workplace(name=f"Clinique {index}", address=f"{index} rue du Bench") for index in range(workplaces)]
+    )
+    users = User.objects.bulk_create([
+        User(username=f"bench{index}@example.com", email=f"bench{index}@example.com",
+             first_name=f"Prénom{index}", last_name=f"Nom{index}", password='!')
+        for index in range(doctors)
+    ])
+    doctor_objs = Doctor.objects.bulk_create([
+        Doctor(user=user, license_number=f"BENCH-{index}") for index, user in enumerate(users)
+    ])
+    Doctor.workplaces.through.objects.bulk_create([
+        Doctor.workplaces.through(doctor_id=doctor.pk, workplace_id=workplace_objs[index % workplaces].pk)
+        for index, doctor in enumerate(doctor_objs)
+    ])
+    patient_ids = [uuid.uuid4() for _ in range(patients_count)]
+    for batch in _batched((Patient(unique_id=patient_id, first_name=f"Patient{index}", last_name="Bench")
+                           for index, patient_id in enumerate(patient_ids)), batch_size):
+        Patient.objects.bulk_create(batch)
+    Patient.assigned_doctors.through.objects.bulk_create(
+        [Patient.assigned_doctors.through(patient_id=patient_id, doctor_id=rnd.choice(doctor_objs).pk)
+         for patient_id in patient_ids],
+        batch_size=batch_size,
+    )
+
+    # Répartition biaisée : le premier médecin porte ~20 % de l'activité
+    def pick_doctor():
+        return doctor_objs[0] if rnd.random() < 0.2 else rnd.choice(doctor_objs)
+
+    def insert(model, count, factory):
+        log(f"Insertion de {count} lignes {model.__name__}...")
+        for batch in _batched((factory(index) for index in range(count)), batch_size):
+            model.objects.bulk_create(batch)
+
+    insert(Consultation, consultations, lambda index: Consultation(
+        patient_id=rnd.choice(patient_ids), doctor=pick_doctor(), reason_for_consultation="Contrôle",
+        diagnosis="RAS", weight=70, temperature=37,
+    ))
+    insert(MedicalProcedure, consultations // 10, lambda index: MedicalProcedure(
+        patient_id=rnd.choice(patient_ids), operator=pick_doctor(), procedure_type="Échographie",
+        procedure_date=date.today() - timedelta(days=rnd.randrange(3650)),
+    ))
+    insert(Referral, consultations // 20, lambda index: Referral(
+        patient_id=rnd.choice(patient_ids), referred_to=pick_doctor(), referred_by=pick_doctor(),
+        specialty_requested="Cardiologie", reason_for_referral="Avis spécialisé",
+    ))
+    now = timezone.now()
+    insert(Appointment, consultations // 10, lambda index: Appointment(
+        patient_id=rnd.choice(patient_ids), doctor=pick_doctor(), workplace=rnd.choice(workplace_objs),
+        appointment_date=now + timedelta(minutes=rnd.randrange(-500_000, 500_000)), reason_for_appointment="Suivi",
+    ))
+    insert(DeletedAppointment, consultations // 50, lambda index: DeletedAppointment(
+        patient_id=rnd.choice(patient_ids), doctor=pick_doctor(), workplace=rnd.choice(workplace_objs),
+        appointment_date=now, reason_for_appointment="Suivi", deletion_reason="patient",
+    ))
+    insert(Note, consultations // 20, lambda index: Note(
+        author=pick_doctor(), patient_id=rnd.choice(patient_ids), content="Note de suivi",
+    ))
+    posts = max(1, consultations // 200)
+    insert(ForumPost, posts, lambda index: ForumPost(author=pick_doctor(), title=f"Sujet {index}", content="..."))
+    first_post_id = ForumPost.objects.order_by('pk').values_list('pk', flat=True).first()
+    insert(ForumComment, consultations // 20, lambda index: ForumComment(
+        post_id=first_post_id + rnd.randrange(posts), author=pick_doctor(), content="Réponse",
+    ))
+
+    for table, column in [
+        (Consultation._meta.db_table, 'consultation_date'),
+        (Referral._meta.db_table, 'date_of_referral'),
+        (DeletedAppointment._meta.db_table, 'deletion_date'),
+        (Note._meta.db_table, 'created_at'),
+        (ForumPost._meta.db_table, 'created_at'),
+        (ForumComment._meta.db_table, 'created_at'),
+    ]:
+        _spread_dates(table, column)
+
+    log("Reconstruction des tables dénormalisées...")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT OR IGNORE INTO auth_app_patientvisibility (doctor_id, patient_id, created_at) "
+            "SELECT doctor_id, patient_id, datetime('now') FROM ("
+            "SELECT doctor_id, patient_id FROM auth_app_consultation "
+            "UNION SELECT doctor_id, patient_id FROM auth_app_patient_assigned_doctors "
+            "UNION SELECT referred_to_id, patient_id FROM auth_app_referral)"
+        )
+        cursor.execute("ANALYZE")
+    rebuild_counters()
+    return doctor_objs[0]
@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Portées des numéros de génération
+GLOBAL = 'global'
+DOCTOR = 'doctor'
+WORKPLACE = 'workplace'
+USER = 'user'
+
+
+def _generation_key(scope, object_id):
+    return f'gen:{scope}:{object_id}'
+
+
+def _new_generation():
+    # Valeur de départ horodatée : si la clé est évincée puis recréée, elle ne peut pas
+    # retomber sur une génération déjà utilisée par une entrée encore en cache.
+    return time.time_ns()
+
+
+def _bump_now(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_generation(), timeout=None)
+
+
+def bump(scope, object_ids=(0,)):
+    """
+    Invalide toutes les entrées dépendant des entités données en incrémentant leur génération.
+    Deux incréments sont nécessaires : l'immédiat rend l'invalidation visible dans la transaction
+    qui écrit (lectures qui suivent l'écriture, tests sous TestCase où le commit n'a jamais lieu) ;
+    celui du commit écarte une valeur mise en cache entre-temps par un autre worker, qui a lu la
+    nouvelle génération mais encore les données d'avant le commit.
+    """
+    keys = [_generation_key(scope, object_id) for object_id in set(object_ids) if object_id is not None]
+    if not keys:
+        return
+    _bump_now(keys)
+    transaction.on_commit(lambda: _bump_now(keys))
+
+
+def _generations(keys):
+    """Générations courantes des clés données, créées si elles ne sont pas (ou plus) en cache."""
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), timeout=None)
+            generations[key] = cache.get(key) or _new_generation()
+    return generations
+
+
+def generation(scope, object_id):
+    """Génération courante d'une entité."""
+    key = _generation_key(scope, object_id)
+    return _generations([key])[key]
+
+
+def cached(name, dependencies, builder, params=None):
+    """
+    Retourne la valeur mise en cache pour `name`, ou la calcule avec `builder()`.
+    `dependencies` est une liste de couples (portée, id) : la clé inclut leurs générations,
+    de sorte qu'une entrée n'est jamais servie après une modification. Pas de TTL :
+    les entrées obsolètes ne sont plus lues et finissent évincées par le backend.
+    """
+    keys = [_generation_key(scope, object_id) for scope, object_id in dependencies]
+    generations = _generations(keys)
+
+    parts = [name, *(f'{key}={generations[key]}' for key in keys)]
+    if params:
+        parts.extend(f'{param}={value}' for param, value in sorted(params.items()))
+    payload_key = ':'.join(parts)
+
+    value = cache.get(payload_key)
+    if value is None:
+        value = builder()
+        cache.set(payload_key, value, timeout=None)
+    return value
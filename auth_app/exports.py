@@ -0,0 +1,284 @@
+"""
+Export PDF du dossier patient, rendu côté serveur.
+
+Le document est dessiné page par page sur un canvas reportlab, à partir de requêtes lues
+par paquets (QuerySet.iterator) : aucune liste d'objets ni « story » complète n'est construite,
+seules les pages terminées (compressées) sont conservées jusqu'à l'écriture du fichier.
+Le fichier produit est mis en cache dans EXPORT_ROOT, sous un nom qui contient la version du
+dossier (Patient.version) et une empreinte des médecins affichés (profil du médecin exportateur,
+auteurs des consultations et actes) : toute modification produit un nouveau nom, et les versions
+précédentes sont supprimées. Un fichier plus ancien que EXPORT_MAX_AGE n'est plus servi ; la
+commande purge_exports efface ces fichiers expirés (données de patients hors de la base).
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+
+from .models import Doctor
+
+# Taille des paquets lus en base
+EXPORT_CHUNK_SIZE = 200
+
+MARGIN = 50
+FONT = 'Helvetica'
+BOLD = 'Helvetica-Bold'
+
+PATIENT_FIELDS = [
+    ('date_of_birth', "Date de naissance"),
+    ('blood_group', "Groupe sanguin"),
+    ('email', "Email"),
+    ('phone_number', "Téléphone"),
+    ('address', "Adresse"),
+    ('emergency_contact_name', "Contact d'urgence"),
+    ('emergency_contact_number', "Téléphone d'urgence"),
+    ('allergies', "Allergies"),
+    ('medical_history', "Antécédents médicaux"),
+]
+
+CONSULTATION_FIELDS = [
+    ('reason_for_consultation', "Motif"),
+    ('weight', "Poids (kg)"),
+    ('height', "Taille (cm)"),
+    ('temperature', "Température (°C)"),
+    ('sp2', "SpO2 (%)"),
+    ('blood_pressure', "Tension artérielle"),
+    ('diagnosis', "Diagnostic"),
+    ('medications', "Traitement"),
+    ('medical_report', "Compte rendu"),
+]
+
+
+class PageWriter:
+    """Mise en page minimale sur un canvas : retour à la ligne et saut de page automatiques."""
+
+    def __init__(self, fileobj, title):
+        self.canvas = Canvas(fileobj, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.width, self.height = A4
+        self.page = 1
+        self.y = self.height - MARGIN
+
+    def _footer(self):
+        self.canvas.setFont(FONT, 8)
+        self.canvas.drawCentredString(self.width / 2, MARGIN / 2, f"Page {self.page}")
+
+    def new_page(self):
+        # La page terminée est écrite dans le document : seule la page courante reste à dessiner
+        self._footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - MARGIN
+
+    def space(self, height):
+        self.y -= height
+        if self.y < MARGIN:
+            self.new_page()
+
+    def _line(self, text, font, size, x, leading):
+        if self.y - leading < MARGIN:
+            self.new_page()
+        self.y -= leading
+        self.canvas.setFont(font, size)
+        self.canvas.drawString(x, self.y, text)
+
+    def text(self, text, font=FONT, size=10, indent=0):
+        leading = size * 1.4
+        width = self.width - 2 * MARGIN - indent
+        for paragraph in str(text).splitlines() or ['']:
+            for line in simpleSplit(paragraph, font, size, width) or ['']:
+                self._line(line, font, size, MARGIN + indent, leading)
+
+    def heading(self, text, size=14):
+        # Un titre n'est jamais laissé seul en bas de page
+        if self.y - size * 4 < MARGIN:
+            self.new_page()
+        self.space(size * 0.6)
+        self.text(text, BOLD, size)
+
+    def field(self, label, value, size=10):
+        """« Libellé : valeur », la valeur étant alignée en retrait sur plusieurs lignes."""
+        if value in (None, ''):
+            return
+        label = f"{label} : "
+        indent = stringWidth(label, BOLD, size)
+        leading = size * 1.4
+        width = self.width - 2 * MARGIN - indent
+        lines = [line for paragraph in str(value).splitlines() for line in (simpleSplit(paragraph, FONT, size, width) or [''])]
+        self._line(label, BOLD, size, MARGIN, leading)
+        self.canvas.setFont(FONT, size)
+        self.canvas.drawString(MARGIN + indent, self.y, lines[0] if lines else '')
+        for line in lines[1:]:
+            self._line(line, FONT, size, MARGIN + indent, leading)
+
+    def save(self):
+        self._footer()
+        self.canvas.save()
+
+
+def _format_datetime(value):
+    return timezone.localtime(value).strftime('%d/%m/%Y %H:%M') if value else ''
+
+
+def render_patient_record(patient, doctor, fileobj):
+    """Dessine le dossier complet de `patient` dans `fileobj`, pour le médecin `doctor`."""
+    writer = PageWriter(fileobj, f"Fiche patient {patient.first_name} {patient.last_name}")
+
+    writer.text(f"{doctor.user.first_name} {doctor.user.last_name}", BOLD, 14)
+    writer.text(doctor.specialty or "Spécialité non définie", FONT, 10)
+    writer.space(20)
+    writer.heading(f"Fiche Patient : {patient.first_name} {patient.last_name}", 18)
+    writer.text(f"Dossier à jour au {_format_datetime(patient.updated_at)}", FONT, 8)
+
+    writer.heading("Informations du patient")
+    for name, label in PATIENT_FIELDS:
+        value = getattr(patient, name)
+        writer.field(label, value.strftime('%d/%m/%Y') if name == 'date_of_birth' and value else value)
+
+    writer.heading("Historique des consultations")
+    consultations = patient.consultations.select_related('doctor__user').order_by('consultation_date', 'pk')
+    empty = True
+    for consultation in consultations.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        empty = False
+        writer.space(6)
+        writer.text(f"Consultation du {_format_datetime(consultation.consultation_date)}", BOLD, 11)
+        writer.field("Médecin", f"{consultation.doctor.user.first_name} {consultation.doctor.user.last_name}")
+        for name, label in CONSULTATION_FIELDS:
+            writer.field(label, getattr(consultation, name))
+    if empty:
+        writer.text("Aucune consultation enregistrée.")
+
+    writer.heading("Historique des actes médicaux")
+    procedures = patient.medical_procedures.select_related('operator__user').order_by('procedure_date', 'pk')
+    empty = True
+    for procedure in procedures.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        empty = False
+        writer.space(6)
+        writer.text(f"Acte du {procedure.procedure_date.strftime('%d/%m/%Y')} : {procedure.procedure_type}", BOLD, 11)
+        if procedure.operator:
+            writer.field("Opérateur", f"{procedure.operator.user.first_name} {procedure.operator.user.last_name}")
+        writer.field("Résultat", procedure.result)
+    if empty:
+        writer.text("Aucun acte médical enregistré.")
+
+    writer.heading("Référencements")
+    referrals = patient.referrals.select_related('referred_to__user', 'referred_by__user').order_by('date_of_referral', 'pk')
+    empty = True
+    for referral in referrals.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        empty = False
+        writer.space(6)
+        writer.text(f"Référencement du {_format_datetime(referral.date_of_referral)} : {referral.specialty_requested}", BOLD, 11)
+        if referral.referred_by:
+            writer.field("Adressé par", f"{referral.referred_by.user.first_name} {referral.referred_by.user.last_name}")
+        writer.field("Adressé à", f"{referral.referred_to.user.first_name} {referral.referred_to.user.last_name}")
+        writer.field("Motif", referral.reason_for_referral)
+        writer.field("Commentaires", referral.comments)
+    if empty:
+        writer.text("Aucun référencement enregistré.")
+
+    writer.save()
+
+
+def _record_prefix(patient, doctor):
+    return f"patient-{patient.pk}-{doctor.pk}-"
+
+
+def _record_fingerprint(patient, doctor):
+    """
+    Empreinte de ce que le PDF affiche hors du dossier versionné. Patient.version couvre la fiche,
+    les consultations, les actes et les référencements (médecins référents compris, voir
+    PatientManager.touch_referring) ; restent le profil du médecin exportateur (nom, spécialité,
+    cliniques) et les noms des auteurs des consultations et des actes.
+    """
+    doctors = Doctor.objects.filter(
+        Q(pk=doctor.pk)
+        | Q(pk__in=patient.consultations.values('doctor_id'))
+        | Q(pk__in=patient.medical_procedures.values('operator_id'))
+    ).order_by('pk').values_list('pk', 'specialty', 'user__first_name', 'user__last_name')
+    workplaces = doctor.workplaces.order_by('pk').values_list('pk', 'name', 'address')
+    return hashlib.sha1(repr((list(doctors), list(workplaces))).encode()).hexdigest()[:16]
+
+
+def _record_path(patient, doctor):
+    filename = f"{_record_prefix(patient, doctor)}{patient.version}-{_record_fingerprint(patient, doctor)}.pdf"
+    return os.path.join(settings.EXPORT_ROOT, filename)
+
+
+def _expired(path, now=None):
+    """True si le fichier a plus de EXPORT_MAX_AGE secondes (ou n'existe plus)."""
+    try:
+        return (now or time.time()) - os.path.getmtime(path) > settings.EXPORT_MAX_AGE
+    except FileNotFoundError:
+        return True
+
+
+def cached_patient_record(patient, doctor):
+    """Chemin du PDF à jour pour (patient, médecin) s'il est déjà en cache et non expiré, sinon None."""
+    path = _record_path(patient, doctor)
+    return None if _expired(path) else path
+
+
+def patient_record_name(patient, doctor):
+    """Nom du PDF à jour pour (patient, médecin) : identifie la version du dossier à produire."""
+    return os.path.basename(_record_path(patient, doctor))
+
+
+def patient_record_path(patient, doctor):
+    """
+    Retourne le chemin du PDF à jour pour (patient, médecin), en le produisant si besoin.
+    L'écriture passe par un fichier temporaire renommé : un export concurrent ne lit jamais
+    un fichier incomplet.
+    """
+    path = _record_path(patient, doctor)
+    if not _expired(path):
+        return path
+
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=settings.EXPORT_ROOT, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            render_patient_record(patient, doctor, fileobj)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+    # Les versions précédentes de ce dossier ne seront plus servies
+    prefix, filename = _record_prefix(patient, doctor), os.path.basename(path)
+    for name in os.listdir(settings.EXPORT_ROOT):
+        if name.startswith(prefix) and name != filename:
+            try:
+                os.unlink(os.path.join(settings.EXPORT_ROOT, name))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def purge_expired_records():
+    """
+    Supprime de EXPORT_ROOT les PDF expirés (voir EXPORT_MAX_AGE), y compris ceux de patients ou
+    de médecins supprimés, et les fichiers temporaires d'exports interrompus. Retourne le nombre
+    de fichiers supprimés.
+    """
+    try:
+        names = os.listdir(settings.EXPORT_ROOT)
+    except FileNotFoundError:
+        return 0
+    now, deleted = time.time(), 0
+    for name in names:
+        path = os.path.join(settings.EXPORT_ROOT, name)
+        if name.endswith(('.pdf', '.tmp')) and os.path.isfile(path) and _expired(path, now):
+            try:
+                os.unlink(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
@@ -0,0 +1,196 @@
+"""
+Import en masse de patients depuis un fichier CSV ou XLSX.
+
+Les lignes sont lues en flux et traitées par paquets : chaque ligne est validée avec les
+règles de PatientSerializer, puis chaque paquet est écrit avec bulk_create (patients,
+consultations initiales et assignations au médecin). Les tables dénormalisées sont mises
+à jour par le signal bulk_post_create. Chaque paquet est validé dans sa propre transaction.
+"""
+import codecs
+import csv
+import io
+import unicodedata
+from datetime import date, datetime
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Patient, Consultation
+from .serializers import PatientSerializer
+from .signals import bulk_post_create
+
+try:
+    import openpyxl
+except ImportError:  # dépendance optionnelle, nécessaire pour les fichiers .xlsx
+    openpyxl = None
+
+INITIAL_CONSULTATION_REASON = "Consultation initiale (ajout du patient par le médecin)"
+DEFAULT_CHUNK_SIZE = 1000
+
+# Champs importables (les relations ne le sont pas)
+IMPORT_FIELDS = [
+    'first_name', 'last_name', 'date_of_birth', 'medical_history', 'blood_group', 'address', 'email',
+    'phone_number', 'emergency_contact_name', 'emergency_contact_number', 'allergies',
+]
+
+# En-têtes usuels (normalisés : minuscules, sans accents, espaces -> _) vers les champs du modèle
+HEADER_ALIASES = {
+    'prenom': 'first_name',
+    'nom': 'last_name',
+    'date_de_naissance': 'date_of_birth',
+    'naissance': 'date_of_birth',
+    'antecedents': 'medical_history',
+    'antecedents_medicaux': 'medical_history',
+    'groupe_sanguin': 'blood_group',
+    'adresse': 'address',
+    'e_mail': 'email',
+    'courriel': 'email',
+    'telephone': 'phone_number',
+    'contact_urgence': 'emergency_contact_name',
+    'personne_a_prevenir': 'emergency_contact_name',
+    'telephone_urgence': 'emergency_contact_number',
+}
+
+
+class ImportFormatError(Exception):
+    """Fichier illisible ou format non pris en charge."""
+
+
+def _normalize_header(header):
+    text = unicodedata.normalize('NFKD', str(header or '')).encode('ascii', 'ignore').decode('ascii')
+    key = '_'.join(text.lower().replace('-', ' ').replace("'", ' ').split())
+    return HEADER_ALIASES.get(key, key)
+
+
+def _clean_value(field, value):
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        value = value.strip()
+        if field == 'date_of_birth':
+            try:
+                value = datetime.strptime(value, '%d/%m/%Y').date()
+            except ValueError:
+                pass
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _records(header, rows):
+    fields = [_normalize_header(name) for name in header]
+    if 'first_name' not in fields or 'last_name' not in fields:
+        raise ImportFormatError("Le fichier doit contenir au moins les colonnes prénom (first_name) et nom (last_name).")
+    for line, values in enumerate(rows, start=2):
+        record = {}
+        for field, value in zip(fields, values):
+            value = _clean_value(field, value)
+            # Une cellule vide vaut « non renseigné »
+            if field in IMPORT_FIELDS and value not in (None, ''):
+                record[field] = value
+        if record:
+            yield line, record
+
+
+def read_csv(fileobj):
+    text = codecs.getreader('utf-8-sig')(fileobj)
+    sample = text.read(4096)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(_chain(sample, text), dialect)
+    header = next(reader, None)
+    if header is None:
+        return iter(())
+    return _records(header, reader)
+
+
+def _chain(sample, text):
+    # Rejoue l'échantillon lu pour la détection du séparateur, puis le reste du fichier
+    yield from io.StringIO(sample + text.readline())
+    yield from text
+
+
+def read_xlsx(fileobj):
+    if openpyxl is None:
+        raise ImportFormatError("L'import XLSX nécessite le paquet openpyxl.")
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFormatError(f"Fichier XLSX illisible : {exc}")
+    rows = workbook.active.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return iter(())
+    return _records(header, rows)
+
+
+def read_rows(fileobj, filename):
+    """
+    Itère sur les lignes non vides du fichier (ouvert en binaire) : couples (n° de ligne, {champ: valeur}),
+    la ligne 1 étant l'en-tête.
+    Les CSV sont attendus en UTF-8, séparés par des virgules, points-virgules ou tabulations.
+    """
+    check_filename(filename)
+    if filename.lower().endswith('.xlsx'):
+        return read_xlsx(fileobj)
+    return read_csv(fileobj)
+
+
+def check_filename(filename):
+    """Lève ImportFormatError si l'extension du fichier n'est pas prise en charge."""
+    if not (filename or '').lower().endswith(('.csv', '.txt', '.xlsx')):
+        raise ImportFormatError("Format non pris en charge : fichier .csv ou .xlsx attendu.")
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_patients(records, doctor, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Crée les patients des lignes valides (couples fournis par read_rows), avec consultation
+    initiale et assignation à `doctor`, comme PatientViewSet.perform_create. Retourne un rapport :
+    {"total": lignes lues, "created": patients créés, "errors": [{"row": n° de ligne, "errors": {...}}]}.
+    """
+    validator = PatientSerializer()
+    report = {"total": 0, "created": 0, "errors": []}
+
+    for chunk in _chunks(records, chunk_size):
+        patients = []
+        for line, record in chunk:
+            report["total"] += 1
+            try:
+                data = validator.run_validation(record)
+            except serializers.ValidationError as exc:
+                report["errors"].append({"row": line, "errors": exc.detail})
+                continue
+            patient = Patient(**data)
+            patient.refresh_search_names()
+            patients.append(patient)
+        if not patients:
+            continue
+
+        Assignment = Patient.assigned_doctors.through
+        with transaction.atomic():
+            Patient.objects.bulk_create(patients)
+            consultations = Consultation.objects.bulk_create([
+                Consultation(patient=patient, doctor=doctor, reason_for_consultation=INITIAL_CONSULTATION_REASON)
+                for patient in patients
+            ])
+            assignments = Assignment.objects.bulk_create([
+                Assignment(patient_id=patient.pk, doctor_id=doctor.pk) for patient in patients
+            ])
+            bulk_post_create.send(sender=Patient, instances=patients)
+            bulk_post_create.send(sender=Consultation, instances=consultations)
+            bulk_post_create.send(sender=Assignment, instances=assignments)
+        report["created"] += len(patients)
+    return report
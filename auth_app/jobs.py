@@ -0,0 +1,203 @@
+"""
+File d'attente de travaux de fond, stockée dans la table Job (aucun broker : SQLite suffit).
+
+Les vues appellent `enqueue()` et répondent 202 ; la commande `runworker` réserve les
+travaux en attente par une mise à jour conditionnelle (atomique, y compris entre plusieurs
+workers) et les exécute dans un pool de processus. Avec JOBS_EAGER = True (développement),
+`enqueue()` exécute le travail immédiatement dans le processus courant.
+"""
+import os
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image
+
+from .exports import patient_record_path
+from .imports import ImportFormatError, import_patients, read_rows
+from .models import Consultation, Job, MedicalProcedure, Patient, Referral
+from .stats import rebuild_counters
+from .thumbnails import generate_derivatives
+
+# Fonctions d'exécution par type de travail : handler(job) -> résultat JSON
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+class JobError(Exception):
+    """Échec attendu d'un travail : le message est présenté tel quel à l'utilisateur."""
+
+
+def enqueue(kind, user=None, **params):
+    """Crée un travail en attente ; il est lancé après le commit de la transaction courante."""
+    job = Job.objects.create(kind=kind, created_by=user, params=params)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job
+
+
+def enqueue_once(kind, user=None, **params):
+    """
+    Comme `enqueue()`, sauf si un travail identique (type, utilisateur, paramètres) est déjà en
+    attente ou en cours : celui-ci est retourné. Recherche et création se font dans la même
+    transaction, sous verrou : deux requêtes simultanées ne créent qu'un travail.
+    """
+    with transaction.atomic():
+        job = Job.objects.select_for_update().filter(
+            kind=kind, created_by=user, status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING], params=params,
+        ).order_by('id').first()
+        if job is None:
+            job = enqueue(kind, user, **params)
+    return job
+
+
+def save_input(upload):
+    """Copie un fichier envoyé dans JOB_ROOT (hors MEDIA_ROOT, non servi) et retourne son chemin."""
+    directory = os.path.join(settings.JOB_ROOT, 'inputs')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}-{os.path.basename(upload.name)}")
+    with open(path, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    return path
+
+
+def claim_next(worker):
+    """Réserve le plus ancien travail en attente pour `worker` ; None si la file est vide."""
+    while True:
+        job_id = Job.objects.filter(status=Job.STATUS_PENDING).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        # Un autre worker a pu le réserver entre-temps : seule une mise à jour effective compte
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+
+
+def heartbeat(job_ids):
+    """Prolonge le bail des travaux en cours d'exécution (appelé périodiquement par runworker)."""
+    job_ids = list(job_ids)
+    if job_ids:
+        Job.objects.filter(pk__in=job_ids, status=Job.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+
+
+def release(job_id):
+    """Remet en attente un travail réservé qui n'a pas pu être lancé : la tentative ne compte pas."""
+    Job.objects.filter(pk=job_id, status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_PENDING, worker='', attempts=F('attempts') - 1,
+    )
+
+
+def abandon(job_ids, error):
+    """
+    Travaux interrompus sans résultat (processus tué, worker arrêté) : remis en attente, ou en
+    échec après JOB_MAX_ATTEMPTS tentatives, pour qu'un travail qui fait tomber son processus
+    à chaque exécution ne revienne pas indéfiniment. Retourne (remis en attente, en échec).
+    """
+    running = Job.objects.filter(pk__in=list(job_ids), status=Job.STATUS_RUNNING)
+    requeued = running.filter(attempts__lt=settings.JOB_MAX_ATTEMPTS).update(status=Job.STATUS_PENDING, worker='')
+    failed = running.update(status=Job.STATUS_FAILED, error=error, finished_at=timezone.now())
+    return requeued, failed
+
+
+def requeue_stale(older_than):
+    """Travaux « en cours » dont le bail n'a pas été prolongé depuis `older_than` secondes : voir abandon()."""
+    limit = timezone.now() - timedelta(seconds=older_than)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=limit) | Q(heartbeat_at__isnull=True, started_at__lt=limit)
+    )
+    return abandon(stale.values_list('pk', flat=True), "Exécution interrompue : le worker ne répond plus.")
+
+
+def run_job(job_id):
+    """Exécute un travail réservé et enregistre son résultat. Appelé dans un processus du pool."""
+    job = Job.objects.get(pk=job_id)
+    if job.status == Job.STATUS_PENDING:
+        job.status, job.started_at, job.attempts = Job.STATUS_RUNNING, timezone.now(), job.attempts + 1
+    try:
+        job.result = HANDLERS[job.kind](job)
+        job.status, job.error = Job.STATUS_SUCCEEDED, ''
+    except JobError as exc:
+        job.status, job.error = Job.STATUS_FAILED, str(exc)
+    except Exception:
+        job.status, job.error = Job.STATUS_FAILED, traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.save()
+    return job.status
+
+
+# --- Types de travaux ---
+
+@handler(Job.KIND_EXPORT_PDF)
+def export_pdf(job):
+    try:
+        patient = Patient.objects.get(pk=job.params['patient_id'])
+        doctor = job.created_by.doctor
+    except (Patient.DoesNotExist, AttributeError):
+        raise JobError("Patient ou médecin introuvable.")
+    job.result_file = patient_record_path(patient, doctor)
+    return {"filename": f"fiche_patient_{patient.pk}.pdf"}
+
+
+@handler(Job.KIND_IMPORT_PATIENTS)
+def import_patients_file(job):
+    path = job.params['path']
+    try:
+        doctor = job.created_by.doctor
+    except AttributeError:
+        raise JobError("Médecin introuvable.")
+    try:
+        with open(path, 'rb') as fileobj:
+            return import_patients(read_rows(fileobj, job.params['filename']), doctor)
+    except ImportFormatError as exc:
+        raise JobError(str(exc))
+    except UnicodeDecodeError:
+        raise JobError("Encodage non pris en charge : fichier UTF-8 attendu.")
+    finally:
+        # Le fichier contient des données de patients : il n'est pas conservé
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@handler(Job.KIND_REBUILD_STATS)
+def rebuild_stats(job):
+    drift = rebuild_counters()
+    return {"corrections": len(drift)}
+
+
+@handler(Job.KIND_THUMBNAILS)
+def thumbnails(job):
+    generated, failed = 0, []
+    for name in job.params['names']:
+        try:
+            generated += len(generate_derivatives(name))
+        except (OSError, Image.DecompressionBombError) as exc:
+            # Fichier supprimé entre-temps, illisible ou qui n'est pas une image : les autres continuent
+            failed.append(f"{name} : {exc}")
+    if failed and not generated:
+        raise JobError("\n".join(failed))
+    if generated:
+        # Les URL des miniatures apparaissent dans les objets et le dossier patient : ils ont changé
+        # (synchronisation différentielle, ETag du dossier)
+        now, patient_ids = timezone.now(), set()
+        for model, field in ((Consultation, 'attachments'), (MedicalProcedure, 'attachments'), (Referral, 'attached_documents')):
+            records = model.objects.filter(**{f'{field}__in': job.params['names']})
+            patient_ids.update(records.values_list('patient_id', flat=True))
+            records.update(updated_at=now)
+        Patient.objects.touch(patient_ids)
+    return {"generated": generated, "failed": failed}
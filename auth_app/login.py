@@ -0,0 +1,174 @@
+"""
+Exécution bornée des connexions.
+
+Le hachage PBKDF2 du mot de passe coûte plusieurs dizaines de millisecondes de CPU :
+il est confié à un pool de threads borné (hashlib relâche le GIL pendant le calcul),
+attendu sans bloquer par la vue asynchrone de connexion (servie en ASGI, voir asgi.py),
+avec une file d'attente plafonnée et un quota d'échecs par adresse IP, pour qu'une
+rafale de connexions ne puisse pas monopoliser les workers.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class LoginSaturated(Exception):
+    """La file d'attente des connexions est pleine."""
+
+
+class LoginExecutor:
+    """Pool de threads borné, avec compteurs de profondeur de file."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_in_flight = 0
+        self.total_wait = 0.0
+
+    @property
+    def workers(self):
+        return getattr(settings, 'LOGIN_WORKERS', 4)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'LOGIN_MAX_PENDING', 32)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='login')
+            return self._executor
+
+    def _call(self, function, args, queued_at, pooled=True):
+        with self._lock:
+            self.running += 1
+            self.total_wait += time.monotonic() - queued_at
+        try:
+            return function(*args)
+        finally:
+            if pooled:
+                # Les threads du pool gardent leur propre connexion : on applique CONN_MAX_AGE
+                close_old_connections()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, function, *args):
+        """
+        Exécute `function(*args)` dans le pool et attend son résultat sans bloquer la boucle
+        d'événements ; lève LoginSaturated quand LOGIN_WORKERS + LOGIN_MAX_PENDING connexions sont
+        déjà en cours. LOGIN_WORKERS = 0 : exécution dans le thread synchrone partagé (tests).
+        """
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_pending:
+                self.rejected += 1
+                raise LoginSaturated()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.workers <= 0:
+                return await sync_to_async(self._call)(function, args, time.monotonic(), False)
+            future = self._get_executor().submit(self._call, function, args, time.monotonic())
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "running": self.running,
+                "queued": self.in_flight - self.running,
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_wait_ms": round(self.total_wait * 1000 / self.completed, 2) if self.completed else 0.0,
+            }
+
+
+class SlidingWindowLimiter:
+    """
+    Compte les échecs par clé (adresse IP) sur une fenêtre glissante, en mémoire. Les connexions
+    réussies ne sont pas comptées : une clinique derrière une seule adresse n'est pas bloquée
+    par ses propres médecins.
+    """
+
+    # Nombre d'appels entre deux purges des clés inactives
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self.limited = 0
+
+    def retry_after(self, key, limit, window):
+        """0 si une tentative est admise pour `key`, sinon le délai d'attente en secondes."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) < limit:
+                return 0
+            self.limited += 1
+            return hits[0] + window - now
+
+    def hit(self, key, window):
+        """Enregistre un échec pour `key`."""
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.PURGE_EVERY == 0:
+                self._purge(now - window)
+            self._hits.setdefault(key, deque()).append(now)
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+
+    def _purge(self, horizon):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= horizon]:
+            del self._hits[key]
+
+    def metrics(self):
+        with self._lock:
+            return {"tracked_addresses": len(self._hits), "rate_limited": self.limited}
+
+
+login_executor = LoginExecutor()
+login_limiter = SlidingWindowLimiter()
+
+
+def client_ip(request):
+    """
+    Adresse du client. Derrière LOGIN_TRUSTED_PROXIES proxys (Render : 1), REMOTE_ADDR est celle
+    du dernier proxy : on prend dans X-Forwarded-For l'adresse ajoutée par le premier proxy de
+    confiance, en partant de la droite. Les entrées plus à gauche viennent du client et
+    peuvent être forgées.
+    """
+    proxies = getattr(settings, 'LOGIN_TRUSTED_PROXIES', 0)
+    if proxies > 0:
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def login_metrics():
+    return {**login_executor.metrics(), **login_limiter.metrics()}
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from auth_app import middleware
+from auth_app.benchmarks import scratch_database, seed_dataset, timed
+from auth_app.middleware import compress, compress_sequence
+
+# Réponses représentatives : dossiers complets, listes de noms, statistiques, synchronisation complète
+PAYLOADS = [
+    ('patient-list', ''),
+    ('patient-list', '?page_size=200'),
+    ('my_patients', '?page_size=200'),
+    ('global-stats', ''),
+    ('sync', ''),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure, sur une base SQLite jetable, la taille et le coût de compression (gzip, brotli si "
+        "installé) de réponses représentatives de l'API, et leur durée de transfert sur une liaison lente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consultations', type=int, default=50_000, help="Nombre de consultations à créer.")
+        parser.add_argument('--repeat', type=int, default=5, help="Nombre de mesures par cas (médiane).")
+        parser.add_argument('--link-kbps', type=int, default=256, help="Débit de la liaison simulée (kbit/s).")
+        parser.add_argument('--db-path', default=None, help="Chemin de la base de travail (défaut : dossier temporaire).")
+
+    def handle(self, *args, **options):
+        encodings = ['gzip'] + (['br'] if middleware.brotli is not None else [])
+        if middleware.brotli is None:
+            self.stderr.write(self.style.WARNING("brotli n'est pas installé : gzip seul."))
+
+        with scratch_database(options['db_path']):
+            doctor = seed_dataset(options['consultations'], log=self.stdout.write)
+            doctor.user.is_staff = True
+            doctor.user.save(update_fields=['is_staff'])
+            client = APIClient()
+            client.force_authenticate(doctor.user)
+            payloads = [(reverse(name) + query, self.fetch(client, reverse(name) + query)) for name, query in PAYLOADS]
+
+        link = options['link_kbps'] * 1000 / 8  # octets par seconde
+        transfer = f"transfert à {options['link_kbps']} kbit/s (s)"
+        self.stdout.write(
+            f"\n{'réponse':40} {'codage':14} {'octets':>10} {'ratio':>7} {'compression (ms)':>17} {transfer:>28}"
+        )
+        for url, chunks in payloads:
+            content = b''.join(chunks)
+            self.row(url, 'identité', len(content), len(content), 0, link)
+            for encoding in encodings:
+                size = len(compress(encoding, content))
+                duration = timed(lambda: compress(encoding, content), options['repeat'])
+                self.row(url, encoding, size, len(content), duration, link)
+                if len(chunks) > 1:
+                    # Chemin des réponses en flux : compression morceau par morceau
+                    size = sum(len(data) for data in compress_sequence(encoding, chunks))
+                    duration = timed(lambda: list(compress_sequence(encoding, chunks)), options['repeat'])
+                    self.row(url, f'{encoding} (flux)', size, len(content), duration, link)
+
+    def fetch(self, client, url):
+        """Morceaux du corps de la réponse (un seul pour une réponse classique)."""
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} -> {response.status_code}")
+        return list(response.streaming_content) if response.streaming else [response.content]
+
+    def row(self, url, encoding, size, original, duration, link):
+        self.stdout.write(
+            f"{url:40} {encoding:14} {size:10} {original / size:6.1f}x {duration:17.1f} {size / link:28.2f}"
+        )
@@ -0,0 +1,120 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, migrations
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from auth_app.benchmarks import scratch_database, seed_dataset, timed
+from auth_app.models import Workplace
+from auth_app.urls import router
+
+# Migration dont le benchmark mesure l'effet : seuls ses index sont retirés pendant la phase « avant »
+INDEX_MIGRATION = 'auth_app.migrations.0019_clinical_indexes'
+
+# Vues hors routeur servies en GET sans paramètre
+EXTRA_ENDPOINTS = [
+    'my_patients', 'deleted_appointments_list', 'doctor-stats', 'doctor-patient-stats', 'global-stats',
+]
+
+
+def migration_indexes(module=INDEX_MIGRATION):
+    """(modèle, index) ajoutés par la migration donnée, désignés par leur nom dans l'état actuel des modèles."""
+    operations = [
+        operation for operation in import_module(module).Migration.operations
+        if isinstance(operation, migrations.AddIndex)
+    ]
+    indexes = []
+    for operation in operations:
+        model = apps.get_model('auth_app', operation.model_name)
+        indexes.extend(
+            (model, index) for index in model._meta.indexes if index.name == operation.index.name
+        )
+    return indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Remplit une base SQLite jetable et affiche, pour chaque endpoint du routeur, "
+        "le plan d'exécution (EXPLAIN QUERY PLAN) et la latence sans puis avec les index de la "
+        "migration 0019_clinical_indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consultations', type=int, default=1_000_000, help="Nombre de consultations à créer.")
+        parser.add_argument('--repeat', type=int, default=3, help="Nombre de mesures par endpoint (médiane).")
+        parser.add_argument('--db-path', default=None, help="Chemin de la base de travail (défaut : dossier temporaire).")
+        parser.add_argument('--keep', action='store_true', help="Conserve la base de travail après le benchmark.")
+
+    def handle(self, *args, **options):
+        with scratch_database(options['db_path'], keep=options['keep']) as path:
+            self.stdout.write(f"Base de travail : {path}")
+            doctor = seed_dataset(options['consultations'], log=self.stdout.write)
+            client = APIClient()
+            client.force_authenticate(doctor.user)
+            endpoints = self.endpoints()
+
+            # Les autres index (synchronisation, recherche, file de travaux...) restent en place
+            indexed_models = migration_indexes()
+
+            results = {}
+            with connection.schema_editor() as editor:
+                for model, index in indexed_models:
+                    editor.remove_index(model, index)
+            results['avant'] = self.run_phase("SANS INDEX", client, endpoints, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for model, index in indexed_models:
+                    editor.add_index(model, index)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            results['après'] = self.run_phase("AVEC INDEX", client, endpoints, options['repeat'])
+
+            self.stdout.write("\n=== RÉSUMÉ (latence médiane, ms) ===")
+            self.stdout.write(f"{'endpoint':45} {'avant':>10} {'après':>10} {'gain':>8}")
+            for url in endpoints:
+                before, after = results['avant'][url], results['après'][url]
+                self.stdout.write(f"{url:45} {before:10.1f} {after:10.1f} {before / max(after, 0.001):7.1f}x")
+
+    def endpoints(self):
+        urls = [reverse(f'{basename}-list') for _, _, basename in router.registry]
+        urls.extend(reverse(name) for name in EXTRA_ENDPOINTS)
+        workplace = Workplace.objects.order_by('pk').first()
+        urls.append(reverse('workplace-statistics', args=[workplace.pk]))
+        return urls
+
+    def run_phase(self, title, client, endpoints, repeat):
+        self.stdout.write(f"\n=== {title} ===")
+        latencies = {}
+        for url in endpoints:
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.stdout.write(f"\nGET {url} -> {response.status_code}, {len(context.captured_queries)} requête(s)")
+            self.explain(context.captured_queries)
+
+            def request():
+                # Le cache des statistiques fausserait la mesure
+                cache.clear()
+                client.get(url)
+
+            latencies[url] = timed(request, repeat)
+            self.stdout.write(f"  latence médiane : {latencies[url]:.1f} ms")
+        return latencies
+
+    def explain(self, queries):
+        seen = set()
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                    continue
+                seen.add(sql)
+                self.stdout.write(f"  {sql[:160]}{'...' if len(sql) > 160 else ''}")
+                # Les paramètres sont déjà interpolés dans le SQL capturé
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                for row in cursor.fetchall():
+                    self.stdout.write(f"    {row[-1]}")
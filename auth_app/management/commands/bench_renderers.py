@@ -0,0 +1,94 @@
+import io
+import random
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from auth_app import renderers
+from auth_app.benchmarks import scratch_database, timed
+from auth_app.models import Consultation, Doctor, Patient
+from auth_app.renderers import FastJSONParser, FastJSONRenderer
+from auth_app.serializers import PatientListSerializer, SimpleConsultationSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare, sur une base SQLite jetable, la sérialisation champ par champ et le rendu direct "
+        "des lignes (RowListSerializer), puis JSONRenderer/JSONParser et leurs variantes orjson."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help="Nombre de patients et de consultations.")
+        parser.add_argument('--repeat', type=int, default=5, help="Nombre de mesures par cas (médiane).")
+        parser.add_argument('--db-path', default=None, help="Chemin de la base de travail (défaut : dossier temporaire).")
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stderr.write(self.style.WARNING("orjson n'est pas installé : les variantes rapides utilisent le module json."))
+        with scratch_database(options['db_path']):
+            self.seed(options['rows'])
+            results = []
+            for serializer_class, queryset in [
+                (PatientListSerializer, Patient.objects.order_by('pk')),
+                (SimpleConsultationSerializer, Consultation.objects.order_by('pk')),
+            ]:
+                results.extend(self.run_case(serializer_class, queryset, options['repeat']))
+
+        self.stdout.write(f"\n{'étape':52} {'référence (ms)':>15} {'rapide (ms)':>12} {'gain':>7}")
+        for label, before, after in results:
+            self.stdout.write(f"{label:52} {before:15.1f} {after:12.1f} {before / max(after, 0.001):6.1f}x")
+
+    def seed(self, rows):
+        self.stdout.write(f"Création de {rows} patients et {rows} consultations...")
+        rnd = random.Random(42)
+        user = User.objects.create(username='bench@example.com', email='bench@example.com', password='!')
+        doctor = Doctor.objects.create(user=user, license_number='BENCH-0')
+        patients = Patient.objects.bulk_create([
+            Patient(
+                unique_id=uuid.uuid4(), first_name=f"Prénom{index}", last_name=f"Nom{index}",
+                date_of_birth=date(1940, 1, 1) + timedelta(days=rnd.randrange(30000)),
+            )
+            for index in range(rows)
+        ], batch_size=1000)
+        Consultation.objects.bulk_create([
+            Consultation(
+                patient=rnd.choice(patients), doctor=doctor, reason_for_consultation="Contrôle",
+                diagnosis="RAS", medications="Paracétamol 1 g", blood_pressure="12/8",
+                weight=Decimal(rnd.randrange(3000, 12000)) / 100, height=Decimal(rnd.randrange(5000, 20000)) / 100,
+                sp2=Decimal(rnd.randrange(9000, 10000)) / 100, temperature=Decimal(rnd.randrange(3500, 4100)) / 100,
+            )
+            for _ in range(rows)
+        ], batch_size=1000)
+
+    def run_case(self, serializer_class, queryset, repeat):
+        name = serializer_class.__name__
+        # Référence : le ListSerializer standard de DRF, champ par champ sur les instances
+        def reference():
+            return serializers.ListSerializer(list(queryset.all()), child=serializer_class()).data
+
+        def fast():
+            return serializer_class(queryset.all(), many=True).data
+
+        expected, data = reference(), fast()
+        if list(expected) != list(data):
+            raise AssertionError(f"{name} : le rendu direct diffère de la sérialisation champ par champ.")
+
+        reference_bytes = JSONRenderer().render(expected)
+        fast_bytes = FastJSONRenderer().render(data)
+        if JSONParser().parse(io.BytesIO(reference_bytes)) != FastJSONParser().parse(io.BytesIO(fast_bytes)):
+            raise AssertionError(f"{name} : FastJSONRenderer produit un JSON différent de JSONRenderer.")
+        self.stdout.write(f"{name} : {len(data)} lignes, {len(fast_bytes)} octets, résultats identiques.")
+
+        return [
+            (f"{name} : requête + sérialisation", timed(reference, repeat), timed(fast, repeat)),
+            (f"{name} : rendu JSON", timed(lambda: JSONRenderer().render(expected), repeat),
+             timed(lambda: FastJSONRenderer().render(data), repeat)),
+            (f"{name} : lecture JSON", timed(lambda: JSONParser().parse(io.BytesIO(reference_bytes)), repeat),
+             timed(lambda: FastJSONParser().parse(io.BytesIO(fast_bytes)), repeat)),
+        ]
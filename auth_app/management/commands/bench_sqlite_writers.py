@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction, OperationalError
+
+from auth_app.benchmarks import scratch_database
+from auth_app.models import Patient, Doctor, Consultation
+
+
+def _write_patients(doctor_id, writes):
+    """
+    Processus écrivain : reproduit PatientViewSet.perform_create (patient, consultation
+    initiale et assignation dans une transaction), entrecoupé de lectures de la liste.
+    """
+    connections.close_all()
+    done = locked = 0
+    start = time.perf_counter()
+    for index in range(writes):
+        try:
+            with transaction.atomic():
+                patient = Patient.objects.create(first_name=f"Charge{index}", last_name=str(doctor_id))
+                Consultation.objects.create(
+                    patient=patient, doctor_id=doctor_id, reason_for_consultation="Consultation initiale"
+                )
+                patient.assigned_doctors.add(doctor_id)
+            done += 1
+        except OperationalError:
+            locked += 1
+        list(Patient.objects.filter(visibilities__doctor_id=doctor_id).order_by('-visibilities__id')[:50])
+    elapsed = time.perf_counter() - start
+    connections.close_all()
+    return done, locked, elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge : plusieurs processus écrivent en parallèle sur une base SQLite jetable, "
+        "avec chaque profil de DATABASE_PROFILES, et compare le débit obtenu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Nombre de processus écrivains (workers gunicorn).")
+        parser.add_argument('--writes', type=int, default=200, help="Transactions d'écriture par processus.")
+        parser.add_argument('--profiles', nargs='+', default=list(settings.DATABASE_PROFILES), help="Profils à comparer.")
+
+    def handle(self, *args, **options):
+        results = []
+        for profile in options['profiles']:
+            results.append((profile, *self.run_profile(profile, options['workers'], options['writes'])))
+
+        self.stdout.write(f"\n{'profil':12} {'réussies':>9} {'verrouillées':>13} {'durée (s)':>10} {'tx/s':>8}")
+        for profile, done, locked, elapsed in results:
+            self.stdout.write(f"{profile:12} {done:9} {locked:13} {elapsed:10.2f} {done / elapsed:8.1f}")
+
+    def run_profile(self, profile, workers, writes):
+        config = settings.DATABASE_PROFILES[profile]
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict.get(key) for key in config}
+        settings_dict.update(config)
+        path = os.path.join(tempfile.gettempdir(), f'altheon_writers_{profile}.sqlite3')
+        try:
+            with scratch_database(path):
+                doctor_ids = []
+                for index in range(workers):
+                    user = User.objects.create(username=f"charge{index}@example.com", password='!')
+                    doctor_ids.append(Doctor.objects.create(user=user, license_number=f"CHARGE-{index}").pk)
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    journal_mode = cursor.fetchone()[0]
+                self.stdout.write(f"Profil {profile} (journal_mode={journal_mode}) : {workers} processus x {writes} écritures...")
+
+                # Les processus fils ne doivent pas hériter de la connexion ouverte
+                connections.close_all()
+                start = time.perf_counter()
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                    outcomes = list(pool.map(_write_patients, doctor_ids, [writes] * workers))
+                elapsed = time.perf_counter() - start
+        finally:
+            settings_dict.update(saved)
+
+        done = sum(outcome[0] for outcome in outcomes)
+        locked = sum(outcome[1] for outcome in outcomes)
+        return done, locked, elapsed
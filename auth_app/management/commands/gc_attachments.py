@@ -0,0 +1,163 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from auth_app.models import AttachmentBlob, Consultation, MedicalProcedure, Referral
+from auth_app.storage import BLOB_DIR, PREFIX, attachment_storage, digest_of
+from auth_app.thumbnails import VARIANTS, derivative_name, record_derivatives
+
+# (modèle, champ fichier) référençant des blobs
+SOURCES = [
+    (Consultation, 'attachments'),
+    (MedicalProcedure, 'attachments'),
+    (Referral, 'attached_documents'),
+]
+# Fichier d'un blob en cours de suppression
+QUARANTINE_SUFFIX = '.gc'
+
+
+class Command(BaseCommand):
+    help = (
+        "Ramasse les pièces jointes orphelines : recompte les références aux blobs, puis supprime "
+        "les blobs sans référence et les fichiers inconnus du répertoire blobs/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Affiche ce qui serait supprimé (d'après les compteurs actuels) sans rien modifier.")
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help="Âge minimal (secondes) d'un blob sans référence avant suppression : protège les envois en cours.",
+        )
+        parser.add_argument(
+            '--adopt-legacy', action='store_true',
+            help="Déplace d'abord les pièces jointes enregistrées sous un nom classique vers le stockage par empreinte.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        limit = timezone.now() - timedelta(seconds=options['grace'])
+
+        if options['adopt_legacy'] and not dry_run:
+            self.stdout.write(f"{self._adopt_legacy()} pièce(s) jointe(s) déplacée(s) vers le stockage par empreinte.")
+
+        corrected = self._recount(dry_run)
+        self.stdout.write(f"{corrected} compteur(s) de références corrigé(s).")
+
+        freed = removed = 0
+        for blob in AttachmentBlob.objects.filter(ref_count__lte=0, updated_at__lt=limit).iterator():
+            path = attachment_storage.path(attachment_storage.blob_name(blob.digest))
+            if not dry_run:
+                # Quarantaine avant la suppression de la ligne : un envoi concurrent qui ne trouve plus
+                # le fichier le réécrit (voir ContentAddressedStorage.store)
+                quarantined = self._quarantine(path)
+                # Suppression conditionnelle : un envoi concurrent a pu réutiliser le blob entre-temps
+                if not AttachmentBlob.objects.filter(pk=blob.pk, ref_count__lte=0, updated_at__lt=limit).delete()[0]:
+                    if quarantined:
+                        os.replace(quarantined, path)
+                    continue
+                # Le blob et ses miniatures (thumbnails.py)
+                derivatives = [attachment_storage.path(derivative_name(f"{PREFIX}{blob.digest}/", variant)) for variant in VARIANTS]
+                for filename in ([quarantined] if quarantined else []) + derivatives:
+                    try:
+                        os.unlink(filename)
+                    except FileNotFoundError:
+                        pass
+            freed += blob.size
+            removed += 1
+
+        orphans, orphan_bytes = self._sweep_files(dry_run, time.time() - options['grace'])
+        verb = "seraient supprimés" if dry_run else "supprimés"
+        self.stdout.write(self.style.SUCCESS(
+            f"{removed} blob(s) et {orphans} fichier(s) orphelin(s) {verb} : {freed + orphan_bytes} octets libérés."
+        ))
+
+    def _quarantine(self, path):
+        """Déplace le fichier d'un blob sous « <empreinte>.gc » ; retourne ce chemin, None s'il n'existe pas."""
+        quarantined = f"{path}{QUARANTINE_SUFFIX}"
+        try:
+            os.rename(path, quarantined)
+        except FileNotFoundError:
+            return None
+        return quarantined
+
+    def _adopt_legacy(self):
+        adopted = 0
+        for model, field in SOURCES:
+            legacy = model.objects.exclude(Q(**{f"{field}__startswith": PREFIX}) | Q(**{field: ''}) | Q(**{f"{field}__isnull": True}))
+            for pk, name in legacy.values_list('pk', field).iterator():
+                try:
+                    with attachment_storage.open(name, 'rb') as content:
+                        stored_name = attachment_storage.store(name, File(content))[0]
+                except FileNotFoundError:
+                    self.stderr.write(self.style.WARNING(f"{model.__name__} {pk} : fichier introuvable ({name})."))
+                    continue
+                # update() : pas de signaux, les références sont recomptées juste après
+                model.objects.filter(pk=pk).update(**{field: stored_name})
+                attachment_storage.delete(name)
+                for variant in VARIANTS:
+                    legacy_derivative = attachment_storage.path(derivative_name(name, variant))
+                    if os.path.exists(legacy_derivative):
+                        os.replace(legacy_derivative, attachment_storage.path(derivative_name(stored_name, variant)))
+                record_derivatives(stored_name)
+                adopted += 1
+        return adopted
+
+    def _recount(self, dry_run):
+        counts = {}
+        for model, field in SOURCES:
+            names = model.objects.filter(**{f"{field}__startswith": PREFIX}).values_list(field, flat=True)
+            for name in names.iterator():
+                digest = digest_of(name)
+                counts[digest] = counts.get(digest, 0) + 1
+
+        corrected = 0
+        for digest, ref_count in AttachmentBlob.objects.values_list('digest', 'ref_count').iterator():
+            expected = counts.pop(digest, 0)
+            if expected != ref_count:
+                corrected += 1
+                if not dry_run:
+                    AttachmentBlob.objects.filter(pk=digest).update(ref_count=expected)
+        # Références vers des blobs inconnus de la table (fichier présent, ligne perdue)
+        for digest, expected in counts.items():
+            corrected += 1
+            if not dry_run:
+                path = attachment_storage.path(attachment_storage.blob_name(digest))
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                AttachmentBlob.objects.create(digest=digest, size=size, ref_count=expected)
+        return corrected
+
+    def _sweep_files(self, dry_run, older_than):
+        """Fichiers du répertoire blobs/ (blobs et miniatures) sans ligne AttachmentBlob, et temporaires abandonnés."""
+        root = os.path.join(attachment_storage.location, BLOB_DIR)
+        count = size = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime >= older_than:
+                    continue
+                # Miniature « <empreinte>.thumb.jpg » : conservée tant que son blob existe
+                digest = filename.split('.', 1)[0]
+                if os.path.basename(directory) != 'tmp' and AttachmentBlob.objects.filter(pk=digest).exists():
+                    # Quarantaine laissée par un ramassage interrompu : le blob est remis en place
+                    if filename.endswith(QUARANTINE_SUFFIX) and not dry_run:
+                        original = path[:-len(QUARANTINE_SUFFIX)]
+                        if not os.path.exists(original):
+                            os.replace(path, original)
+                    continue
+                if not dry_run:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        continue
+                count += 1
+                size += stat.st_size
+        return count, size
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_app.imports import DEFAULT_CHUNK_SIZE, ImportFormatError, import_patients, read_rows
+from auth_app.models import Doctor
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des patients depuis un fichier CSV ou XLSX, avec consultation initiale et "
+        "assignation au médecin indiqué, et affiche les lignes rejetées."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier .csv ou .xlsx à importer.")
+        parser.add_argument('--doctor', required=True, help="Médecin responsable : id ou email.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Lignes par transaction.")
+
+    def handle(self, *args, **options):
+        reference = options['doctor']
+        lookup = {'pk': reference} if reference.isdigit() else {'user__email': reference}
+        try:
+            doctor = Doctor.objects.get(**lookup)
+        except Doctor.DoesNotExist:
+            raise CommandError(f"Médecin introuvable : {reference}")
+
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                report = import_patients(read_rows(fileobj, options['path']), doctor, options['chunk_size'])
+        except (OSError, ImportFormatError, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        for error in report['errors']:
+            self.stderr.write(f"Ligne {error['row']} : {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} patient(s) importé(s) sur {report['total']} ligne(s) en {elapsed:.1f} s, "
+            f"{len(report['errors'])} ligne(s) rejetée(s)."
+        ))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auth_app.exports import purge_expired_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime de EXPORT_ROOT les exports PDF plus anciens que EXPORT_MAX_AGE secondes "
+        "(à planifier : ces fichiers contiennent des dossiers de patients)."
+    )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_records()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} export(s) supprimé(s) de {settings.EXPORT_ROOT}."))
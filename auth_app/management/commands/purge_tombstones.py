@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auth_app.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les traces de suppression plus anciennes que SYNC_TOMBSTONE_RETENTION jours : "
+        "les clients dont le curseur est plus ancien refont une synchronisation complète."
+    )
+
+    def handle(self, *args, **options):
+        limit = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=limit).delete()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} trace(s) de suppression supprimée(s)."))
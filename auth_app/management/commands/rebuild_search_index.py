@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auth_app.search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte (consultations, notes, antécédents des patients)."
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} document(s) indexé(s)."))
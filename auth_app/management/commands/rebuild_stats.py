@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from auth_app.stats import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de statistiques à partir de zéro et signale les écarts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Signale les écarts sans corriger les compteurs (code de sortie 1 en cas d'écart).",
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        drift = rebuild_counters(apply=not check_only)
+
+        for scope, object_id, field, stored, expected in drift:
+            self.stdout.write(f"{scope}#{object_id} {field} : stocké={stored} attendu={expected}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Aucun écart : les compteurs sont à jour."))
+        elif check_only:
+            self.stderr.write(self.style.ERROR(f"{len(drift)} écart(s) détecté(s)."))
+            raise SystemExit(1)
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} écart(s) corrigé(s)."))
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from auth_app.jobs import abandon, claim_next, heartbeat, release, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les travaux de fond en attente (table Job) dans un pool de processus. "
+        "Plusieurs instances peuvent tourner en parallèle sur la même base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS, help="Nombre de processus d'exécution.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Intervalle d'interrogation de la file (secondes).")
+        parser.add_argument('--burst', action='store_true', help="S'arrête dès que la file est vide.")
+
+    def handle(self, *args, **options):
+        self.workers = options['workers']
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = {}
+        self.stdout.write(f"Worker {self.name} : {self.workers} processus.")
+
+        pool = self.start_pool()
+        last_heartbeat = None
+        try:
+            while True:
+                # Bail des travaux en cours prolongé, et travaux des workers disparus relancés
+                if last_heartbeat is None or time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT:
+                    heartbeat(self.running.values())
+                    self.sweep()
+                    last_heartbeat = time.monotonic()
+
+                broken = not self.fill(pool)
+                if not broken and not self.running:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                done, _ = wait(self.running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    broken = not self.collect(future) or broken
+
+                if broken:
+                    # Un processus du pool est mort (tué, mémoire épuisée) : le pool est inutilisable
+                    self.stderr.write(self.style.ERROR("Pool de processus interrompu : redémarrage."))
+                    self.interrupted(list(self.running.values()))
+                    self.running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.start_pool()
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt demandé : attente des travaux en cours...")
+        finally:
+            pool.shutdown(wait=True)
+
+    def start_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+
+    def fill(self, pool):
+        """Réserve des travaux jusqu'à occuper le pool ; False si le pool est hors d'usage."""
+        while len(self.running) < self.workers:
+            claimed = claim_next(self.name)
+            if claimed is None:
+                return True
+            self.stdout.write(f"Travail {claimed.pk} ({claimed.kind}) démarré.")
+            # Les processus fils ne doivent pas hériter de la connexion ouverte
+            connections.close_all()
+            try:
+                self.running[pool.submit(run_job, claimed.pk)] = claimed.pk
+            except BrokenProcessPool:
+                release(claimed.pk)
+                return False
+        return True
+
+    def collect(self, future):
+        """Résultat d'un travail terminé ; False si son processus a fait tomber le pool."""
+        job_id = self.running.pop(future)
+        try:
+            self.stdout.write(f"Travail {job_id} : {future.result()}.")
+        except BrokenProcessPool:
+            self.interrupted([job_id])
+            return False
+        except Exception as exc:
+            self.interrupted([job_id], exc)
+        return True
+
+    def interrupted(self, job_ids, exc=None):
+        if not job_ids:
+            return
+        requeued, failed = abandon(job_ids, f"Exécution interrompue : {exc or 'processus arrêté'}.")
+        ids = ', '.join(str(job_id) for job_id in job_ids)
+        self.stderr.write(self.style.ERROR(
+            f"Travail(aux) {ids} interrompu(s) : {requeued} remis en attente, {failed} en échec."
+        ))
+
+    def sweep(self):
+        requeued, failed = requeue_stale(settings.JOB_STALE_AFTER)
+        if requeued or failed:
+            self.stdout.write(self.style.WARNING(
+                f"Travaux orphelins : {requeued} remis en attente, {failed} en échec."
+            ))
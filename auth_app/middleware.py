@@ -0,0 +1,145 @@
+"""
+Compression des réponses de l'API, négociée par Accept-Encoding : brotli si le client l'accepte
+et que le paquet est installé, sinon gzip. WhiteNoise ne compresse que les fichiers statiques ;
+les listes de patients, les statistiques et la synchronisation sont du JSON très répétitif,
+coûteux à transférer sur les liaisons mobiles des cliniques rurales.
+
+Ne sont pas compressés : les réponses plus petites que COMPRESSION_MIN_SIZE, les contenus
+binaires (PDF, images : déjà compressés), les réponses déjà encodées, les réponses partielles
+(206) et celles qui annoncent Accept-Ranges (pièces jointes : les plages portent sur les
+octets d'origine), ainsi que les chemins de COMPRESSION_EXCLUDED_PATHS (jetons dans le corps).
+Une réponse en flux (synchronisation, exports) est compressée au fil de l'eau, sans être
+lue en entier. L'ETag d'une réponse compressée devient faible (W/"...") : les requêtes
+conditionnelles (If-None-Match) la comparent toujours au même ETag.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip seul
+    brotli = None
+
+# Types compressibles (préfixes de Content-Type)
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+# gzip de Django (compress_string) : niveau 6, octets aléatoires dans l'en-tête contre BREACH
+GZIP_LEVEL = 6
+GZIP_MAX_RANDOM_BYTES = 100
+
+
+def accepted_encodings(header):
+    """Codages de l'en-tête Accept-Encoding avec leur poids q (« gzip;q=0.5, br » -> {'gzip': 0.5, 'br': 1.0})."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        accepted[coding] = weight
+    return accepted
+
+
+def negotiate_encoding(header):
+    """Codage à utiliser pour `header` ('br', 'gzip'), None pour une réponse non compressée."""
+    accepted = accepted_encodings(header or '')
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    weights = {coding: accepted.get(coding, accepted.get('*', 0.0)) for coding in available}
+    # À poids égal, brotli (premier de la liste) : plus compact que gzip sur le JSON
+    coding = max(available, key=lambda coding: weights[coding])
+    return coding if weights[coding] > 0 else None
+
+
+def compress(encoding, content):
+    if encoding == 'br':
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return compress_string(content, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+def _stream_compressor(encoding):
+    """
+    (compress, finish) d'un compresseur incrémental. Les morceaux ne sont pas vidés un à un
+    (un flux de synchronisation en produit de très petits) : le compresseur émet un bloc
+    quand son tampon est plein, et la mémoire reste bornée quelle que soit la taille du flux.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31 : en-tête et pied gzip
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_sequence(encoding, sequence):
+    compress_chunk, finish = _stream_compressor(encoding)
+    for chunk in sequence:
+        if data := compress_chunk(chunk):
+            yield data
+    yield finish()
+
+
+async def compress_async_sequence(encoding, sequence):
+    compress_chunk, finish = _stream_compressor(encoding)
+    async for chunk in sequence:
+        if data := compress_chunk(chunk):
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+
+    def process_response(self, request, response):
+        if not self._compressible(request, response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_sequence(encoding, response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(encoding, response.streaming_content)
+            # Taille finale inconnue avant la fin du flux
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # ETag faible (RFC 9110, 8.8.1) : If-None-Match, comparé faiblement, continue de correspondre
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compressible(self, request, response):
+        if response.status_code == 206 or response.has_header('Content-Encoding'):
+            return False
+        if response.get('Accept-Ranges', 'none') != 'none':
+            return False
+        content_type = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        if request.path.startswith(tuple(settings.COMPRESSION_EXCLUDED_PATHS)):
+            return False
+        return response.streaming or len(response.content) >= settings.COMPRESSION_MIN_SIZE
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_visibility(apps, schema_editor):
+    """Remplit la table de visibilité à partir des données existantes."""
+    Patient = apps.get_model('auth_app', 'Patient')
+    Consultation = apps.get_model('auth_app', 'Consultation')
+    Referral = apps.get_model('auth_app', 'Referral')
+    PatientVisibility = apps.get_model('auth_app', 'PatientVisibility')
+
+    pairs = set(Consultation.objects.values_list('doctor_id', 'patient_id'))
+    pairs.update(Patient.assigned_doctors.through.objects.values_list('doctor_id', 'patient_id'))
+    pairs.update(Referral.objects.values_list('referred_to_id', 'patient_id'))
+    PatientVisibility.objects.bulk_create(
+        [PatientVisibility(doctor_id=doctor_id, patient_id=patient_id) for doctor_id, patient_id in pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0016_registrationcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientVisibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_visibilities', to='auth_app.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibilities', to='auth_app.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'id'], name='visibility_doctor_id_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'patient'), name='unique_patient_visibility')],
+            },
+        ),
+        migrations.RunPython(populate_visibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:45
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    """Calcule les compteurs initiaux à partir des données existantes."""
+    Doctor = apps.get_model('auth_app', 'Doctor')
+    Workplace = apps.get_model('auth_app', 'Workplace')
+    Patient = apps.get_model('auth_app', 'Patient')
+    Consultation = apps.get_model('auth_app', 'Consultation')
+    MedicalProcedure = apps.get_model('auth_app', 'MedicalProcedure')
+    Referral = apps.get_model('auth_app', 'Referral')
+    StatsCounter = apps.get_model('auth_app', 'StatsCounter')
+    assignments = Patient.assigned_doctors.through.objects
+
+    def grouped(queryset, key, distinct_field='pk'):
+        return dict(queryset.order_by().values_list(key).annotate(total=Count(distinct_field, distinct=True)))
+
+    rows = [StatsCounter(
+        scope='global', object_id=0,
+        doctors=Doctor.objects.count(),
+        workplaces=Workplace.objects.count(),
+        patients=Patient.objects.count(),
+        consultations=Consultation.objects.count(),
+        referrals=Referral.objects.count(),
+        procedures=MedicalProcedure.objects.count(),
+    )]
+
+    patients = grouped(assignments.all(), 'doctor_id')
+    consultations = grouped(Consultation.objects.all(), 'doctor_id')
+    referrals = grouped(Referral.objects.all(), 'referred_by_id')
+    procedures = grouped(MedicalProcedure.objects.all(), 'operator_id')
+    for doctor in Doctor.objects.select_related('user'):
+        rows.append(StatsCounter(
+            scope='doctor', object_id=doctor.pk,
+            label=f"{doctor.user.first_name} {doctor.user.last_name}", specialty=doctor.specialty,
+            patients=patients.get(doctor.pk, 0),
+            consultations=consultations.get(doctor.pk, 0),
+            referrals=referrals.get(doctor.pk, 0),
+            procedures=procedures.get(doctor.pk, 0),
+        ))
+
+    patients = grouped(assignments.filter(doctor__workplaces__isnull=False), 'doctor__workplaces', 'patient_id')
+    consultations = grouped(Consultation.objects.filter(doctor__workplaces__isnull=False), 'doctor__workplaces')
+    procedures = grouped(MedicalProcedure.objects.filter(operator__workplaces__isnull=False), 'operator__workplaces')
+    for workplace in Workplace.objects.all():
+        rows.append(StatsCounter(
+            scope='workplace', object_id=workplace.pk, label=workplace.name,
+            patients=patients.get(workplace.pk, 0),
+            consultations=consultations.get(workplace.pk, 0),
+            procedures=procedures.get(workplace.pk, 0),
+        ))
+
+    StatsCounter.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0017_patientvisibility'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Global'), ('workplace', 'Clinique'), ('doctor', 'Médecin')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField(default=0)),
+                ('label', models.CharField(blank=True, default='', max_length=300)),
+                ('specialty', models.CharField(blank=True, default='', max_length=100)),
+                ('doctors', models.IntegerField(default=0)),
+                ('workplaces', models.IntegerField(default=0)),
+                ('patients', models.IntegerField(default=0)),
+                ('consultations', models.IntegerField(default=0)),
+                ('referrals', models.IntegerField(default=0)),
+                ('procedures', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'label'], name='stats_scope_label_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'object_id'), name='unique_stats_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0018_statscounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date'], name='appt_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['workplace', 'appointment_date'], name='appt_workplace_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['doctor', '-consultation_date'], name='consult_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedappointment',
+            index=models.Index(fields=['-deletion_date'], name='deleted_appt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumcomment',
+            index=models.Index(fields=['post', 'created_at'], name='forumcomment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumcomment',
+            index=models.Index(fields=['created_at'], name='forumcomment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumpost',
+            index=models.Index(fields=['-created_at'], name='forumpost_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalprocedure',
+            index=models.Index(fields=['operator', '-procedure_date'], name='procedure_operator_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['author', '-created_at'], name='note_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['referred_by', '-date_of_referral'], name='referral_by_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['referred_to', '-date_of_referral'], name='referral_to_date_idx'),
+        ),
+    ]
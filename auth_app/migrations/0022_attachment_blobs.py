@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:06
+
+import auth_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0021_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consultation',
+            name='attachments',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=auth_app.storage.select_attachment_storage, upload_to='consultation_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='medicalprocedure',
+            name='attachments',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=auth_app.storage.select_attachment_storage, upload_to='procedure_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='referral',
+            name='attached_documents',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=auth_app.storage.select_attachment_storage, upload_to='referral_documents/'),
+        ),
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='blob_gc_idx')],
+            },
+        ),
+    ]
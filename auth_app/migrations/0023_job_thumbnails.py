@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0022_attachment_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('export_pdf', 'Export PDF du dossier patient'), ('import_patients', 'Import de patients'), ('rebuild_stats', 'Recalcul des statistiques'), ('thumbnails', 'Miniatures des pièces jointes')], max_length=30),
+        ),
+    ]
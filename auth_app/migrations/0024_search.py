@@ -0,0 +1,90 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Index FTS5 à contenu externe (le texte reste dans auth_app_searchdocument), synchronisé par
+# triggers. remove_diacritics : recherche insensible aux accents ; prefix : requêtes « mot* ».
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE auth_app_search USING fts5(
+        body, content='auth_app_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER auth_app_search_insert AFTER INSERT ON auth_app_searchdocument BEGIN
+        INSERT INTO auth_app_search(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER auth_app_search_delete AFTER DELETE ON auth_app_searchdocument BEGIN
+        INSERT INTO auth_app_search(auth_app_search, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER auth_app_search_update AFTER UPDATE ON auth_app_searchdocument BEGIN
+        INSERT INTO auth_app_search(auth_app_search, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO auth_app_search(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS auth_app_search_update",
+    "DROP TRIGGER IF EXISTS auth_app_search_delete",
+    "DROP TRIGGER IF EXISTS auth_app_search_insert",
+    "DROP TABLE IF EXISTS auth_app_search",
+]
+
+
+def populate_search(apps, schema_editor):
+    """Indexe les données existantes (les triggers alimentent la table FTS5)."""
+    SearchDocument = apps.get_model('auth_app', 'SearchDocument')
+    sources = [
+        ('Consultation', 'consultation', ('diagnosis', 'medications', 'medical_report')),
+        ('Note', 'note', ('content',)),
+        ('Patient', 'patient', ('medical_history',)),
+    ]
+    for model_name, kind, fields in sources:
+        model = apps.get_model('auth_app', model_name)
+        documents = []
+        for instance in model.objects.iterator(chunk_size=1000):
+            for field in fields:
+                if getattr(instance, field):
+                    documents.append(SearchDocument(
+                        kind=kind,
+                        object_id=instance.pk.hex if kind == 'patient' else str(instance.pk),
+                        field=field,
+                        patient_id=instance.pk if kind == 'patient' else instance.patient_id,
+                        author_id=instance.author_id if kind == 'note' else None,
+                        body=getattr(instance, field),
+                    ))
+        SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0023_job_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.CharField(max_length=36)),
+                ('field', models.CharField(max_length=30)),
+                ('body', models.TextField()),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth_app.doctor')),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth_app.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id', 'field'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunSQL(CREATE_SEARCH_INDEX, DROP_SEARCH_INDEX),
+        migrations.RunPython(populate_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:12
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _fold(value):
+    # Copie figée de models.fold_name
+    value = unicodedata.normalize('NFKD', (value or '').casefold().translate(str.maketrans({'œ': 'oe', 'æ': 'ae'})))
+    return ' '.join(''.join(char for char in value if not unicodedata.combining(char)).split())
+
+
+def populate_search_names(apps, schema_editor):
+    Patient = apps.get_model('auth_app', 'Patient')
+    patients = []
+    for patient in Patient.objects.only('pk', 'first_name', 'last_name').iterator(chunk_size=1000):
+        patient.search_name = _fold(f"{patient.last_name} {patient.first_name}")
+        patient.search_name_reversed = _fold(f"{patient.first_name} {patient.last_name}")
+        patients.append(patient)
+    Patient.objects.bulk_update(patients, ['search_name', 'search_name_reversed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0024_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(default='', editable=False, max_length=201),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_name_reversed',
+            field=models.CharField(default='', editable=False, max_length=201),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['search_name'], name='patient_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['search_name_reversed'], name='patient_search_rev_idx'),
+        ),
+        migrations.RunPython(populate_search_names, migrations.RunPython.noop),
+    ]
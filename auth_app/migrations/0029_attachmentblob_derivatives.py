@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:02
+
+import os
+
+from django.db import migrations, models
+
+
+def record_existing_derivatives(apps, schema_editor):
+    """Note sur les blobs les miniatures et aperçus déjà produits (présents sur le disque)."""
+    from auth_app.storage import attachment_storage
+
+    AttachmentBlob = apps.get_model('auth_app', 'AttachmentBlob')
+    for digest in AttachmentBlob.objects.values_list('digest', flat=True).iterator():
+        base = attachment_storage.path(attachment_storage.blob_name(digest))
+        variants = [variant for variant in ('thumb', 'preview') if os.path.exists(f"{base}.{variant}.jpg")]
+        if variants:
+            AttachmentBlob.objects.filter(pk=digest).update(derivatives=variants)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0028_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(record_existing_derivatives, migrations.RunPython.noop),
+    ]
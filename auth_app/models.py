@@ -1,7 +1,9 @@
+import unicodedata
 import uuid
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone # Import requis pour RegistrationCode
+from .storage import digest_of, select_attachment_storage
 
 # --- Modèle RegistrationCode (NOUVEAU) ---
 class RegistrationCode(models.Model):
@@ -74,6 +76,39 @@ class Doctor(models.Model):
         return self.user.get_full_name()
 
 # --- Modèle Patient ---
+
+# Ligatures que la décomposition Unicode ne sépare pas
+_LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae'})
+
+def fold_name(value):
+    """Forme de recherche d'un nom : minuscules, sans accents ni espaces superflus (« Hélène » -> « helene »)."""
+    value = unicodedata.normalize('NFKD', (value or '').casefold().translate(_LIGATURES))
+    return ' '.join(''.join(char for char in value if not unicodedata.combining(char)).split())
+
+class PatientManager(models.Manager):
+    def touch(self, patient_ids):
+        """
+        Signale une modification du dossier de ces patients (fiche, consultations, actes,
+        référencements, médecins assignés) : nouvelle date de modification et nouvelle version.
+        """
+        patient_ids = {patient_id for patient_id in patient_ids if patient_id is not None}
+        if patient_ids:
+            self.filter(pk__in=patient_ids).update(updated_at=timezone.now(), version=models.F('version') + 1)
+
+    def touch_referring(self, doctor_ids):
+        """
+        Comme touch(), pour les patients dont un référencement affiche l'un de ces médecins
+        (referred_to_details / referred_by_details : nom, spécialité, cliniques).
+        """
+        doctor_ids = {doctor_id for doctor_id in doctor_ids if doctor_id is not None}
+        if doctor_ids:
+            referrals = Referral.objects.filter(
+                models.Q(referred_to_id__in=doctor_ids) | models.Q(referred_by_id__in=doctor_ids)
+            )
+            self.filter(pk__in=referrals.values('patient_id')).update(
+                updated_at=timezone.now(), version=models.F('version') + 1
+            )
+
 class Patient(models.Model):
     unique_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     first_name = models.CharField(max_length=100)
@@ -88,10 +123,166 @@ class Patient(models.Model):
     emergency_contact_number = models.CharField(max_length=20, null=True, blank=True)
     allergies = models.TextField(null=True, blank=True)
     assigned_doctors = models.ManyToManyField('Doctor', related_name='assigned_patients', blank=True)
+    # Mis à jour aussi à chaque modification des consultations, actes et référencements (signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Noms repliés (fold_name) « nom prénom » et « prénom nom », indexés pour la recherche par préfixe
+    search_name = models.CharField(max_length=201, default='', editable=False)
+    search_name_reversed = models.CharField(max_length=201, default='', editable=False)
+    # Version du dossier complet (ETag de PatientViewSet.retrieve), incrémentée avec updated_at
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = PatientManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['search_name'], name='patient_search_name_idx'),
+            models.Index(fields=['search_name_reversed'], name='patient_search_rev_idx'),
+            # SyncView : patients modifiés depuis le curseur
+            models.Index(fields=['updated_at'], name='patient_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def refresh_search_names(self):
+        """Recalcule les noms de recherche ; appelé avant chaque sauvegarde (signals.py) et avant un bulk_create."""
+        self.search_name = fold_name(f"{self.last_name} {self.first_name}")
+        self.search_name_reversed = fold_name(f"{self.first_name} {self.last_name}")
+
+# --- Modèle PatientVisibility ---
+class PatientVisibilityManager(models.Manager):
+    def grant(self, pairs):
+        """Rend visibles les couples (doctor_id, patient_id) donnés. Idempotent."""
+        rows = [self.model(doctor_id=doctor_id, patient_id=patient_id) for doctor_id, patient_id in set(pairs) if doctor_id and patient_id]
+        if rows:
+            self.bulk_create(rows, ignore_conflicts=True)
+
+    def refresh(self, pairs):
+        """
+        Recalcule la visibilité des couples (doctor_id, patient_id) donnés à partir
+        des consultations, des médecins assignés et des référencements.
+        """
+        for doctor_id, patient_id in set(pairs):
+            if not doctor_id or not patient_id:
+                continue
+            visible = (
+                Consultation.objects.filter(doctor_id=doctor_id, patient_id=patient_id).exists()
+                or Patient.assigned_doctors.through.objects.filter(doctor_id=doctor_id, patient_id=patient_id).exists()
+                or Referral.objects.filter(referred_to_id=doctor_id, patient_id=patient_id).exists()
+            )
+            if visible:
+                self.grant([(doctor_id, patient_id)])
+            else:
+                self.filter(doctor_id=doctor_id, patient_id=patient_id).delete()
+
+class PatientVisibility(models.Model):
+    """
+    Table matérialisée "médecin ↔ patient visible".
+    Un patient est visible par un médecin s'il a une consultation avec lui, s'il lui est
+    assigné ou s'il lui a été référé. Tenue à jour par les signaux de auth_app/signals.py.
+    """
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name='patient_visibilities')
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='visibilities')
+    # SyncView : un patient devenu visible est envoyé avec tout son dossier
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PatientVisibilityManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='unique_patient_visibility'),
+        ]
+        indexes = [
+            # Parcours par plage pour la pagination par curseur (doctor_id = ? AND id < ?)
+            models.Index(fields=['doctor', 'id'], name='visibility_doctor_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} visible par le docteur {self.doctor_id}"
+
+# --- Modèle StatsCounter ---
+class StatsCounter(models.Model):
+    """
+    Compteurs dénormalisés servis par GlobalStatsView : une ligne globale, une ligne par
+    clinique et une ligne par médecin. Mis à jour de façon incrémentale par les signaux
+    (voir auth_app/stats.py) et reconstruits par la commande `rebuild_stats`.
+    """
+    SCOPE_GLOBAL = 'global'
+    SCOPE_WORKPLACE = 'workplace'
+    SCOPE_DOCTOR = 'doctor'
+    SCOPE_CHOICES = [
+        (SCOPE_GLOBAL, 'Global'),
+        (SCOPE_WORKPLACE, 'Clinique'),
+        (SCOPE_DOCTOR, 'Médecin'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    object_id = models.PositiveBigIntegerField(default=0) # 0 pour la ligne globale
+    label = models.CharField(max_length=300, blank=True, default='') # Nom de la clinique ou du médecin
+    specialty = models.CharField(max_length=100, blank=True, default='')
+    doctors = models.IntegerField(default=0)
+    workplaces = models.IntegerField(default=0)
+    patients = models.IntegerField(default=0)
+    consultations = models.IntegerField(default=0)
+    referrals = models.IntegerField(default=0)
+    procedures = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id'], name='unique_stats_counter'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'label'], name='stats_scope_label_idx'),
+        ]
+
+    def __str__(self):
+        return f"Statistiques {self.scope} {self.object_id}"
+
+# --- Modèle AttachmentBlob ---
+class AttachmentBlobManager(models.Manager):
+    def register(self, digest, size):
+        """Déclare un blob qui vient d'être écrit (ou réécrit) ; repousse son ramassage."""
+        self.update_or_create(digest=digest, defaults={'size': size})
+
+    def _adjust(self, names, delta):
+        for name in names:
+            digest = digest_of(name)
+            if digest and not self.filter(pk=digest).update(ref_count=models.F('ref_count') + delta, updated_at=timezone.now()):
+                self.create(digest=digest, ref_count=max(delta, 0))
+
+    def retain(self, *names):
+        """Ajoute une référence aux blobs désignés par ces noms de fichier (les noms classiques sont ignorés)."""
+        self._adjust(names, 1)
+
+    def release(self, *names):
+        """Retire une référence aux blobs désignés par ces noms de fichier."""
+        self._adjust(names, -1)
+
+
+class AttachmentBlob(models.Model):
+    """
+    Fichier de pièce jointe stocké une seule fois sous son empreinte SHA-256 (voir storage.py),
+    avec le nombre de consultations, actes et référencements qui y font référence.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    # Dérivés image produits à côté du blob ('thumb', 'preview' : voir thumbnails.py)
+    derivatives = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AttachmentBlobManager()
+
+    class Meta:
+        indexes = [
+            # gc_attachments : blobs sans référence
+            models.Index(fields=['ref_count', 'updated_at'], name='blob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count} référence(s))"
+
 # --- Modèle Appointment ---
 class Appointment(models.Model):
     patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='appointments')
@@ -100,6 +291,17 @@ class Appointment(models.Model):
     appointment_date = models.DateTimeField()
     reason_for_appointment = models.TextField()
     status = models.CharField(max_length=50, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # AppointmentViewSet : filtre par médecin, tri chronologique
+            models.Index(fields=['doctor', 'appointment_date'], name='appt_doctor_date_idx'),
+            # Statistiques de clinique avec fenêtre de dates
+            models.Index(fields=['workplace', 'appointment_date'], name='appt_workplace_date_idx'),
+            # SyncView : rendez-vous du médecin modifiés depuis le curseur
+            models.Index(fields=['doctor', 'updated_at'], name='appt_doctor_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Rendez-vous de {self.patient.first_name} avec Dr. {self.doctor.user.first_name}"
@@ -113,12 +315,21 @@ class Consultation(models.Model):
     medical_report = models.TextField(blank=True, null=True)
     diagnosis = models.TextField(blank=True, null=True)
     medications = models.TextField(blank=True, null=True)
-    attachments = models.FileField(upload_to='consultation_attachments/', blank=True, null=True)
+    attachments = models.FileField(upload_to='consultation_attachments/', storage=select_attachment_storage, max_length=255, blank=True, null=True)
     weight = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     height = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     sp2 = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     temperature = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
     blood_pressure = models.CharField(max_length=20, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ConsultationViewSet : filtre par médecin, tri par date décroissante
+            models.Index(fields=['doctor', '-consultation_date'], name='consult_doctor_date_idx'),
+            # SyncView : modifications depuis le curseur
+            models.Index(fields=['updated_at'], name='consult_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Consultation de {self.patient.first_name} {self.patient.last_name} le {self.consultation_date.strftime('%Y-%m-%d')}"
@@ -129,8 +340,16 @@ class MedicalProcedure(models.Model):
     procedure_type = models.CharField(max_length=200)
     procedure_date = models.DateField()
     result = models.TextField(blank=True, null=True)
-    attachments = models.FileField(upload_to='procedure_attachments/', blank=True, null=True)
+    attachments = models.FileField(upload_to='procedure_attachments/', storage=select_attachment_storage, max_length=255, blank=True, null=True)
     operator = models.ForeignKey('Doctor', on_delete=models.SET_NULL, null=True, blank=True, related_name='operated_procedures')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # MedicalProcedureViewSet : filtre par opérateur, tri par date décroissante
+            models.Index(fields=['operator', '-procedure_date'], name='procedure_operator_date_idx'),
+            models.Index(fields=['updated_at'], name='procedure_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Acte médical pour {self.patient.first_name} {self.patient.last_name}: {self.procedure_type}"
@@ -142,9 +361,18 @@ class Referral(models.Model):
     referred_by = models.ForeignKey('Doctor', on_delete=models.SET_NULL, null=True, blank=True, related_name='referred_by_me', help_text="Médecin qui a effectué le référencement")
     specialty_requested = models.CharField(max_length=100)
     reason_for_referral = models.TextField()
-    attached_documents = models.FileField(upload_to='referral_documents/', blank=True, null=True)
+    attached_documents = models.FileField(upload_to='referral_documents/', storage=select_attachment_storage, max_length=255, blank=True, null=True)
     date_of_referral = models.DateTimeField(auto_now_add=True)
     comments = models.TextField(blank=True, null=True) # <-- AJOUTÉ
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ReferralViewSet : références faites OU reçues, tri par date décroissante
+            models.Index(fields=['referred_by', '-date_of_referral'], name='referral_by_date_idx'),
+            models.Index(fields=['referred_to', '-date_of_referral'], name='referral_to_date_idx'),
+            models.Index(fields=['updated_at'], name='referral_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Référencement pour {self.patient.first_name} {self.patient.last_name} à Dr. {self.referred_to.user.first_name}"
@@ -156,6 +384,12 @@ class ForumPost(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # ForumPostViewSet : tri par date décroissante
+            models.Index(fields=['-created_at'], name='forumpost_created_idx'),
+        ]
+
     def __str__(self):
         return f"Post de {self.author.user.username}: {self.title}"
 
@@ -171,6 +405,12 @@ class DeletedAppointment(models.Model):
     deletion_comment = models.TextField(blank=True, null=True)
     deletion_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # DeletedAppointmentsListView : tri par date de suppression décroissante
+            models.Index(fields=['-deletion_date'], name='deleted_appt_date_idx'),
+        ]
+
     def __str__(self):
         return f"Deleted Appointment for {self.patient.unique_id if self.patient else 'N/A'} on {self.appointment_date.strftime('%Y-%m-%d %H:%M')}"
 
@@ -182,6 +422,14 @@ class ForumComment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_private = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Commentaires d'un post (imbriqués dans ForumPostSerializer) en ordre chronologique
+            models.Index(fields=['post', 'created_at'], name='forumcomment_post_created_idx'),
+            # ForumCommentViewSet : tri chronologique global
+            models.Index(fields=['created_at'], name='forumcomment_created_idx'),
+        ]
+
     def __str__(self):
         return f"Commentaire de {self.author.user.username} sur '{self.post.title}'"
 
@@ -192,6 +440,123 @@ class Note(models.Model):
     title = models.CharField(max_length=200, default='Sans titre')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # NoteViewSet : notes de l'auteur, tri par date décroissante
+            models.Index(fields=['author', '-created_at'], name='note_author_created_idx'),
+            models.Index(fields=['author', 'updated_at'], name='note_author_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Note de {self.author.user.first_name}"
+
+# --- Modèle Job ---
+class Job(models.Model):
+    """
+    Travail de fond (export, import, statistiques, miniatures) exécuté hors des requêtes
+    par la commande `runworker`. La table sert de file d'attente : pas de broker.
+    """
+    KIND_EXPORT_PDF = 'export_pdf'
+    KIND_IMPORT_PATIENTS = 'import_patients'
+    KIND_REBUILD_STATS = 'rebuild_stats'
+    KIND_THUMBNAILS = 'thumbnails'
+    KIND_CHOICES = [
+        (KIND_EXPORT_PDF, 'Export PDF du dossier patient'),
+        (KIND_IMPORT_PATIENTS, 'Import de patients'),
+        (KIND_REBUILD_STATS, 'Recalcul des statistiques'),
+        (KIND_THUMBNAILS, 'Miniatures des pièces jointes'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_SUCCEEDED, 'Terminé'),
+        (STATUS_FAILED, 'Échec'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.CharField(max_length=500, blank=True, default='') # Chemin du fichier produit
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Dernier signe de vie du worker (bail)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # runworker : prochain travail en attente
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+            # JobViewSet : travaux de l'utilisateur, du plus récent au plus ancien
+            models.Index(fields=['created_by', '-id'], name='job_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"Travail {self.pk} ({self.kind}, {self.status})"
+
+# --- Modèle SearchDocument ---
+class SearchDocument(models.Model):
+    """
+    Texte indexé pour la recherche plein texte (voir search.py) : une ligne par champ non vide
+    des consultations, notes et antécédents des patients. La table virtuelle FTS5
+    `auth_app_search` l'indexe (contenu externe) et des triggers SQLite la tiennent à jour.
+    """
+    KIND_CONSULTATION = 'consultation'
+    KIND_NOTE = 'note'
+    KIND_PATIENT = 'patient'
+
+    kind = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=36) # Clé primaire de l'objet indexé (entier ou UUID)
+    field = models.CharField(max_length=30)
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Auteur, pour les notes : elles ne sont visibles que par lui
+    author = models.ForeignKey('Doctor', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    body = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'field'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} ({self.field})"
+
+# --- Modèle Tombstone ---
+class Tombstone(models.Model):
+    """
+    Trace d'une suppression, pour la synchronisation différentielle des clients (SyncView).
+    `doctor` : médecin concerné (notes, rendez-vous, patient qui n'est plus visible par lui) ;
+    sinon, la suppression concerne tous les médecins qui voient `patient`.
+    """
+    KIND_PATIENT = 'patient'
+    KIND_CONSULTATION = 'consultation'
+    KIND_PROCEDURE = 'procedure'
+    KIND_REFERRAL = 'referral'
+    KIND_APPOINTMENT = 'appointment'
+    KIND_NOTE = 'note'
+
+    kind = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=36)
+    # Sans contrainte : le patient a pu être supprimé depuis
+    patient = models.ForeignKey('Patient', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
 
     def __str__(self):
-        return f"Note de {self.author.user.first_name}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id} supprimé le {self.deleted_at}"
@@ -0,0 +1,61 @@
+"""
+Rendu et lecture JSON rapides (orjson), sélectionnés dans REST_FRAMEWORK (settings.py).
+
+orjson encode nativement les dict, listes, chaînes, nombres et UUID en une seule passe en C ;
+les autres types (dates, Decimal, chaînes paresseuses...) sont confiés à l'encodeur de DRF,
+si bien que le JSON produit est celui de JSONRenderer, à deux différences près :
+- un flottant à exposant s'écrit 1e16 / 1e-7 au lieu de 1e+16 / 1e-07 (même valeur une fois lu) ;
+- NaN et ±Infinity (flottants ou Decimal) deviennent null, là où JSONRenderer lève ValueError
+  avec STRICT_JSON = True (défaut). Détecter ces valeurs imposerait un parcours Python complet
+  des données, ce que le rendu orjson évite ; un null vaut mieux qu'une erreur 500.
+Avec STRICT_JSON = False (jetons NaN / Infinity), sans le paquet orjson, ou pour une sortie
+indentée (API navigable, ?indent=), ces classes se comportent exactement comme celles de DRF.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle : repli sur le module json
+    orjson = None
+
+if orjson is not None:
+    # Dates confiées à l'encodeur de DRF (format « Z », millisecondes) comme le reste des types inconnus
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Valeur hors des limites d'orjson (entier de plus de 64 bits...)
+            return super().render(data, accepted_media_type, renderer_context)
+        # Comme JSONRenderer : U+2028 et U+2029 échappés (JSON valide en JavaScript)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            content = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                content = content.decode(encoding)
+            return orjson.loads(content)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,138 @@
+"""
+Recherche plein texte dans les consultations, les notes et les antécédents des patients.
+
+Le texte de chaque champ est recopié dans SearchDocument par les signaux (signals.py) ;
+la table virtuelle SQLite FTS5 `auth_app_search` l'indexe en « contenu externe » et des
+triggers la synchronisent à chaque écriture (migration 0024). Les accents sont ignorés
+(« hépatite » trouve « hepatite ») et le dernier mot est cherché comme préfixe.
+Les résultats sont classés par bm25 et limités aux patients visibles par le médecin.
+"""
+import html
+import re
+
+from django.db import connection
+
+from .models import Consultation, Note, Patient, SearchDocument
+
+# Modèle -> (type de document, champs indexés)
+SOURCES = {
+    Consultation: (SearchDocument.KIND_CONSULTATION, ('diagnosis', 'medications', 'medical_report')),
+    Note: (SearchDocument.KIND_NOTE, ('content',)),
+    Patient: (SearchDocument.KIND_PATIENT, ('medical_history',)),
+}
+
+# Délimiteurs du passage trouvé dans les extraits : caractères de contrôle remplacés par <mark>
+# une fois le texte échappé (le contenu clinique n'est jamais interprété comme du HTML)
+_OPEN, _CLOSE = '\x02', '\x03'
+
+SNIPPET_TOKENS = 16
+
+TOKEN_RE = re.compile(r'\w+')
+
+SEARCH_SQL = f"""
+    SELECT d.kind, d.object_id, d.field, d.patient_id,
+           snippet(auth_app_search, 0, char(2), char(3), '…', {SNIPPET_TOKENS}),
+           bm25(auth_app_search) AS score
+    FROM auth_app_search
+    JOIN auth_app_searchdocument d ON d.id = auth_app_search.rowid
+    WHERE auth_app_search MATCH %s
+      AND (
+        (d.kind = 'note' AND d.author_id = %s)
+        OR (d.kind != 'note' AND d.patient_id IN (
+            SELECT patient_id FROM auth_app_patientvisibility WHERE doctor_id = %s
+        ))
+      )
+    ORDER BY score
+    LIMIT %s OFFSET %s
+"""
+
+
+def _object_id(instance):
+    # Même représentation que la colonne en base (UUID sans tirets pour Patient)
+    return instance.pk.hex if isinstance(instance, Patient) else str(instance.pk)
+
+
+def _documents(kind, fields, instance):
+    patient_id = instance.pk if isinstance(instance, Patient) else instance.patient_id
+    author_id = instance.author_id if isinstance(instance, Note) else None
+    return [
+        SearchDocument(
+            kind=kind, object_id=_object_id(instance), field=field,
+            patient_id=patient_id, author_id=author_id, body=getattr(instance, field),
+        )
+        for field in fields
+        if getattr(instance, field)
+    ]
+
+
+def index(model, instances):
+    """(Ré)indexe les objets donnés, tous du modèle `model`."""
+    kind, fields = SOURCES[model]
+    unindex(model, instances)
+    documents = [document for instance in instances for document in _documents(kind, fields, instance)]
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+def unindex(model, instances):
+    kind, _ = SOURCES[model]
+    SearchDocument.objects.filter(kind=kind, object_id__in=[_object_id(instance) for instance in instances]).delete()
+
+
+def rebuild(chunk_size=1000):
+    """Reconstruit tout l'index ; retourne le nombre de documents indexés."""
+    SearchDocument.objects.all().delete()
+    for model, (kind, fields) in SOURCES.items():
+        batch = []
+        for instance in model.objects.iterator(chunk_size=chunk_size):
+            batch.extend(_documents(kind, fields, instance))
+            if len(batch) >= chunk_size:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        # Compactage des segments FTS5 après une réécriture complète
+        cursor.execute("INSERT INTO auth_app_search(auth_app_search) VALUES ('optimize')")
+    return SearchDocument.objects.count()
+
+
+def match_expression(query):
+    """
+    Requête FTS5 sûre à partir de la saisie libre : chaque mot entre guillemets (la syntaxe
+    FTS5 de l'utilisateur est ignorée), tous requis, le dernier cherché comme préfixe.
+    None si la saisie ne contient aucun mot.
+    """
+    tokens = TOKEN_RE.findall(query or '')
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def search(doctor, query, limit=20, offset=0):
+    """
+    Documents correspondant à `query` visibles par `doctor`, du plus au moins pertinent :
+    liste de dicts (kind, id, field, patient_id, snippet, score).
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [expression, doctor.pk, doctor.pk, limit, offset])
+        rows = cursor.fetchall()
+    patient_field = Patient._meta.pk
+    return [
+        {
+            'kind': kind,
+            'id': int(object_id) if kind != SearchDocument.KIND_PATIENT else patient_field.to_python(object_id),
+            'field': field,
+            'patient_id': patient_field.to_python(patient_id) if patient_id else None,
+            'snippet': _highlight(snippet),
+            'score': round(-score, 4),
+        }
+        for kind, object_id, field, patient_id, snippet, score in rows
+    ]
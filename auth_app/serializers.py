@@ -1,26 +1,99 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
 from django.db import transaction # Import requis pour gérer la transaction atomique
+from django.db.models import Prefetch, QuerySet
+from django.db.models.manager import BaseManager
+from django.urls import reverse
+from django.utils import timezone
+from .thumbnails import recorded_derivatives, with_derivatives
 from .models import (
     Patient, Doctor, Appointment, Consultation, MedicalProcedure,
     Referral, ForumPost, ForumComment, Workplace, DeletedAppointment, Note,
-    RegistrationCode # NOUVEL IMPORT
+    RegistrationCode, # NOUVEL IMPORT
+    Job
 )
 from datetime import date
 
+# --- Sélection des champs : ?fields= / ?expand= ---
+
+def _query_list(request, name):
+    """Valeurs du paramètre `name` (« a,b,c »), None s'il est absent de la requête."""
+    if request is None or name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+class SparseFieldsMixin:
+    """
+    Champs rendus choisis par le client, pour les lectures (GET, HEAD) du sérialiseur racine :
+    - ?fields=unique_id,first_name : seuls ces champs ;
+    - ?expand=patient_details : parmi les objets imbriqués (Meta.expandable), seuls ceux-là ;
+      ?expand= vide n'en rend aucun. Sans paramètre, la réponse est complète, comme avant.
+    Meta.eager_loading associe un champ aux relations à charger pour le rendre
+    ((select_related...), (prefetch_related...)) : setup_eager_loading() ne charge que
+    celles des champs effectivement rendus. Un contexte {'sparse_fields': False} rend
+    toujours tous les champs (format fixe, comme la synchronisation).
+    """
+
+    @classmethod
+    def requested_fields(cls, request, names):
+        """Sous-ensemble des champs `names` à rendre pour `request`."""
+        names = set(names)
+        if request is None or request.method not in SAFE_METHODS:
+            return names
+        fields = _query_list(request, 'fields')
+        expand = _query_list(request, 'expand')
+        if fields:
+            names &= fields | (expand or set())
+        if expand is not None:
+            names -= set(getattr(cls.Meta, 'expandable', ())) - expand
+        return names
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        """
+        Précharge les relations des champs rendus pour `request` (toutes sans requête), et les
+        dérivés des pièces jointes dont une URL d'aperçu est rendue (AttachmentURLField).
+        """
+        eager_loading = getattr(cls.Meta, 'eager_loading', {})
+        for name in cls.requested_fields(request, eager_loading):
+            select, prefetch = eager_loading[name]
+            if select:
+                queryset = queryset.select_related(*select)
+            if prefetch:
+                queryset = queryset.prefetch_related(*prefetch)
+        variants = {
+            name: field for name, field in cls._declared_fields.items()
+            if isinstance(field, AttachmentURLField) and field.variant
+        }
+        for file_field in {variants[name].file_field for name in cls.requested_fields(request, variants)}:
+            queryset = with_derivatives(queryset, file_field)
+        return queryset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Seul le sérialiseur de la réponse est concerné, pas ceux qu'il imbrique
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None or not self.context.get('sparse_fields', True):
+            return fields
+        keep = self.requested_fields(self.context.get('request'), fields)
+        return {name: field for name, field in fields.items() if name in keep}
+
 # --- Sérialiseurs de base ---
 
 class UserLoginSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(required=True, write_only=True)
 
-class WorkplaceSerializer(serializers.ModelSerializer):
+class WorkplaceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator_details = serializers.SerializerMethodField(read_only=True)
     
     class Meta:
         model = Workplace
         fields = ['id', 'name', 'address', 'is_public', 'creator', 'creator_details']
         read_only_fields = ['creator']
+        eager_loading = {'creator_details': (('creator__user',), ())}
         
     def get_creator_details(self, obj):
         # Évite les erreurs de circularité si un Doctor est sérialisé avec ses workplaces
@@ -34,7 +107,7 @@ class WorkplaceSerializer(serializers.ModelSerializer):
 
 # --- Sérialiseurs Doctor ---
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
     
@@ -42,8 +115,14 @@ class DoctorSerializer(serializers.ModelSerializer):
         model = Doctor
         fields = ['id', 'full_name', 'email', 'specialty', 'license_number', 'phone_number', 'address', 'workplaces']
         depth = 1 # Pour inclure les détails des workplaces
+        expandable = ('workplaces',)
+        eager_loading = {
+            'full_name': (('user',), ()),
+            'email': (('user',), ()),
+            'workplaces': ((), ('workplaces',)),
+        }
 
-class DoctorRetrieveSerializer(serializers.ModelSerializer):
+class DoctorRetrieveSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
     workplaces = WorkplaceSerializer(many=True, read_only=True)
@@ -51,8 +130,9 @@ class DoctorRetrieveSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
         fields = ['id', 'full_name', 'email', 'specialty', 'license_number', 'phone_number', 'address', 'workplaces']
+        expandable = ('workplaces',)
 
-class DoctorUpdateSerializer(serializers.ModelSerializer):
+class DoctorUpdateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     first_name = serializers.CharField(source='user.first_name', required=False)
     last_name = serializers.CharField(source='user.last_name', required=False)
     email = serializers.EmailField(source='user.email', required=False)
@@ -88,7 +168,7 @@ class DoctorUpdateSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class DoctorRegistrationSerializer(serializers.ModelSerializer):
+class DoctorRegistrationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     email = serializers.EmailField(write_only=True)
     password = serializers.CharField(write_only=True)
     first_name = serializers.CharField(write_only=True, required=True)
@@ -169,49 +249,188 @@ class DoctorRegistrationSerializer(serializers.ModelSerializer):
         
         return doctor
 
+# --- Listes en lecture seule : rendu direct des lignes ---
+
+def age_from_birth(date_of_birth):
+    if date_of_birth:
+        today = date.today()
+        return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+    return None
+
+def _date_representation(value):
+    return value.isoformat()
+
+def _datetime_representation(value):
+    # Comme serializers.DateTimeField : fuseau courant, « Z » pour UTC
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+def _decimal_representation(value):
+    # Valeurs déjà arrondies à decimal_places par la base
+    return f'{value:f}' if api_settings.COERCE_DECIMAL_TO_STRING else value
+
+class RowListSerializer(serializers.ListSerializer):
+    """
+    Liste rendue sans objets Field, pour les sérialiseurs en lecture seule à champs simples :
+    Meta.row_fields associe chaque champ à sa colonne et à sa conversion (None : valeur telle
+    quelle). Un queryset non évalué est lu par .values(), sans instancier les modèles ; une
+    liste d'instances (page paginée, relation préchargée) est lue attribut par attribut.
+    Le JSON produit est identique à celui du sérialiseur champ par champ.
+    """
+
+    def to_representation(self, data):
+        row_fields = self.child.Meta.row_fields
+        plan = [(name, *row_fields[name]) for name in self.child.fields]
+        columns = list(dict.fromkeys(column for _, column, _ in plan))
+        if isinstance(data, BaseManager):
+            data = data.all()
+        if isinstance(data, QuerySet) and data._result_cache is None and not data._prefetch_related_lookups:
+            rows = data.values(*columns)
+        else:
+            rows = ({column: getattr(instance, column) for column in columns} for instance in data)
+        return [
+            {
+                name: row[column] if convert is None or row[column] is None else convert(row[column])
+                for name, column, convert in plan
+            }
+            for row in rows
+        ]
+
 # --- Sérialiseurs Patient ---
 
-class PatientListSerializer(serializers.ModelSerializer):
+class PatientListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     age = serializers.SerializerMethodField()
 
     class Meta:
         model = Patient
         fields = ['unique_id', 'first_name', 'last_name', 'date_of_birth', 'age']
+        list_serializer_class = RowListSerializer
+        row_fields = {
+            'unique_id': ('unique_id', str),
+            'first_name': ('first_name', None),
+            'last_name': ('last_name', None),
+            'date_of_birth': ('date_of_birth', _date_representation),
+            'age': ('date_of_birth', age_from_birth),
+        }
         
     def get_age(self, obj):
-        if obj.date_of_birth:
-            today = date.today()
-            age = today.year - obj.date_of_birth.year - ((today.month, today.day) < (obj.date_of_birth.month, obj.date_of_birth.day))
-            return age
-        return None
-
-class SimpleConsultationSerializer(serializers.ModelSerializer):
+        return age_from_birth(obj.date_of_birth)
+
+def _attachment_url(context, kind, pk, variant=None):
+    if variant:
+        url = reverse('attachment-derivative', args=[kind, pk, variant])
+    else:
+        url = reverse('attachment-download', args=[kind, pk])
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request else url
+
+class AttachmentFileField(serializers.FileField):
+    """
+    Pièce jointe envoyée comme avec un FileField, mais rendue par son URL de téléchargement
+    authentifié (/attachments/<kind>/<id>/) : l'URL sous MEDIA_URL désignerait le blob brut.
+    """
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        kwargs.setdefault('max_length', 255)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return _attachment_url(self.context, self.kind, value.instance.pk)
+
+class AttachmentURLField(serializers.ReadOnlyField):
+    """
+    URL de téléchargement authentifié (/attachments/<kind>/<id>/) du fichier `file_field`,
+    ou None si aucun fichier n'est joint. Avec `variant` ('thumb', 'preview') : URL du dérivé
+    image (/attachments/<kind>/<id>/<variant>/), None tant qu'il n'a pas été produit. Les
+    dérivés sont lus sur l'annotation de with_derivatives() (setup_eager_loading), sinon
+    sur le blob, une fois par objet.
+    """
+
+    def __init__(self, kind, file_field, variant=None, **kwargs):
+        self.kind = kind
+        self.file_field = file_field
+        self.variant = variant
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        name = getattr(obj, self.file_field).name
+        if not name:
+            return None
+        if self.variant and self.variant not in self.derivatives(obj, name):
+            return None
+        return _attachment_url(self.context, self.kind, obj.pk, self.variant)
+
+    def derivatives(self, obj, name):
+        attribute = f'{self.file_field}_derivatives'
+        derivatives = getattr(obj, attribute, None)
+        if derivatives is None:
+            derivatives = recorded_derivatives(name)
+            setattr(obj, attribute, derivatives)
+        return derivatives
+
+class SimpleConsultationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Consultation
         fields = ['id', 'consultation_date', 'reason_for_consultation', 'medical_report', 'diagnosis', 'medications', 'weight', 'height', 'sp2', 'temperature', 'blood_pressure']
+        list_serializer_class = RowListSerializer
+        row_fields = {
+            'id': ('id', None),
+            'consultation_date': ('consultation_date', _datetime_representation),
+            'reason_for_consultation': ('reason_for_consultation', None),
+            'medical_report': ('medical_report', None),
+            'diagnosis': ('diagnosis', None),
+            'medications': ('medications', None),
+            'weight': ('weight', _decimal_representation),
+            'height': ('height', _decimal_representation),
+            'sp2': ('sp2', _decimal_representation),
+            'temperature': ('temperature', _decimal_representation),
+            'blood_pressure': ('blood_pressure', None),
+        }
+
+class MedicalProcedureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    attachments = AttachmentFileField('procedure')
+    attachments_url = AttachmentURLField('procedure', 'attachments')
+    attachments_thumbnail_url = AttachmentURLField('procedure', 'attachments', 'thumb')
+    attachments_preview_url = AttachmentURLField('procedure', 'attachments', 'preview')
 
-class MedicalProcedureSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalProcedure
         fields = '__all__'
         read_only_fields = ('operator',)
 
-class ReferralSerializer(serializers.ModelSerializer):
+class ReferralSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     referred_to_details = DoctorSerializer(source='referred_to', read_only=True)
     referred_by_details = DoctorSerializer(source='referred_by', read_only=True)
     patient_details = PatientListSerializer(source='patient', read_only=True)
+    attached_documents = AttachmentFileField('referral')
+    attached_documents_url = AttachmentURLField('referral', 'attached_documents')
 
     class Meta:
         model = Referral
         fields = [
             'id', 'patient', 'referred_to', 'referred_by',
-            'specialty_requested', 'reason_for_referral', 'attached_documents',
+            'specialty_requested', 'reason_for_referral', 'attached_documents', 'attached_documents_url',
             'date_of_referral', 'comments', 
             'referred_to_details', 'referred_by_details', 'patient_details'
         ]
         read_only_fields = ('referred_by', 'date_of_referral', 'referred_to_details', 'referred_by_details', 'patient_details')
+        expandable = ('referred_to_details', 'referred_by_details', 'patient_details')
+        # Médecins imbriqués : user + workplaces
+        eager_loading = {
+            'referred_to_details': (('referred_to__user',), ('referred_to__workplaces',)),
+            'referred_by_details': (('referred_by__user',), ('referred_by__workplaces',)),
+            'patient_details': (('patient',), ()),
+        }
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     consultations = SimpleConsultationSerializer(many=True, read_only=True)
     medical_procedures = MedicalProcedureSerializer(many=True, read_only=True)
     referrals = ReferralSerializer(many=True, read_only=True)
@@ -219,19 +438,23 @@ class PatientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Patient
-        fields = '__all__'
+        exclude = ('search_name', 'search_name_reversed')
         read_only_fields = ('unique_id', 'age')
+        expandable = ('consultations', 'medical_procedures', 'referrals')
+        # Un préchargement par relation rendue : nombre de requêtes constant quel que soit le nombre de lignes
+        eager_loading = {
+            'consultations': ((), ('consultations',)),
+            'medical_procedures': ((), (Prefetch('medical_procedures', queryset=MedicalProcedureSerializer.setup_eager_loading(MedicalProcedure.objects.all())),)),
+            'referrals': ((), (Prefetch('referrals', queryset=ReferralSerializer.setup_eager_loading(Referral.objects.all())),)),
+            'assigned_doctors': ((), ('assigned_doctors',)),
+        }
         
     def get_age(self, obj):
-        if obj.date_of_birth:
-            today = date.today()
-            age = today.year - obj.date_of_birth.year - ((today.month, today.day) < (obj.date_of_birth.month, obj.date_of_birth.day))
-            return age
-        return None
+        return age_from_birth(obj.date_of_birth)
 
 # --- Autres sérialiseurs ---
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient_details = PatientListSerializer(source='patient', read_only=True)
     workplace_details = WorkplaceSerializer(source='workplace', read_only=True)
     
@@ -239,14 +462,24 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = ['id', 'patient', 'patient_details', 'doctor', 'workplace', 'workplace_details', 'appointment_date', 'reason_for_appointment', 'status']
         read_only_fields = ('doctor', 'status', 'patient_details', 'workplace_details',)
+        expandable = ('patient_details', 'workplace_details')
+        eager_loading = {
+            'patient_details': (('patient',), ()),
+            'workplace_details': (('workplace__creator__user',), ()),
+        }
+
+class ConsultationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    attachments = AttachmentFileField('consultation')
+    attachments_url = AttachmentURLField('consultation', 'attachments')
+    attachments_thumbnail_url = AttachmentURLField('consultation', 'attachments', 'thumb')
+    attachments_preview_url = AttachmentURLField('consultation', 'attachments', 'preview')
 
-class ConsultationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Consultation
         fields = '__all__'
         read_only_fields = ('doctor', 'consultation_date',)
 
-class ForumCommentSerializer(serializers.ModelSerializer):
+class ForumCommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.user.first_name', read_only=True)
     author_specialty = serializers.CharField(source='author.specialty', read_only=True)
 
@@ -254,24 +487,46 @@ class ForumCommentSerializer(serializers.ModelSerializer):
         model = ForumComment
         fields = ['id', 'post', 'author', 'author_name', 'author_specialty', 'content', 'created_at', 'is_private']
         read_only_fields = ['author']
+        eager_loading = {
+            'author_name': (('author__user',), ()),
+            'author_specialty': (('author',), ()),
+        }
+
+class ForumPostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Nombre de derniers commentaires embarqués ; le fil complet est servi par /forum/posts/{id}/comments/
+    LATEST_COMMENTS = 3
 
-class ForumPostSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.user.first_name', read_only=True)
     author_specialty = serializers.CharField(source='author.specialty', read_only=True)
-    comments = ForumCommentSerializer(many=True, read_only=True)
+    comments_count = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
 
     class Meta:
         model = ForumPost
-        fields = ['id', 'author', 'author_name', 'author_specialty', 'title', 'content', 'created_at', 'comments']
+        fields = ['id', 'author', 'author_name', 'author_specialty', 'title', 'content', 'created_at', 'comments_count', 'comments']
         read_only_fields = ['author']
-
-class NoteSerializer(serializers.ModelSerializer):
+        # Derniers commentaires et compteur : préchargés par ForumPostViewSet
+        expandable = ('comments',)
+
+    def get_comments_count(self, obj):
+        # Annoté par ForumPostViewSet ; calculé à la demande pour un post qui vient d'être créé
+        if hasattr(obj, 'comments_count'):
+            return obj.comments_count
+        return obj.comments.count()
+
+    def get_comments(self, obj):
+        latest = getattr(obj, 'latest_comments', None)
+        if latest is None:
+            latest = reversed(obj.comments.select_related('author__user').order_by('-created_at', '-pk')[:self.LATEST_COMMENTS])
+        return ForumCommentSerializer(latest, many=True, context=self.context).data
+
+class NoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Note
-        fields = ['id', 'title', 'content', 'created_at', 'patient', 'author']
-        read_only_fields = ('author', 'created_at')
+        fields = ['id', 'title', 'content', 'created_at', 'updated_at', 'patient', 'author']
+        read_only_fields = ('author', 'created_at', 'updated_at')
 
-class DeletedAppointmentSerializer(serializers.ModelSerializer):
+class DeletedAppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient_details = PatientListSerializer(source='patient', read_only=True)
     doctor_details = DoctorRetrieveSerializer(source='doctor', read_only=True)
     workplace_details = WorkplaceSerializer(source='workplace', read_only=True)
@@ -280,6 +535,13 @@ class DeletedAppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeletedAppointment
         fields = ['id', 'patient_details', 'doctor_details', 'workplace_details', 'appointment_date', 'reason_for_appointment', 'deletion_date', 'deletion_reason', 'deletion_comment', 'deleted_by_name']
+        expandable = ('patient_details', 'doctor_details', 'workplace_details')
+        eager_loading = {
+            'patient_details': (('patient',), ()),
+            'doctor_details': (('doctor__user',), ('doctor__workplaces__creator__user',)),
+            'workplace_details': (('workplace__creator__user',), ()),
+            'deleted_by_name': (('deleted_by',), ()),
+        }
 
 # ----------------------------------------------------------------------
 # NOUVEAU SERIALIZEUR POUR LES STATISTIQUES GLOBALES
@@ -298,4 +560,41 @@ class GlobalStatsSerializer(serializers.Serializer):
     stats_by_workplace = serializers.ListField(child=serializers.DictField(), read_only=True)
     
     # STATS PAR DOCTOR
-    stats_by_doctor = serializers.ListField(child=serializers.DictField(), read_only=True)
\ No newline at end of file
+    stats_by_doctor = serializers.ListField(child=serializers.DictField(), read_only=True)
+
+class JobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at', 'download_url']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != Job.STATUS_SUCCEEDED or not obj.result_file:
+            return None
+        url = reverse('job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+# --- Synchronisation différentielle (SyncView) : une ligne par objet, sans imbrication ---
+
+class PatientSyncSerializer(serializers.ModelSerializer):
+    """Patient sans historiques imbriqués : consultations, actes et référencements sont envoyés à part."""
+
+    class Meta:
+        model = Patient
+        exclude = ('search_name', 'search_name_reversed')
+
+class ReferralSyncSerializer(serializers.ModelSerializer):
+    attached_documents = AttachmentFileField('referral')
+    attached_documents_url = AttachmentURLField('referral', 'attached_documents')
+
+    class Meta:
+        model = Referral
+        fields = '__all__'
+
+class AppointmentSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Appointment
+        fields = '__all__'
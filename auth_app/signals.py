@@ -0,0 +1,604 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import F, QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import Signal, receiver
+
+from . import cache, search, stats
+from .authentication import invalidate_user
+from .thumbnails import is_image
+from .models import (
+    Patient, Doctor, Workplace, Appointment, Consultation, MedicalProcedure, Referral, PatientVisibility,
+    StatsCounter, AttachmentBlob, Job, Note, Tombstone
+)
+
+
+# Émis après un bulk_create, qui ne déclenche pas post_save : kwargs `instances` (objets créés)
+bulk_post_create = Signal()
+
+
+# --- Connexions SQLite ---
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Applique les PRAGMAS du profil de base de données (DATABASE_PROFILES) à chaque connexion."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS') or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def _remember_previous(sender, instance, fields):
+    """Mémorise les anciennes valeurs des clés étrangères (et pièces jointes) avant une mise à jour."""
+    instance._previous_values = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_values = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+def _changed(instance, field):
+    """Indique si le champ a changé lors de la dernière sauvegarde."""
+    previous = getattr(instance, '_previous_values', None)
+    return bool(previous) and previous[field] != getattr(instance, field)
+
+def _moved(instance, field, counter, count_workplaces=True):
+    """Transfère un compteur de l'ancien médecin vers le nouveau lors d'une mise à jour."""
+    if _changed(instance, field):
+        stats.adjust_activity(counter, instance._previous_values[field], -1, count_workplaces, count_global=False)
+        stats.adjust_activity(counter, getattr(instance, field), 1, count_workplaces, count_global=False)
+
+def _cascading_from(origin, *models):
+    """Vrai si la suppression est une cascade déclenchée par la suppression d'un des modèles donnés."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model in models
+
+
+# --- Consultation ---
+
+@receiver(pre_save, sender=Consultation)
+def consultation_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _remember_previous(sender, instance, ('doctor_id', 'patient_id', 'attachments'))
+
+@receiver(post_save, sender=Consultation)
+def consultation_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    PatientVisibility.objects.grant([(instance.doctor_id, instance.patient_id)])
+    if created:
+        stats.adjust_activity('consultations', instance.doctor_id, 1)
+        return
+    if _changed(instance, 'doctor_id') or _changed(instance, 'patient_id'):
+        previous = instance._previous_values
+        PatientVisibility.objects.refresh([(previous['doctor_id'], previous['patient_id'])])
+    _moved(instance, 'doctor_id', 'consultations')
+
+@receiver(post_delete, sender=Consultation)
+def consultation_post_delete(sender, instance, origin=None, **kwargs):
+    if not _cascading_from(origin, Patient, Doctor):
+        PatientVisibility.objects.refresh([(instance.doctor_id, instance.patient_id)])
+    stats.adjust_activity('consultations', instance.doctor_id, -1)
+
+
+# --- MedicalProcedure ---
+
+@receiver(pre_save, sender=MedicalProcedure)
+def procedure_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _remember_previous(sender, instance, ('operator_id', 'patient_id', 'attachments'))
+
+@receiver(post_save, sender=MedicalProcedure)
+def procedure_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.adjust_activity('procedures', instance.operator_id, 1)
+    else:
+        _moved(instance, 'operator_id', 'procedures')
+
+@receiver(post_delete, sender=MedicalProcedure)
+def procedure_post_delete(sender, instance, **kwargs):
+    stats.adjust_activity('procedures', instance.operator_id, -1)
+
+
+# --- Referral ---
+
+@receiver(pre_save, sender=Referral)
+def referral_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _remember_previous(sender, instance, ('referred_to_id', 'referred_by_id', 'patient_id', 'attached_documents'))
+
+@receiver(post_save, sender=Referral)
+def referral_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    PatientVisibility.objects.grant([(instance.referred_to_id, instance.patient_id)])
+    if created:
+        stats.adjust_activity('referrals', instance.referred_by_id, 1, count_workplaces=False)
+        return
+    if _changed(instance, 'referred_to_id') or _changed(instance, 'patient_id'):
+        previous = instance._previous_values
+        PatientVisibility.objects.refresh([(previous['referred_to_id'], previous['patient_id'])])
+    _moved(instance, 'referred_by_id', 'referrals', count_workplaces=False)
+
+@receiver(post_delete, sender=Referral)
+def referral_post_delete(sender, instance, origin=None, **kwargs):
+    if not _cascading_from(origin, Patient, Doctor):
+        PatientVisibility.objects.refresh([(instance.referred_to_id, instance.patient_id)])
+    stats.adjust_activity('referrals', instance.referred_by_id, -1, count_workplaces=False)
+
+
+# --- Patient et médecins assignés ---
+
+@receiver(pre_save, sender=Patient)
+def patient_pre_save(sender, instance, **kwargs):
+    instance.refresh_search_names()
+
+@receiver(post_save, sender=Patient)
+def patient_post_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], patients=1)
+
+@receiver(pre_delete, sender=Patient)
+def patient_pre_delete(sender, instance, **kwargs):
+    # Les liens d'assignation sont supprimés en cascade sans m2m_changed
+    instance._assigned_doctor_ids = list(instance.assigned_doctors.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Patient)
+def patient_post_delete(sender, instance, **kwargs):
+    doctor_ids = getattr(instance, '_assigned_doctor_ids', [])
+    stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], patients=-1)
+    stats.adjust(StatsCounter.SCOPE_DOCTOR, doctor_ids, patients=-1)
+    stats.refresh_workplaces(stats.workplaces_of(doctor_ids))
+
+def _assignment_pairs(instance, reverse, pk_set):
+    # reverse=False : instance est un Patient et pk_set des ids de Doctor (et inversement)
+    if reverse:
+        return [(instance.pk, patient_id) for patient_id in pk_set]
+    return [(doctor_id, instance.pk) for doctor_id in pk_set]
+
+@receiver(m2m_changed, sender=Patient.assigned_doctors.through)
+def assigned_doctors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_remove':
+        # pk_set contient les ids demandés, pas forcément liés : on ne garde que les liens existants
+        pairs = _assignment_pairs(instance, reverse, pk_set)
+        existing = sender.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in pairs},
+            patient_id__in={patient_id for _, patient_id in pairs},
+        ).values_list('doctor_id', 'patient_id')
+        instance._removed_pairs = set(existing) & set(pairs)
+        return
+    if action == 'pre_clear':
+        # pk_set n'est pas fourni pour clear() : on capture les liens avant leur suppression
+        if reverse:
+            instance._cleared_pks = set(sender.objects.filter(doctor_id=instance.pk).values_list('patient_id', flat=True))
+        else:
+            instance._cleared_pks = set(sender.objects.filter(patient_id=instance.pk).values_list('doctor_id', flat=True))
+        return
+
+    if action == 'post_add':
+        # Django ne signale que les liens réellement ajoutés
+        pairs = _assignment_pairs(instance, reverse, pk_set)
+    elif action == 'post_remove':
+        pairs = getattr(instance, '_removed_pairs', set())
+    elif action == 'post_clear':
+        pairs = _assignment_pairs(instance, reverse, getattr(instance, '_cleared_pks', set()))
+    else:
+        return
+    if not pairs:
+        return
+
+    doctor_ids = [doctor_id for doctor_id, _ in pairs]
+    if action == 'post_add':
+        PatientVisibility.objects.grant(pairs)
+        for doctor_id in doctor_ids:
+            stats.adjust(StatsCounter.SCOPE_DOCTOR, [doctor_id], patients=1)
+    elif action in ('post_remove', 'post_clear'):
+        PatientVisibility.objects.refresh(pairs)
+        for doctor_id in doctor_ids:
+            stats.adjust(StatsCounter.SCOPE_DOCTOR, [doctor_id], patients=-1)
+    stats.refresh_workplaces(stats.workplaces_of(doctor_ids))
+    # La liste des médecins assignés fait partie du dossier
+    _touch_patients(patient_id for _, patient_id in pairs)
+
+
+# --- Créations en masse (bulk_post_create) ---
+
+def _count_by(instances, field):
+    totals = {}
+    for instance in instances:
+        key = getattr(instance, field)
+        totals[key] = totals.get(key, 0) + 1
+    return totals
+
+@receiver(bulk_post_create, sender=Patient)
+def patients_bulk_created(sender, instances, **kwargs):
+    stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], patients=len(instances))
+    _invalidate()
+
+@receiver(bulk_post_create, sender=Consultation)
+def consultations_bulk_created(sender, instances, **kwargs):
+    PatientVisibility.objects.grant([(instance.doctor_id, instance.patient_id) for instance in instances])
+    totals = _count_by(instances, 'doctor_id')
+    for doctor_id, count in totals.items():
+        stats.adjust_activity('consultations', doctor_id, count)
+    _invalidate(totals)
+
+@receiver(bulk_post_create, sender=MedicalProcedure)
+def procedures_bulk_created(sender, instances, **kwargs):
+    totals = _count_by(instances, 'operator_id')
+    for doctor_id, count in totals.items():
+        stats.adjust_activity('procedures', doctor_id, count)
+    _invalidate(totals)
+
+@receiver(bulk_post_create, sender=Patient.assigned_doctors.through)
+def assignments_bulk_created(sender, instances, **kwargs):
+    PatientVisibility.objects.grant([(instance.doctor_id, instance.patient_id) for instance in instances])
+    totals = _count_by(instances, 'doctor_id')
+    for doctor_id, count in totals.items():
+        stats.adjust(StatsCounter.SCOPE_DOCTOR, [doctor_id], patients=count)
+    stats.refresh_workplaces(stats.workplaces_of(totals))
+    _touch_patients(instance.patient_id for instance in instances)
+    _invalidate(totals)
+
+
+# --- Médecins et cliniques ---
+
+@receiver(post_save, sender=Doctor)
+def doctor_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], doctors=1)
+    StatsCounter.objects.update_or_create(
+        scope=StatsCounter.SCOPE_DOCTOR, object_id=instance.pk,
+        defaults={'label': stats.doctor_label(instance), 'specialty': instance.specialty},
+    )
+
+@receiver(pre_delete, sender=Doctor)
+def doctor_pre_delete(sender, instance, **kwargs):
+    # Les liens avec les cliniques sont supprimés en cascade sans m2m_changed
+    instance._workplace_ids = list(instance.workplaces.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Doctor)
+def doctor_post_delete(sender, instance, **kwargs):
+    stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], doctors=-1)
+    StatsCounter.objects.filter(scope=StatsCounter.SCOPE_DOCTOR, object_id=instance.pk).delete()
+    stats.refresh_workplaces(getattr(instance, '_workplace_ids', []))
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    StatsCounter.objects.filter(
+        scope=StatsCounter.SCOPE_DOCTOR, object_id__in=Doctor.objects.filter(user=instance).values('pk')
+    ).update(label=f"{instance.first_name} {instance.last_name}")
+
+@receiver(m2m_changed, sender=Doctor.workplaces.through)
+def doctor_workplaces_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_pks = set(
+            sender.objects.filter(**{'workplace_id' if reverse else 'doctor_id': instance.pk})
+            .values_list('doctor_id' if reverse else 'workplace_id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            workplace_ids = [instance.pk]
+        elif action == 'post_clear':
+            workplace_ids = getattr(instance, '_cleared_pks', set())
+        else:
+            workplace_ids = pk_set
+        stats.refresh_workplaces(workplace_ids)
+
+@receiver(post_save, sender=Workplace)
+def workplace_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], workplaces=1)
+    StatsCounter.objects.update_or_create(
+        scope=StatsCounter.SCOPE_WORKPLACE, object_id=instance.pk, defaults={'label': instance.name},
+    )
+
+@receiver(post_delete, sender=Workplace)
+def workplace_post_delete(sender, instance, **kwargs):
+    stats.adjust(StatsCounter.SCOPE_GLOBAL, [stats.GLOBAL_ID], workplaces=-1)
+    StatsCounter.objects.filter(scope=StatsCounter.SCOPE_WORKPLACE, object_id=instance.pk).delete()
+
+
+# --- Date de dernière modification et version du dossier patient ---
+
+def _touch_patients(patient_ids):
+    Patient.objects.touch(patient_ids)
+
+@receiver(post_save, sender=Patient)
+def patient_version_changed(sender, instance, created, raw=False, **kwargs):
+    # updated_at est déjà écrit par la sauvegarde : seule la version reste à incrémenter
+    if not created and not raw:
+        Patient.objects.filter(pk=instance.pk).update(version=F('version') + 1)
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+@receiver(post_save, sender=MedicalProcedure)
+@receiver(post_delete, sender=MedicalProcedure)
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def patient_record_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _touch_patients([instance.patient_id, *_previous_ids(instance, 'patient_id')])
+
+@receiver(bulk_post_create, sender=Consultation)
+@receiver(bulk_post_create, sender=MedicalProcedure)
+def patient_records_bulk_changed(sender, instances, **kwargs):
+    _touch_patients(instance.patient_id for instance in instances)
+
+# Les référencements affichent le nom, la spécialité et les cliniques des médecins concernés
+
+@receiver(post_save, sender=Doctor)
+def referral_doctor_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Patient.objects.touch_referring([instance.pk])
+
+@receiver(pre_delete, sender=Doctor)
+def referral_doctor_pre_delete(sender, instance, **kwargs):
+    # referred_by est mis à NULL par une mise à jour SQL, sans signal
+    instance._referring_patient_ids = list(instance.referred_by_me.values_list('patient_id', flat=True))
+
+@receiver(post_delete, sender=Doctor)
+def referral_doctor_deleted(sender, instance, **kwargs):
+    _touch_patients(getattr(instance, '_referring_patient_ids', []))
+
+@receiver(post_save, sender=User)
+def referral_user_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Patient.objects.touch_referring(Doctor.objects.filter(user=instance).values_list('pk', flat=True))
+
+@receiver(m2m_changed, sender=Doctor.workplaces.through)
+def referral_workplaces_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            doctor_ids = [instance.pk]
+        elif action == 'post_clear':
+            # Relevés au pre_clear par doctor_workplaces_changed
+            doctor_ids = getattr(instance, '_cleared_pks', set())
+        else:
+            doctor_ids = pk_set
+        Patient.objects.touch_referring(doctor_ids)
+
+@receiver(post_save, sender=Workplace)
+def referral_workplace_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Patient.objects.touch_referring(instance.doctors.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Workplace)
+def referral_workplace_pre_delete(sender, instance, **kwargs):
+    # Les liens avec les médecins sont supprimés en cascade sans m2m_changed
+    instance._doctor_ids = list(instance.doctors.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Workplace)
+def referral_workplace_deleted(sender, instance, **kwargs):
+    Patient.objects.touch_referring(getattr(instance, '_doctor_ids', []))
+
+
+# --- Pièces jointes : références aux blobs (storage.py) ---
+
+ATTACHMENT_FIELDS = {
+    Consultation: 'attachments',
+    MedicalProcedure: 'attachments',
+    Referral: 'attached_documents',
+}
+
+def _queue_thumbnails(names):
+    """Miniatures et aperçus des nouvelles images, produits hors de la requête (voir thumbnails.py)."""
+    # Import local : jobs.py dépend d'imports.py, qui importe ce module
+    from .jobs import enqueue
+
+    images = sorted({name for name in names if is_image(name)})
+    if images:
+        enqueue(Job.KIND_THUMBNAILS, names=images)
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_save, sender=MedicalProcedure)
+@receiver(post_save, sender=Referral)
+def attachment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    field = ATTACHMENT_FIELDS[sender]
+    name = getattr(instance, field).name or ''
+    previous = '' if created else (getattr(instance, '_previous_values', None) or {}).get(field) or ''
+    if name != previous:
+        AttachmentBlob.objects.retain(name)
+        AttachmentBlob.objects.release(previous)
+        _queue_thumbnails([name])
+
+@receiver(post_delete, sender=Consultation)
+@receiver(post_delete, sender=MedicalProcedure)
+@receiver(post_delete, sender=Referral)
+def attachment_deleted(sender, instance, **kwargs):
+    AttachmentBlob.objects.release(getattr(instance, ATTACHMENT_FIELDS[sender]).name or '')
+
+@receiver(bulk_post_create, sender=Consultation)
+@receiver(bulk_post_create, sender=MedicalProcedure)
+def attachments_bulk_created(sender, instances, **kwargs):
+    field = ATTACHMENT_FIELDS[sender]
+    names = [getattr(instance, field).name or '' for instance in instances]
+    AttachmentBlob.objects.retain(*names)
+    _queue_thumbnails(names)
+
+
+# --- Index de recherche plein texte (search.py) ---
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=Patient)
+def search_document_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index(sender, [instance])
+
+@receiver(post_delete, sender=Consultation)
+@receiver(post_delete, sender=Note)
+def search_document_deleted(sender, instance, origin=None, **kwargs):
+    # Suppression d'un patient : ses documents partent avec lui (cascade sur SearchDocument.patient)
+    if not _cascading_from(origin, Patient):
+        search.unindex(sender, [instance])
+
+@receiver(bulk_post_create, sender=Consultation)
+@receiver(bulk_post_create, sender=Patient)
+def search_documents_bulk_created(sender, instances, **kwargs):
+    search.index(sender, instances)
+
+
+# --- Traces de suppression pour la synchronisation différentielle (sync.py) ---
+
+@receiver(post_delete, sender=PatientVisibility)
+def visibility_deleted(sender, instance, origin=None, **kwargs):
+    # Patient supprimé, ou qui n'est plus visible par ce médecin : son client doit l'oublier
+    if not _cascading_from(origin, Doctor):
+        Tombstone.objects.create(
+            kind=Tombstone.KIND_PATIENT, object_id=str(instance.patient_id),
+            patient_id=instance.patient_id, doctor_id=instance.doctor_id,
+        )
+
+RECORD_TOMBSTONE_KINDS = {
+    Consultation: Tombstone.KIND_CONSULTATION,
+    MedicalProcedure: Tombstone.KIND_PROCEDURE,
+    Referral: Tombstone.KIND_REFERRAL,
+}
+
+@receiver(post_delete, sender=Consultation)
+@receiver(post_delete, sender=MedicalProcedure)
+@receiver(post_delete, sender=Referral)
+def record_deleted(sender, instance, origin=None, **kwargs):
+    # Suppression d'un patient : ses clients oublient déjà tout son dossier
+    if not _cascading_from(origin, Patient):
+        Tombstone.objects.create(kind=RECORD_TOMBSTONE_KINDS[sender], object_id=str(instance.pk), patient_id=instance.patient_id)
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_save, sender=MedicalProcedure)
+@receiver(post_save, sender=Referral)
+def record_moved(sender, instance, created, raw=False, **kwargs):
+    # Rattaché à un autre patient : les médecins qui ne voient que l'ancien doivent l'oublier
+    # (ceux qui voient aussi le nouveau reçoivent la mise à jour)
+    if raw or created or not _changed(instance, 'patient_id'):
+        return
+    previous = instance._previous_values['patient_id']
+    doctor_ids = PatientVisibility.objects.filter(patient_id=previous).exclude(
+        doctor_id__in=PatientVisibility.objects.filter(patient_id=instance.patient_id).values('doctor_id'),
+    ).values_list('doctor_id', flat=True)
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=RECORD_TOMBSTONE_KINDS[sender], object_id=str(instance.pk), patient_id=previous, doctor_id=doctor_id)
+        for doctor_id in doctor_ids
+    ])
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, origin=None, **kwargs):
+    if not _cascading_from(origin, Doctor):
+        Tombstone.objects.create(kind=Tombstone.KIND_APPOINTMENT, object_id=str(instance.pk), doctor_id=instance.doctor_id)
+
+@receiver(post_delete, sender=Note)
+def note_deleted(sender, instance, origin=None, **kwargs):
+    if not _cascading_from(origin, Doctor):
+        Tombstone.objects.create(kind=Tombstone.KIND_NOTE, object_id=str(instance.pk), doctor_id=instance.author_id)
+
+
+# --- Invalidation du cache des statistiques ---
+
+def _invalidate(doctor_ids=(), workplace_ids=()):
+    """
+    Incrémente la génération globale, celle des médecins donnés ainsi que celle de leurs
+    cliniques et des cliniques données.
+    """
+    doctor_ids = {doctor_id for doctor_id in doctor_ids if doctor_id is not None}
+    workplace_ids = {workplace_id for workplace_id in workplace_ids if workplace_id is not None}
+    if doctor_ids:
+        workplace_ids |= stats.workplaces_of(doctor_ids)
+    cache.bump(cache.GLOBAL)
+    cache.bump(cache.DOCTOR, doctor_ids)
+    cache.bump(cache.WORKPLACE, workplace_ids)
+
+def _previous_ids(instance, *fields):
+    previous = getattr(instance, '_previous_values', None) or {}
+    return [previous.get(field) for field in fields]
+
+@receiver(pre_save, sender=Appointment)
+def appointment_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _remember_previous(sender, instance, ('doctor_id', 'workplace_id'))
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    old_doctor_id, old_workplace_id = _previous_ids(instance, 'doctor_id', 'workplace_id')
+    _invalidate([instance.doctor_id, old_doctor_id], [instance.workplace_id, old_workplace_id])
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+def consultation_changed(sender, instance, **kwargs):
+    _invalidate([instance.doctor_id, *_previous_ids(instance, 'doctor_id')])
+
+@receiver(post_save, sender=MedicalProcedure)
+@receiver(post_delete, sender=MedicalProcedure)
+def procedure_changed(sender, instance, **kwargs):
+    _invalidate([instance.operator_id, *_previous_ids(instance, 'operator_id')])
+
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def referral_changed(sender, instance, **kwargs):
+    _invalidate([
+        instance.referred_by_id, instance.referred_to_id,
+        *_previous_ids(instance, 'referred_by_id', 'referred_to_id'),
+    ])
+
+@receiver(post_save, sender=Patient)
+def patient_changed(sender, instance, created, **kwargs):
+    # Le nom du patient apparaît dans les statistiques par patient de ses médecins
+    doctor_ids = [] if created else instance.assigned_doctors.values_list('pk', flat=True)
+    _invalidate(doctor_ids)
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    _invalidate(getattr(instance, '_assigned_doctor_ids', []))
+
+@receiver(m2m_changed, sender=Patient.assigned_doctors.through)
+def assignments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate([instance.pk] if reverse else (pk_set or getattr(instance, '_cleared_pks', set())))
+
+@receiver(post_save, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    _invalidate([instance.pk])
+
+@receiver(post_delete, sender=Doctor)
+def doctor_deleted(sender, instance, **kwargs):
+    _invalidate([instance.pk], getattr(instance, '_workplace_ids', []))
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    if not created:
+        _invalidate(Doctor.objects.filter(user=instance).values_list('pk', flat=True))
+
+@receiver(m2m_changed, sender=Doctor.workplaces.through)
+def memberships_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            _invalidate(pk_set or getattr(instance, '_cleared_pks', set()), [instance.pk])
+        else:
+            _invalidate([instance.pk], pk_set or getattr(instance, '_cleared_pks', set()))
+
+@receiver(post_save, sender=Workplace)
+@receiver(post_delete, sender=Workplace)
+def workplace_changed(sender, instance, **kwargs):
+    _invalidate(workplace_ids=[instance.pk])
+
+
+# --- Invalidation du cache d'authentification (DoctorJWTAuthentication) ---
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_auth_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_auth_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
@@ -0,0 +1,255 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q, Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+from .models import (
+    Patient, Doctor, Workplace, Appointment, Consultation, MedicalProcedure, Referral, StatsCounter
+)
+
+GLOBAL_ID = 0
+COUNTER_FIELDS = ('doctors', 'workplaces', 'patients', 'consultations', 'referrals', 'procedures')
+
+
+def _date_window(field, since=None, until=None, is_datetime=True):
+    """
+    Construit le filtre de période (bornes incluses) sur un champ date ou datetime.
+    Pour un DateTimeField on compare à des bornes de jour, ce qui reste utilisable par un index.
+    """
+    filters = {}
+    if since:
+        filters[f'{field}__gte'] = timezone.make_aware(datetime.combine(since, time.min)) if is_datetime else since
+    if until:
+        if is_datetime:
+            filters[f'{field}__lt'] = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+        else:
+            filters[f'{field}__lte'] = until
+    return filters
+
+
+def _count_per_doctor(model, field, window):
+    """Sous-requête corrélée comptant les lignes de `model` rattachées au médecin courant."""
+    counts = model.objects.filter(**{field: OuterRef('pk')}, **window).order_by().values(field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def workplace_statistics(workplace, since=None, until=None):
+    """
+    Statistiques d'une clinique en un nombre constant de requêtes, quel que soit le
+    nombre de médecins : une agrégation groupée pour le détail par médecin, un comptage
+    pour les rendez-vous et un comptage des patients distincts.
+    """
+    consultation_window = _date_window('consultation_date', since, until)
+    appointment_window = _date_window('appointment_date', since, until)
+    procedure_window = _date_window('procedure_date', since, until, is_datetime=False)
+
+    rows = Doctor.objects.filter(workplaces=workplace).annotate(
+        full_name=Concat(Value('Dr. '), F('user__first_name'), Value(' '), F('user__last_name')),
+        consultations_count=_count_per_doctor(Consultation, 'doctor', consultation_window),
+        appointments_count=_count_per_doctor(Appointment, 'doctor', appointment_window),
+        procedures_count=_count_per_doctor(MedicalProcedure, 'operator', procedure_window),
+    ).values_list('id', 'full_name', 'consultations_count', 'appointments_count', 'procedures_count').order_by('id')
+    doctors_breakdown = [
+        {
+            "id": doctor_id,
+            "name": name,
+            "consultations": consultations,
+            "appointments": appointments,
+            "medical_procedures": procedures,
+        }
+        for doctor_id, name, consultations, appointments, procedures in rows
+    ]
+
+    appointments = Appointment.objects.filter(workplace=workplace, **appointment_window)
+    clinic_consultations = Consultation.objects.filter(doctor__workplaces=workplace, **consultation_window)
+    clinic_procedures = MedicalProcedure.objects.filter(operator__workplaces=workplace, **procedure_window)
+
+    # Union de trois sous-requêtes sur les ids : pas de jointure multipliée ni de DISTINCT
+    patients = Patient.objects.filter(
+        Q(unique_id__in=appointments.values('patient_id')) |
+        Q(unique_id__in=clinic_consultations.values('patient_id')) |
+        Q(unique_id__in=clinic_procedures.values('patient_id'))
+    ).count()
+
+    return {
+        "total_stats": {
+            "doctors": len(doctors_breakdown),
+            "patients": patients,
+            "appointments": appointments.count(),
+            # Chaque consultation / acte n'a qu'un médecin : la somme du détail est exacte
+            "consultations": sum(row['consultations'] for row in doctors_breakdown),
+            "medical_procedures": sum(row['medical_procedures'] for row in doctors_breakdown),
+        },
+        "doctors_breakdown": doctors_breakdown,
+    }
+
+
+# ----------------------------------------------------------------------
+# COMPTEURS DÉNORMALISÉS (StatsCounter)
+# ----------------------------------------------------------------------
+
+def doctor_label(doctor):
+    return f"{doctor.user.first_name} {doctor.user.last_name}"
+
+
+def _doctor_counters(doctor_id):
+    return {
+        'patients': Patient.assigned_doctors.through.objects.filter(doctor_id=doctor_id).count(),
+        'consultations': Consultation.objects.filter(doctor_id=doctor_id).count(),
+        'referrals': Referral.objects.filter(referred_by_id=doctor_id).count(),
+        'procedures': MedicalProcedure.objects.filter(operator_id=doctor_id).count(),
+    }
+
+
+def _workplace_counters(workplace_id):
+    assignments = Patient.assigned_doctors.through.objects.filter(doctor__workplaces=workplace_id)
+    return {
+        'patients': assignments.values('patient_id').distinct().count(),
+        'consultations': Consultation.objects.filter(doctor__workplaces=workplace_id).count(),
+        'procedures': MedicalProcedure.objects.filter(operator__workplaces=workplace_id).count(),
+    }
+
+
+def _global_counters():
+    return {
+        'doctors': Doctor.objects.count(),
+        'workplaces': Workplace.objects.count(),
+        'patients': Patient.objects.count(),
+        'consultations': Consultation.objects.count(),
+        'referrals': Referral.objects.count(),
+        'procedures': MedicalProcedure.objects.count(),
+    }
+
+
+def _recompute_row(scope, object_id):
+    """Recalcule entièrement une ligne (utilisé quand la ligne n'existe pas encore)."""
+    if scope == StatsCounter.SCOPE_GLOBAL:
+        defaults = _global_counters()
+    elif scope == StatsCounter.SCOPE_WORKPLACE:
+        workplace = Workplace.objects.filter(pk=object_id).first()
+        if workplace is None:
+            return
+        defaults = {'label': workplace.name, **_workplace_counters(object_id)}
+    else:
+        doctor = Doctor.objects.select_related('user').filter(pk=object_id).first()
+        if doctor is None:
+            return
+        defaults = {'label': doctor_label(doctor), 'specialty': doctor.specialty, **_doctor_counters(object_id)}
+    StatsCounter.objects.update_or_create(scope=scope, object_id=object_id, defaults=defaults)
+
+
+def adjust(scope, object_ids, **deltas):
+    """Applique des incréments (éventuellement négatifs) aux lignes données, en SQL atomique."""
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return
+    with transaction.atomic():
+        for object_id in set(object_ids):
+            if object_id is None:
+                continue
+            updated = StatsCounter.objects.filter(scope=scope, object_id=object_id).update(**updates)
+            if not updated:
+                _recompute_row(scope, object_id)
+
+
+def adjust_activity(field, doctor_id, delta, count_workplaces=True, count_global=True):
+    """
+    Répercute la création (delta > 0) ou suppression (delta < 0) d'une ligne rattachée à un
+    médecin sur les compteurs global, du médecin et de ses cliniques.
+    """
+    with transaction.atomic():
+        if count_global:
+            adjust(StatsCounter.SCOPE_GLOBAL, [GLOBAL_ID], **{field: delta})
+        if doctor_id is None:
+            return
+        adjust(StatsCounter.SCOPE_DOCTOR, [doctor_id], **{field: delta})
+        if count_workplaces:
+            workplace_ids = Doctor.workplaces.through.objects.filter(doctor_id=doctor_id).values_list('workplace_id', flat=True)
+            adjust(StatsCounter.SCOPE_WORKPLACE, list(workplace_ids), **{field: delta})
+
+
+def refresh_workplaces(workplace_ids):
+    """Recalcule les compteurs des cliniques données (changement d'effectif ou d'assignation)."""
+    with transaction.atomic():
+        for workplace_id in set(workplace_ids):
+            _recompute_row(StatsCounter.SCOPE_WORKPLACE, workplace_id)
+
+
+def workplaces_of(doctor_ids):
+    return set(Doctor.workplaces.through.objects.filter(doctor_id__in=doctor_ids).values_list('workplace_id', flat=True))
+
+
+def compute_counters():
+    """
+    Calcule à partir de zéro toutes les lignes attendues, en un petit nombre
+    d'agrégations groupées. Retourne {(scope, object_id): {champ: valeur}}.
+    """
+    def grouped(queryset, key):
+        return dict(queryset.order_by().values_list(key).annotate(total=Count('pk')))
+
+    expected = {(StatsCounter.SCOPE_GLOBAL, GLOBAL_ID): {'label': '', 'specialty': '', **_global_counters()}}
+
+    assignments = Patient.assigned_doctors.through.objects
+    doctor_patients = grouped(assignments.all(), 'doctor_id')
+    doctor_consultations = grouped(Consultation.objects.all(), 'doctor_id')
+    doctor_referrals = grouped(Referral.objects.all(), 'referred_by_id')
+    doctor_procedures = grouped(MedicalProcedure.objects.all(), 'operator_id')
+    for doctor in Doctor.objects.select_related('user'):
+        expected[(StatsCounter.SCOPE_DOCTOR, doctor.pk)] = {
+            'label': doctor_label(doctor),
+            'specialty': doctor.specialty,
+            'patients': doctor_patients.get(doctor.pk, 0),
+            'consultations': doctor_consultations.get(doctor.pk, 0),
+            'referrals': doctor_referrals.get(doctor.pk, 0),
+            'procedures': doctor_procedures.get(doctor.pk, 0),
+        }
+
+    workplace_patients = dict(
+        assignments.filter(doctor__workplaces__isnull=False).order_by().values_list('doctor__workplaces')
+        .annotate(total=Count('patient_id', distinct=True))
+    )
+    workplace_consultations = grouped(Consultation.objects.filter(doctor__workplaces__isnull=False), 'doctor__workplaces')
+    workplace_procedures = grouped(MedicalProcedure.objects.filter(operator__workplaces__isnull=False), 'operator__workplaces')
+    for workplace_id, name in Workplace.objects.values_list('id', 'name'):
+        expected[(StatsCounter.SCOPE_WORKPLACE, workplace_id)] = {
+            'label': name,
+            'patients': workplace_patients.get(workplace_id, 0),
+            'consultations': workplace_consultations.get(workplace_id, 0),
+            'procedures': workplace_procedures.get(workplace_id, 0),
+        }
+    return expected
+
+
+def rebuild_counters(apply=True):
+    """
+    Compare les compteurs stockés aux valeurs recalculées et corrige les écarts.
+    Retourne la liste des écarts : (scope, object_id, champ, valeur stockée, valeur attendue).
+    """
+    expected = compute_counters()
+    stored = {(row.scope, row.object_id): row for row in StatsCounter.objects.all()}
+    drift = []
+
+    with transaction.atomic():
+        for key, values in expected.items():
+            row = stored.pop(key, None)
+            if row is None:
+                drift.extend((*key, field, None, value) for field, value in values.items() if field in COUNTER_FIELDS)
+                if apply:
+                    StatsCounter.objects.create(scope=key[0], object_id=key[1], **values)
+                continue
+            changed = [field for field, value in values.items() if getattr(row, field) != value]
+            drift.extend((*key, field, getattr(row, field), values[field]) for field in changed if field in COUNTER_FIELDS)
+            if changed and apply:
+                for field in changed:
+                    setattr(row, field, values[field])
+                row.save(update_fields=changed)
+        # Lignes orphelines (médecin ou clinique supprimé sans signal)
+        for key, row in stored.items():
+            drift.extend((*key, field, getattr(row, field), None) for field in COUNTER_FIELDS if getattr(row, field))
+            if apply:
+                row.delete()
+    return drift
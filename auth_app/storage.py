@@ -0,0 +1,104 @@
+"""
+Stockage adressé par contenu des pièces jointes cliniques.
+
+Chaque fichier envoyé est haché (SHA-256) pendant son écriture sur le disque, puis rangé une
+seule fois sous son empreinte : MEDIA_ROOT/blobs/ab/abcdef.... Le nom enregistré en base est
+« cas/<empreinte>/<nom d'origine> », qui conserve le nom affiché au téléchargement. Deux envois
+du même contenu partagent le même fichier ; les références sont comptées dans AttachmentBlob
+(voir signals.py) et les fichiers orphelins supprimés par la commande `gc_attachments`.
+Les fichiers déjà présents sous un nom classique restent servis normalement.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.text import get_valid_filename
+
+PREFIX = 'cas/'
+BLOB_DIR = 'blobs'
+
+
+def digest_of(name):
+    """Empreinte désignée par un nom « cas/<empreinte>/... », None pour un fichier classique."""
+    if name and name.startswith(PREFIX):
+        return name[len(PREFIX):].split('/', 1)[0]
+    return None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def blob_name(self, digest):
+        return f"{BLOB_DIR}/{digest[:2]}/{digest}"
+
+    def _physical(self, name):
+        digest = digest_of(name)
+        return self.blob_name(digest) if digest else name
+
+    def path(self, name):
+        return super().path(self._physical(name))
+
+    def url(self, name):
+        return super().url(self._physical(name))
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom final dépend du contenu (voir _save) : pas de renommage en cas de collision
+        return name
+
+    def store(self, name, content):
+        """
+        Écrit `content` sous son empreinte, en un seul passage (hachage pendant la copie),
+        déclare le blob dans AttachmentBlob et retourne (nom « cas/... », empreinte, taille).
+        """
+        # Import local : models.py référence ce module pour ses FileField
+        from .models import AttachmentBlob
+
+        tmp_dir = os.path.join(self.location, BLOB_DIR, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temporary = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            # La ligne est déclarée (et rafraîchie) avant de regarder le disque : gc_attachments
+            # met le fichier en quarantaine avant de supprimer la ligne sous condition. Soit il l'a
+            # déjà déplacé et le fichier est réécrit ici, soit sa suppression échouera et il le
+            # remettra en place ; un fichier jugé présent ne peut donc plus disparaître.
+            AttachmentBlob.objects.register(digest, size)
+            final = super().path(self.blob_name(digest))
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            if os.path.exists(final):
+                # Contenu déjà stocké : la copie est abandonnée
+                os.unlink(temporary)
+            else:
+                os.replace(temporary, final)
+                if self.file_permissions_mode is not None:
+                    os.chmod(final, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        filename = get_valid_filename(os.path.basename(name))[-150:]
+        return f"{PREFIX}{digest}/{filename}", digest, size
+
+    def _save(self, name, content):
+        return self.store(name, content)[0]
+
+    def delete(self, name):
+        # Un blob peut être partagé : sa suppression est l'affaire de gc_attachments
+        if not digest_of(name):
+            super().delete(name)
+
+
+attachment_storage = ContentAddressedStorage()
+
+
+def select_attachment_storage():
+    return attachment_storage
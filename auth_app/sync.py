@@ -0,0 +1,132 @@
+"""
+Synchronisation différentielle des clients (application Kivy, frontend web) : /api/sync/.
+
+Chaque réponse porte un curseur opaque ; la suivante, `?since=<curseur>`, ne contient que ce
+qui a changé depuis pour le médecin : objets modifiés (colonnes updated_at), patients devenus
+visibles avec tout leur dossier, et suppressions (Tombstone, tenues par les signaux).
+Le document JSON est produit en flux, par paquets : sa taille ne pèse pas sur la mémoire.
+
+Le curseur est l'heure de début de la réponse moins SYNC_OVERLAP secondes : une écriture
+en cours pendant la lecture est renvoyée la fois suivante plutôt que perdue. Un client peut
+donc recevoir deux fois le même objet et doit appliquer les données de façon idempotente :
+suppressions (« deleted ») d'abord, puis les objets, dans l'ordre du flux.
+"""
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import (
+    Appointment, Consultation, MedicalProcedure, Note, Patient, PatientVisibility, Referral, Tombstone,
+)
+from .serializers import (
+    AppointmentSyncSerializer, ConsultationSerializer, MedicalProcedureSerializer, NoteSerializer,
+    PatientSyncSerializer, ReferralSyncSerializer,
+)
+
+# Objets lus et sérialisés par paquet
+SYNC_CHUNK_SIZE = 500
+
+
+class CursorError(ValueError):
+    """Curseur illisible."""
+
+
+class CursorExpired(CursorError):
+    """Curseur plus ancien que la conservation des suppressions : resynchronisation complète."""
+
+
+def make_cursor(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def parse_cursor(cursor):
+    """Instant désigné par `cursor` ; None pour une synchronisation complète (curseur absent)."""
+    if not cursor:
+        return None
+    try:
+        since = datetime.fromtimestamp(int(cursor) / 1_000_000, tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise CursorError("Curseur de synchronisation invalide.")
+    if since < timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION):
+        raise CursorExpired("Curseur expiré : une synchronisation complète est nécessaire.")
+    return since
+
+
+def _sources(doctor, since):
+    """(clé, queryset, sérialiseur) des objets à envoyer, dans l'ordre du flux."""
+    visible = PatientVisibility.objects.filter(doctor=doctor)
+    patient_ids = visible.values('patient_id')
+    patients = Patient.objects.filter(pk__in=patient_ids)
+    records = {
+        'consultations': (
+            ConsultationSerializer.setup_eager_loading(Consultation.objects.filter(patient_id__in=patient_ids)),
+            ConsultationSerializer,
+        ),
+        'procedures': (
+            MedicalProcedureSerializer.setup_eager_loading(MedicalProcedure.objects.filter(patient_id__in=patient_ids)),
+            MedicalProcedureSerializer,
+        ),
+        'referrals': (Referral.objects.filter(patient_id__in=patient_ids), ReferralSyncSerializer),
+    }
+    appointments = Appointment.objects.filter(doctor=doctor)
+    notes = Note.objects.filter(author=doctor)
+
+    if since is not None:
+        # Patient devenu visible depuis le curseur : tout son dossier est envoyé
+        new_ids = visible.filter(created_at__gt=since).values('patient_id')
+        patients = patients.filter(Q(updated_at__gt=since) | Q(pk__in=new_ids))
+        records = {
+            key: (queryset.filter(Q(updated_at__gt=since) | Q(patient_id__in=new_ids)), serializer)
+            for key, (queryset, serializer) in records.items()
+        }
+        appointments = appointments.filter(updated_at__gt=since)
+        notes = notes.filter(updated_at__gt=since)
+
+    yield 'patients', patients.prefetch_related('assigned_doctors').order_by('pk'), PatientSyncSerializer
+    for key, (queryset, serializer) in records.items():
+        yield key, queryset.order_by('pk'), serializer
+    yield 'appointments', appointments.order_by('pk'), AppointmentSyncSerializer
+    yield 'notes', notes.order_by('pk'), NoteSerializer
+
+
+def _tombstones(doctor, since):
+    patient_ids = PatientVisibility.objects.filter(doctor=doctor).values('patient_id')
+    return Tombstone.objects.filter(
+        Q(doctor=doctor) | Q(doctor__isnull=True, patient_id__in=patient_ids),
+        deleted_at__gt=since,
+    ).order_by('deleted_at', 'pk').values_list('kind', 'object_id')
+
+
+def _encode(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+
+
+def stream_changes(doctor, since, context):
+    """Document JSON des changements pour `doctor` depuis `since`, produit morceau par morceau."""
+    # Lignes complètes quels que soient ?fields= / ?expand= : le client les enregistre telles quelles
+    context = {**context, 'sparse_fields': False}
+    cursor = make_cursor(timezone.now() - timedelta(seconds=settings.SYNC_OVERLAP))
+    yield f'{{"cursor": {_encode(cursor)}, "full": {_encode(since is None)}, "deleted": ['
+
+    if since is not None:
+        separator = ''
+        for kind, object_id in _tombstones(doctor, since).iterator(chunk_size=SYNC_CHUNK_SIZE):
+            yield separator + _encode({'type': kind, 'id': object_id})
+            separator = ', '
+    yield ']'
+
+    for key, queryset, serializer_class in _sources(doctor, since):
+        yield f', {_encode(key)}: ['
+        rows = queryset.iterator(chunk_size=SYNC_CHUNK_SIZE)
+        separator = ''
+        while chunk := list(islice(rows, SYNC_CHUNK_SIZE)):
+            data = serializer_class(chunk, many=True, context=context).data
+            yield separator + ', '.join(_encode(item) for item in data)
+            separator = ', '
+        yield ']'
+    yield '}'
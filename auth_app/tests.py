@@ -1,3 +1,1645 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import tempfile
+import threading
+import uuid
+import unittest
+from unittest import mock
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as django_timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import cache
+from .authentication import DoctorJWTAuthentication, user_cache
+from .exports import cached_patient_record, patient_record_path
+from .imports import INITIAL_CONSULTATION_REASON, openpyxl
+from .jobs import abandon, claim_next, heartbeat, requeue_stale
+from .management.commands.bench_indexes import migration_indexes
+from .management.commands.gc_attachments import Command as GcAttachmentsCommand
+from .views import search_patients, stream_file
+from .middleware import brotli
+from .login import LoginExecutor, LoginSaturated, login_executor, login_limiter
+from .pagination import KeysetPagination
+from .models import (
+    fold_name, Appointment, DeletedAppointment, Doctor, Workplace, Patient, Consultation, MedicalProcedure, Referral, Job, AttachmentBlob,
+    AttachmentBlobManager, PatientVisibility, StatsCounter, ForumPost, ForumComment, Note, Tombstone,
+)
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializers import PatientListSerializer, SimpleConsultationSerializer
+from .stats import rebuild_counters, workplace_statistics
+from .storage import BLOB_DIR
+from .sync import make_cursor
+
+
+def create_doctor(index, workplace=None):
+    user = User.objects.create_user(
+        username=f'doctor{index}@example.com',
+        email=f'doctor{index}@example.com',
+        password='motdepasse',
+        first_name=f'Prénom{index}',
+        last_name=f'Nom{index}',
+    )
+    doctor = Doctor.objects.create(user=user, license_number=f'LIC-{index}')
+    if workplace:
+        doctor.workplaces.add(workplace)
+    return doctor
+
+
+def at_noon(day):
+    return django_timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=12))
+
+class QueryBudgetMixin:
+    """
+    Mode d'assertion "budget de requêtes" : contrairement à assertNumQueries, on fixe
+    un plafond qui doit tenir quel que soit le volume de données.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f"{executed} requêtes exécutées pour un budget de {budget} :\n{queries}")
+
+
+class PatientQueryBudgetTests(QueryBudgetMixin, TestCase):
+    LIST_BUDGET = 10
+    DETAIL_BUDGET = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        workplace = Workplace.objects.create(name='Clinique Test', address='1 rue de la Paix')
+        cls.doctor = create_doctor(0, workplace)
+        cls.colleagues = [create_doctor(index, workplace) for index in range(1, 4)]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url):
+        # Recharge l'utilisateur à chaque requête, comme le ferait l'authentification JWT
+        self.client.force_authenticate(User.objects.get(pk=self.doctor.user_id))
+        return self.client.get(url)
+
+    def create_patient(self, index, referrals=20):
+        patient = Patient.objects.create(first_name=f'Patient{index}', last_name='Test')
+        patient.assigned_doctors.add(self.doctor, *self.colleagues)
+        Consultation.objects.create(patient=patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+        MedicalProcedure.objects.create(
+            patient=patient, procedure_type='Radiographie', procedure_date='2025-01-01', operator=self.doctor
+        )
+        for ref_index in range(referrals):
+            colleague = self.colleagues[ref_index % len(self.colleagues)]
+            Referral.objects.create(
+                patient=patient, referred_to=colleague, referred_by=self.doctor,
+                specialty_requested='Cardiologie', reason_for_referral='Avis',
+            )
+        return patient
+
+    def test_list_query_budget_is_independent_of_rows(self):
+        self.create_patient(0)
+        with self.assertQueryBudget(self.LIST_BUDGET) as small:
+            response = self.get('/api/patients/')
+        self.assertEqual(response.status_code, 200)
+
+        for index in range(1, 10):
+            self.create_patient(index)
+        with self.assertQueryBudget(self.LIST_BUDGET) as large:
+            response = self.get('/api/patients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][0]['referrals']), 20)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_detail_query_budget(self):
+        patient = self.create_patient(0, referrals=30)
+        with self.assertQueryBudget(self.DETAIL_BUDGET):
+            response = self.get(f'/api/patients/{patient.unique_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['referrals']), 30)
+        self.assertEqual(len(response.data['referrals'][0]['referred_to_details']['workplaces']), 1)
+
+
+class ClinicalIndexTests(TestCase):
+    """Index de la migration 0019 : présents en base et choisis pour les requêtes des listes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.workplace = Workplace.objects.create(name='Clinique A', address='Rue 1')
+        cls.doctor = create_doctor(0, cls.workplace)
+        cls.post = ForumPost.objects.create(author=cls.doctor, title='Sujet', content='Texte')
+
+    def test_migration_indexes_exist(self):
+        indexes = migration_indexes()
+        self.assertEqual(len(indexes), 11)
+        with connection.cursor() as cursor:
+            for model, index in indexes:
+                self.assertIn(index.name, connection.introspection.get_constraints(cursor, model._meta.db_table))
+
+    def test_hot_queries_use_the_indexes(self):
+        since = at_noon(date(2025, 1, 1))
+        queries = {
+            'appt_doctor_date_idx': Appointment.objects.filter(doctor=self.doctor).order_by('appointment_date'),
+            'appt_workplace_date_idx': Appointment.objects.filter(workplace=self.workplace, appointment_date__gte=since),
+            'consult_doctor_date_idx': Consultation.objects.filter(doctor=self.doctor).order_by('-consultation_date'),
+            'procedure_operator_date_idx': MedicalProcedure.objects.filter(operator=self.doctor).order_by('-procedure_date'),
+            'referral_by_date_idx': Referral.objects.filter(referred_by=self.doctor).order_by('-date_of_referral'),
+            'referral_to_date_idx': Referral.objects.filter(referred_to=self.doctor).order_by('-date_of_referral'),
+            'note_author_created_idx': Note.objects.filter(author=self.doctor).order_by('-created_at'),
+            'forumpost_created_idx': ForumPost.objects.order_by('-created_at')[:20],
+            'forumcomment_post_created_idx': ForumComment.objects.filter(post=self.post).order_by('created_at'),
+            'forumcomment_created_idx': ForumComment.objects.filter(created_at__gte=since),
+            'deleted_appt_date_idx': DeletedAppointment.objects.order_by('-deletion_date')[:20],
+        }
+        for name, queryset in queries.items():
+            with self.subTest(index=name):
+                self.assertIn(name, queryset.explain())
+
+
+class PatientVisibilityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.colleague = create_doctor(1)
+
+    def visible(self, doctor=None):
+        doctor = doctor or self.doctor
+        return set(PatientVisibility.objects.filter(doctor=doctor).values_list('patient_id', flat=True))
+
+    def test_signals_keep_visibility_in_sync(self):
+        patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        self.assertEqual(self.visible(), set())
+
+        consultation = Consultation.objects.create(patient=patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+        patient.assigned_doctors.add(self.doctor)
+        self.assertEqual(self.visible(), {patient.pk})
+        # Encore assigné : la suppression de la consultation ne retire pas la visibilité
+        consultation.delete()
+        self.assertEqual(self.visible(), {patient.pk})
+        patient.assigned_doctors.clear()
+        self.assertEqual(self.visible(), set())
+
+        referral = Referral.objects.create(
+            patient=patient, referred_to=self.colleague, referred_by=self.doctor,
+            specialty_requested='Cardiologie', reason_for_referral='Avis',
+        )
+        self.assertEqual(self.visible(self.colleague), {patient.pk})
+        # Le médecin qui réfère ne voit pas le patient pour autant
+        self.assertEqual(self.visible(), set())
+        referral.referred_to = self.doctor
+        referral.save()
+        self.assertEqual(self.visible(self.colleague), set())
+        self.assertEqual(self.visible(), {patient.pk})
+
+        self.colleague.assigned_patients.add(patient)
+        self.assertEqual(self.visible(self.colleague), {patient.pk})
+        patient.assigned_doctors.remove(self.colleague)
+        self.assertEqual(self.visible(self.colleague), set())
+
+    def test_cursor_pagination_lists_each_visible_patient_once(self):
+        patients = []
+        for index in range(7):
+            patient = Patient.objects.create(first_name=f'Patient{index}', last_name='Test')
+            patient.assigned_doctors.add(self.doctor)
+            # Plusieurs chemins de visibilité : pas de doublon
+            Consultation.objects.create(patient=patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+            patients.append(patient)
+        Patient.objects.create(first_name='Invisible', last_name='Test').assigned_doctors.add(self.colleague)
+
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        for url in ('/api/patients/?page_size=3', '/api/doctors/me/patients/?page_size=3'):
+            seen, pages = [], 0
+            while url:
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                seen += [row['unique_id'] for row in response.data['results']]
+                url, pages = response.data['next'], pages + 1
+            self.assertEqual(pages, 3)
+            # Les derniers rendus visibles en premier
+            self.assertEqual(seen, [str(patient.pk) for patient in reversed(patients)])
+
+        response = client.get('/api/patients/?cursor=invalide')
+        self.assertEqual(response.status_code, 404)
+
+class WorkplaceStatisticsTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.workplace = Workplace.objects.create(name='Clinique A', address='Rue 1')
+        cls.doctor = create_doctor(0, cls.workplace)
+        cls.colleague = create_doctor(1, cls.workplace)
+        outsider = create_doctor(2, Workplace.objects.create(name='Clinique B', address='Rue 2'))
+        cls.patients = [Patient.objects.create(first_name=f'Patient{index}', last_name='Test') for index in range(4)]
+        first, second, third, other = cls.patients
+
+        def consultation(patient, doctor, day):
+            consultation = Consultation.objects.create(patient=patient, doctor=doctor, reason_for_consultation='Contrôle')
+            Consultation.objects.filter(pk=consultation.pk).update(consultation_date=at_noon(day))
+
+        consultation(first, cls.doctor, date(2025, 1, 10))
+        consultation(first, cls.colleague, date(2025, 2, 15))
+        consultation(other, outsider, date(2025, 2, 15))
+        MedicalProcedure.objects.create(patient=second, procedure_type='Radiographie', procedure_date=date(2025, 3, 1), operator=cls.colleague)
+        Appointment.objects.create(
+            patient=third, doctor=cls.doctor, workplace=cls.workplace,
+            appointment_date=at_noon(date(2025, 2, 1)), reason_for_appointment='Suivi',
+        )
+
+    def setUp(self):
+        django_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def breakdown(self, data):
+        return {row['id']: (row['consultations'], row['appointments'], row['medical_procedures']) for row in data['doctors_breakdown']}
+
+    def test_totals_and_breakdown(self):
+        response = self.client.get(f'/api/workplaces/{self.workplace.pk}/statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_stats'], {
+            'doctors': 2, 'patients': 3, 'appointments': 1, 'consultations': 2, 'medical_procedures': 1,
+        })
+        self.assertEqual(self.breakdown(response.data), {self.doctor.pk: (1, 1, 0), self.colleague.pk: (1, 0, 1)})
+        self.assertEqual(response.data['doctors_breakdown'][0]['name'], 'Dr. Prénom0 Nom0')
+
+    def test_date_window(self):
+        data = workplace_statistics(self.workplace, since=date(2025, 2, 1))
+        self.assertEqual(data['total_stats'], {
+            'doctors': 2, 'patients': 3, 'appointments': 1, 'consultations': 1, 'medical_procedures': 1,
+        })
+        data = workplace_statistics(self.workplace, until=date(2025, 1, 31))
+        self.assertEqual(data['total_stats'], {
+            'doctors': 2, 'patients': 1, 'appointments': 0, 'consultations': 1, 'medical_procedures': 0,
+        })
+        self.assertEqual(self.breakdown(data), {self.doctor.pk: (1, 0, 0), self.colleague.pk: (0, 0, 0)})
+
+        response = self.client.get(f'/api/workplaces/{self.workplace.pk}/statistics/?since=01/02/2025')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.data)
+
+    def test_query_count_is_independent_of_doctors(self):
+        with self.assertQueryBudget(5) as small:
+            workplace_statistics(self.workplace)
+        for index in range(3, 8):
+            doctor = create_doctor(index, self.workplace)
+            Consultation.objects.create(patient=self.patients[0], doctor=doctor, reason_for_consultation='Contrôle')
+        with self.assertQueryBudget(5) as large:
+            data = workplace_statistics(self.workplace)
+        self.assertEqual(data['total_stats']['doctors'], 7)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+class StatsCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.workplace = Workplace.objects.create(name='Clinique A', address='Rue 1')
+        cls.doctor = create_doctor(0, cls.workplace)
+        cls.colleague = create_doctor(1, cls.workplace)
+
+    def setUp(self):
+        django_cache.clear()
+
+    def counters(self, scope, object_id=0):
+        row = StatsCounter.objects.get(scope=scope, object_id=object_id)
+        return {field: getattr(row, field) for field in ('doctors', 'workplaces', 'patients', 'consultations', 'referrals', 'procedures')}
+
+    def test_signals_keep_counters_exact(self):
+        patients = [Patient.objects.create(first_name=f'Patient{index}', last_name='Test') for index in range(3)]
+        for patient in patients:
+            patient.assigned_doctors.add(self.doctor, self.colleague)
+        consultation = Consultation.objects.create(patient=patients[0], doctor=self.doctor, reason_for_consultation='Contrôle')
+        Consultation.objects.create(patient=patients[1], doctor=self.colleague, reason_for_consultation='Contrôle')
+        MedicalProcedure.objects.create(patient=patients[0], procedure_type='Radiographie', procedure_date=date(2025, 1, 1), operator=self.doctor)
+        Referral.objects.create(
+            patient=patients[1], referred_to=self.colleague, referred_by=self.doctor,
+            specialty_requested='Cardiologie', reason_for_referral='Avis',
+        )
+        consultation.delete()
+        patients[2].assigned_doctors.remove(self.doctor)
+        patients[2].delete()
+
+        self.assertEqual(self.counters(StatsCounter.SCOPE_GLOBAL), {
+            'doctors': 2, 'workplaces': 1, 'patients': 2, 'consultations': 1, 'referrals': 1, 'procedures': 1,
+        })
+        self.assertEqual(self.counters(StatsCounter.SCOPE_DOCTOR, self.doctor.pk)['patients'], 2)
+        self.assertEqual(self.counters(StatsCounter.SCOPE_WORKPLACE, self.workplace.pk)['consultations'], 1)
+        self.assertEqual(rebuild_counters(apply=False), [])
+
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        data = client.get('/api/stats/global/').data
+        self.assertEqual((data['total_patients'], data['total_consultations']), (2, 1))
+        self.assertEqual({row['id'] for row in data['stats_by_doctor']}, {self.doctor.pk, self.colleague.pk})
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        Consultation.objects.create(
+            patient=Patient.objects.create(first_name='Awa', last_name='Diallo'),
+            doctor=self.doctor, reason_for_consultation='Contrôle',
+        )
+        StatsCounter.objects.filter(scope=StatsCounter.SCOPE_DOCTOR, object_id=self.doctor.pk).update(consultations=5)
+
+        output = io.StringIO()
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_stats', '--check', stdout=output, stderr=io.StringIO())
+        self.assertIn(f'doctor#{self.doctor.pk} consultations : stocké=5 attendu=1', output.getvalue())
+
+        call_command('rebuild_stats', stdout=io.StringIO())
+        self.assertEqual(self.counters(StatsCounter.SCOPE_DOCTOR, self.doctor.pk)['consultations'], 1)
+        self.assertEqual(rebuild_counters(apply=False), [])
+
+class StatsCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.workplace = Workplace.objects.create(name='Clinique A', address='Rue 1')
+        cls.doctor = create_doctor(0, cls.workplace)
+        cls.colleague = create_doctor(1, cls.workplace)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+
+    def setUp(self):
+        django_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        counted = any('COUNT(' in query['sql'] for query in context.captured_queries)
+        return response.data, counted
+
+    def test_cached_until_a_dependency_changes(self):
+        url = '/api/doctors/stats/'
+        data, counted = self.get(url)
+        self.assertTrue(counted)
+        self.assertEqual(self.get(url), (data, False))
+
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+        data, counted = self.get(url)
+        self.assertTrue(counted)
+        self.assertEqual(data['total_consultations'], 1)
+
+        # Activité d'un autre médecin : l'entrée du médecin reste valide
+        Consultation.objects.create(patient=self.patient, doctor=create_doctor(2), reason_for_consultation='Contrôle')
+        self.assertEqual(self.get(url), (data, False))
+
+    def test_workplace_and_patient_stats_are_invalidated(self):
+        statistics = f'/api/workplaces/{self.workplace.pk}/statistics/'
+        data, _ = self.get(statistics)
+        self.assertEqual(data['total_stats']['consultations'], 0)
+        self.assertFalse(self.get(statistics)[1])
+        # Un collègue de la clinique consulte
+        Consultation.objects.create(patient=self.patient, doctor=self.colleague, reason_for_consultation='Contrôle')
+        self.assertEqual(self.get(statistics)[0]['total_stats']['consultations'], 1)
+        # Fenêtre de dates différente : entrée distincte
+        self.assertEqual(self.get(statistics + '?until=2000-01-01')[0]['total_stats']['consultations'], 0)
+
+        data, _ = self.get('/api/doctors/patients/stats/')
+        self.assertEqual([row['full_name'] for row in data], ['Awa Diallo'])
+        Patient.objects.create(first_name='Moussa', last_name='Traoré').assigned_doctors.add(self.doctor)
+        data, _ = self.get('/api/doctors/patients/stats/')
+        self.assertEqual(len(data), 2)
+
+    def test_file_based_backend(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}
+        with self.settings(CACHES={'default': backend}):
+            self.assertTrue(self.get('/api/doctors/stats/')[1])
+            self.assertFalse(self.get('/api/doctors/stats/')[1])
+            MedicalProcedure.objects.create(
+                patient=self.patient, procedure_type='Radiographie', procedure_date=date(2025, 1, 1), operator=self.doctor,
+            )
+            self.assertEqual(self.get('/api/doctors/stats/')[0]['total_medical_procedures'], 1)
+
+            # Un autre worker gunicorn (autre instance du backend, même répertoire) voit l'invalidation
+            other_worker = FileBasedCache(directory.name, {})
+            key = 'gen:doctor:%s' % self.doctor.pk
+            before = other_worker.get(key)
+            Consultation.objects.create(patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+            self.assertNotEqual(other_worker.get(key), before)
+            self.assertEqual(other_worker.get(key), cache.generation(cache.DOCTOR, self.doctor.pk))
+
+class DatabaseProfileTests(TestCase):
+
+    def open(self, profile):
+        """Nouvelle connexion sur une base fichier jetable, avec le profil donné."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {
+            **connection.settings_dict, **settings.DATABASE_PROFILES[profile],
+            'NAME': os.path.join(directory.name, 'profil.sqlite3'),
+        }
+        wrapper = type(connections['default'])(settings_dict, alias=f'profil-{profile}')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragmas(self, wrapper):
+        values = {}
+        with wrapper.cursor() as cursor:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store'):
+                values[name] = cursor.execute(f'PRAGMA {name}').fetchone()[0]
+        return values
+
+    def test_production_profile_pragmas(self):
+        profile = settings.DATABASE_PROFILES['production']
+        self.assertEqual(self.pragmas(self.open('production')), {
+            'journal_mode': 'wal',
+            'synchronous': 1,  # NORMAL
+            'busy_timeout': profile['PRAGMAS']['busy_timeout'],
+            'cache_size': profile['PRAGMAS']['cache_size'],
+            'temp_store': 2,  # MEMORY
+        })
+        self.assertGreater(profile['CONN_MAX_AGE'], 0)
+        self.assertEqual(profile['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+    def test_default_profile_keeps_sqlite_defaults(self):
+        values = self.pragmas(self.open('default'))
+        self.assertEqual((values['journal_mode'], values['synchronous']), ('delete', 2))
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        Consultation.objects.bulk_create([
+            Consultation(patient=patient, doctor=cls.doctor, reason_for_consultation=f'Motif {index}')
+            for index in range(12)
+        ])
+        # Dates en double : le départage par clé primaire garde un ordre total
+        for index, pk in enumerate(Consultation.objects.order_by('pk').values_list('pk', flat=True)):
+            Consultation.objects.filter(pk=pk).update(consultation_date=at_noon(date(2025, 1, 1 + index // 3)))
+        cls.expected = list(Consultation.objects.order_by('-consultation_date', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_pages_follow_view_ordering_without_gaps(self):
+        pages = self.walk('/api/consultations/?page_size=5', 'next')
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        # Retour en arrière depuis la dernière page
+        last = self.client.get('/api/consultations/?page_size=5').data['next']
+        last = self.client.get(last).data['next']
+        backwards = self.walk(self.client.get(last).data['previous'], 'previous')
+        self.assertEqual(sum(reversed(backwards), []), self.expected[:10])
+
+    def test_page_size_limits_and_invalid_cursor(self):
+        response = self.client.get('/api/consultations/')
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+        with mock.patch.object(KeysetPagination, 'max_page_size', 4):
+            response = self.client.get('/api/consultations/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(self.client.get('/api/consultations/?cursor=bm9u').status_code, 404)
+
+class ForumThreadTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [create_doctor(index) for index in range(3)]
+        cls.post = ForumPost.objects.create(author=cls.doctors[0], title='Cas clinique', content='Avis ?')
+        ForumComment.objects.bulk_create([
+            ForumComment(post=cls.post, author=cls.doctors[index % 3], content=f'Commentaire {index}')
+            for index in range(8)
+        ])
+        cls.comment_ids = list(ForumComment.objects.order_by('created_at', 'pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctors[0].user)
+
+    def add_post(self, comments):
+        post = ForumPost.objects.create(author=self.doctors[1], title='Autre', content='...')
+        ForumComment.objects.bulk_create([
+            ForumComment(post=post, author=self.doctors[index % 3], content='...') for index in range(comments)
+        ])
+
+    def test_list_embeds_count_and_latest_comments(self):
+        response = self.client.get(f'/api/forum/posts/{self.post.pk}/')
+        self.assertEqual(response.data['comments_count'], 8)
+        self.assertEqual([comment['id'] for comment in response.data['comments']], self.comment_ids[-3:])
+        self.assertEqual(response.data['comments'][-1]['author_name'], 'Prénom1')
+
+        with self.assertQueryBudget(5) as small:
+            self.client.get('/api/forum/posts/')
+        for comments in (0, 5, 12):
+            self.add_post(comments)
+        with self.assertQueryBudget(5) as large:
+            response = self.client.get('/api/forum/posts/')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual([len(post['comments']) for post in response.data['results']], [3, 3, 0, 3])
+        self.assertEqual([post['comments_count'] for post in response.data['results']], [12, 5, 0, 8])
+
+    def test_comment_stream_is_paginated(self):
+        url, seen = f'/api/forum/posts/{self.post.pk}/comments/?page_size=3', []
+        while url:
+            with self.assertQueryBudget(4):
+                response = self.client.get(url)
+            seen += [comment['id'] for comment in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, self.comment_ids)
+
+class BatchCreateTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+
+    def setUp(self):
+        django_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def consultations(self, count):
+        return [{'patient': str(self.patient.pk), 'reason_for_consultation': f'Motif {index}'} for index in range(count)]
+
+    def test_batch_creates_in_one_round_trip(self):
+        with self.assertQueryBudget(25) as small:
+            response = self.client.post('/api/consultations/batch/', self.consultations(2), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        with self.assertQueryBudget(25) as large:
+            response = self.client.post('/api/consultations/batch/', self.consultations(20), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+        self.assertEqual(response.data['created'], 20)
+        self.assertEqual([result['index'] for result in response.data['results']], list(range(20)))
+        self.assertTrue(all(result['status'] == 201 and result['data']['id'] for result in response.data['results']))
+        self.assertEqual(Consultation.objects.filter(doctor=self.doctor).count(), 22)
+        # Effets des signaux de création : visibilité et compteurs
+        self.assertTrue(PatientVisibility.objects.filter(doctor=self.doctor, patient=self.patient).exists())
+        self.assertEqual(StatsCounter.objects.get(scope=StatsCounter.SCOPE_DOCTOR, object_id=self.doctor.pk).consultations, 22)
+        self.assertEqual(rebuild_counters(apply=False), [])
+
+        response = self.client.post('/api/medical-procedures/batch/', [
+            {'patient': str(self.patient.pk), 'procedure_type': 'Radiographie', 'procedure_date': '2025-01-01'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(MedicalProcedure.objects.get().operator, self.doctor)
+
+    def test_invalid_item_rejects_the_whole_batch(self):
+        items = self.consultations(3)
+        items[1] = {'patient': str(uuid.uuid4()), 'reason_for_consultation': 'Motif'}
+        response = self.client.post('/api/consultations/batch/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.data['results']], [424, 400, 424])
+        self.assertIn('patient', response.data['results'][1]['errors'])
+        self.assertFalse(Consultation.objects.exists())
+
+        self.assertEqual(self.client.post('/api/consultations/batch/', items[0], format='json').status_code, 400)
+        with self.settings(API_MAX_BATCH_SIZE=2):
+            response = self.client.post('/api/consultations/batch/', self.consultations(3), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Consultation.objects.exists())
+
+@override_settings(LOGIN_WORKERS=0, LOGIN_RATE_LIMIT=2, LOGIN_TRUSTED_PROXIES=1)
+class LoginTests(TestCase):
+    # Hachage dans le thread du test : la base de test en mémoire n'est pas partagée avec le pool
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+
+    def setUp(self):
+        self.client = APIClient()
+        login_limiter.reset()
+
+    def login(self, password='motdepasse', **extra):
+        return self.client.post(
+            '/api/login/', {'email': 'doctor0@example.com', 'password': password}, format='json', **extra
+        )
+
+    def test_success_returns_tokens(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertEqual(response.json()['user']['email'], 'doctor0@example.com')
+        # Formulaire classique accepté aussi
+        response = self.client.post('/api/login/', {'email': 'doctor0@example.com', 'password': 'motdepasse'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_bad_credentials(self):
+        response = self.login('mauvais')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('access', response.json())
+        response = self.client.post('/api/login/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_saturated_pool_answers_503(self):
+        bound = settings.LOGIN_WORKERS + settings.LOGIN_MAX_PENDING
+        with mock.patch.object(login_executor, 'in_flight', bound):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_failures_are_rate_limited(self):
+        for _ in range(2):
+            self.assertEqual(self.login('mauvais').status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_successes_are_not_counted(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('mauvais').status_code, 401)
+
+    def test_quota_uses_forwarded_address(self):
+        for _ in range(2):
+            self.login('mauvais', HTTP_X_FORWARDED_FOR='203.0.113.1')
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.1').status_code, 429)
+        # Même proxy (REMOTE_ADDR), autre client ; une adresse forgée à gauche est ignorée
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.2').status_code, 200)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.1, 203.0.113.2').status_code, 200)
+
+
+@override_settings(LOGIN_WORKERS=1, LOGIN_MAX_PENDING=1)
+class LoginExecutorTests(SimpleTestCase):
+
+    async def test_waits_without_blocking_and_bounds_the_queue(self):
+        executor = LoginExecutor()
+        self.addCleanup(lambda: executor._executor and executor._executor.shutdown())
+        release = threading.Event()
+        # Un calcul en cours, un en file : la boucle d'événements reste libre pendant l'attente
+        first = asyncio.ensure_future(executor.run(release.wait, 5))
+        second = asyncio.ensure_future(executor.run(lambda: 'ok'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(executor.metrics()['running'], 1)
+        self.assertEqual(executor.metrics()['queued'], 1)
+        with self.assertRaises(LoginSaturated):
+            await executor.run(lambda: 'refusé')
+
+        release.set()
+        self.assertEqual(await asyncio.gather(first, second), [True, 'ok'])
+        metrics = executor.metrics()
+        self.assertEqual((metrics['completed'], metrics['rejected'], metrics['peak_in_flight']), (2, 1, 2))
+
+
+class AuthenticationCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+
+    def setUp(self):
+        user_cache.clear()
+        self.token = AccessToken.for_user(self.doctor.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_known_token_needs_no_query(self):
+        self.assertEqual(self.client.get('/api/protected/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/protected/').status_code, 200)
+
+    def test_saving_user_or_doctor_invalidates(self):
+        authentication = DoctorJWTAuthentication()
+        authentication.get_user(self.token)
+        user = User.objects.get(pk=self.doctor.user_id)
+        user.first_name = 'Renommé'
+        user.save()
+        self.assertEqual(authentication.get_user(self.token).first_name, 'Renommé')
+
+        doctor = Doctor.objects.get(pk=self.doctor.pk)
+        doctor.specialty = 'Cardiologie'
+        doctor.save()
+        self.assertEqual(authentication.get_user(self.token).doctor.specialty, 'Cardiologie')
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/protected/')
+        User.objects.filter(pk=self.doctor.user_id).update(is_active=False)
+        User.objects.get(pk=self.doctor.user_id).save()
+        self.assertEqual(self.client.get('/api/protected/').status_code, 401)
+
+    def test_each_request_gets_its_own_doctor(self):
+        authentication = DoctorJWTAuthentication()
+        first, second = authentication.get_user(self.token), authentication.get_user(self.token)
+        first.doctor.specialty = 'Modifiée'
+        self.assertIsNot(first.doctor, second.doctor)
+        self.assertIs(first.doctor.user, first)
+        self.assertNotEqual(authentication.get_user(self.token).doctor.specialty, 'Modifiée')
+
+
+@unittest.skipUnless(openpyxl, "openpyxl n'est pas installé")
+class PatientImportTests(TestCase):
+    SAMPLE = Path(settings.BASE_DIR) / 'Nouveau Feuille de calcul XLSX.xlsx'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+
+    def setUp(self):
+        job_root = tempfile.TemporaryDirectory()
+        self.addCleanup(job_root.cleanup)
+        job_settings = override_settings(JOBS_EAGER=True, JOB_ROOT=job_root.name)
+        job_settings.enable()
+        self.addCleanup(job_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/patients/import/', {'file': SimpleUploadedFile(name, content)}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 202)
+        return Job.objects.get(pk=response.data['id'])
+
+    def workbook(self, rows):
+        workbook = openpyxl.Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return content.getvalue()
+
+    def test_import_xlsx(self):
+        job = self.upload('patients.xlsx', self.workbook([
+            ('Prénom', 'Nom', 'Date de naissance', 'Groupe sanguin'),
+            ('Awa', 'Diallo', '12/03/1985', 'O+'),
+            ('Moussa', 'Traoré', None, None),
+            ('Sans nom', None, None, None),
+        ]))
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result['total'], 3)
+        self.assertEqual(job.result['created'], 2)
+        self.assertEqual([error['row'] for error in job.result['errors']], [4])
+
+        awa = Patient.objects.get(last_name='Diallo')
+        self.assertEqual(str(awa.date_of_birth), '1985-03-12')
+        self.assertEqual(set(self.doctor.assigned_patients.values_list('last_name', flat=True)), {'Diallo', 'Traoré'})
+        self.assertEqual(
+            Consultation.objects.filter(reason_for_consultation=INITIAL_CONSULTATION_REASON).count(), 2
+        )
+
+    def test_sample_file_without_name_columns_fails(self):
+        # Le classeur d'exemple du dépôt (identifiants et codes UUID) n'a pas de colonnes prénom / nom
+        job = self.upload(self.SAMPLE.name, self.SAMPLE.read_bytes())
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('prénom', job.error)
+        self.assertIsNone(job.result)
+        self.assertFalse(Patient.objects.exists())
+
+
+class FastJSONTests(TestCase):
+    DATA = {
+        'id': uuid.UUID('33f0e932-6589-4fe7-ae3b-1fce9c4180ab'),
+        'date': date(2025, 1, 2),
+        'created_at': datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+        'weight': Decimal('72.50'),
+        'name': 'Zoé\u2028Ndiaye',
+        'tags': ['a', None, 1, 2.5, True],
+        1: 'clé entière',
+    }
+
+    def test_renderer_matches_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.DATA), JSONRenderer().render(self.DATA))
+
+    def test_renderers_differ_only_in_float_notation_and_non_finite_values(self):
+        data = {**self.DATA, 'floats': [1e16, 1e-7, 0.1, 1 / 3, -0.0, 2 ** 53 + 0.5], 'huge': Decimal('1E+20')}
+        fast, drf = FastJSONRenderer().render(data), JSONRenderer().render(data)
+        self.assertNotEqual(fast, drf)
+        self.assertEqual(json.loads(fast), json.loads(drf))
+
+        # NaN / Infinity : null au lieu de l'erreur de JSONRenderer (STRICT_JSON)
+        for value in (float('nan'), float('inf'), Decimal('-Infinity')):
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render({'value': value}), b'{"value":null}')
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({'value': value})
+
+        # Sans STRICT_JSON, rendu délégué à DRF : mêmes jetons NaN / Infinity
+        lenient = FastJSONRenderer()
+        lenient.strict = False
+        data = {'value': float('nan'), 'limit': float('inf')}
+        drf = JSONRenderer()
+        drf.strict = False
+        self.assertEqual(lenient.render(data), drf.render(data))
+
+    def test_parser_matches_drf(self):
+        content = JSONRenderer().render(self.DATA)
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(content)), JSONParser().parse(io.BytesIO(content)))
+
+    def test_invalid_body_is_a_400(self):
+        client = APIClient()
+        client.force_authenticate(create_doctor(0).user)
+        response = client.post('/api/patients/', b'{"first_name": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_row_list_matches_field_serialization(self):
+        doctor = create_doctor(0)
+        patient = Patient.objects.create(first_name='Awa', last_name='Diallo', date_of_birth=date(1985, 3, 12))
+        Patient.objects.create(first_name='Moussa', last_name='Traoré')
+        Consultation.objects.create(
+            patient=patient, doctor=doctor, reason_for_consultation='Contrôle', weight=Decimal('72.5'),
+        )
+        for serializer_class, queryset in [
+            (PatientListSerializer, Patient.objects.order_by('pk')),
+            (SimpleConsultationSerializer, Consultation.objects.order_by('pk')),
+        ]:
+            expected = serializers.ListSerializer(list(queryset), child=serializer_class()).data
+            self.assertEqual(serializer_class(queryset.all(), many=True).data, expected)
+            self.assertEqual(serializer_class(list(queryset), many=True).data, expected)
+
+
+class CompressionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        for index in range(40):
+            patient = Patient.objects.create(first_name=f'Patient{index}', last_name='Test')
+            patient.assigned_doctors.add(cls.doctor)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def get(self, url, encoding=None):
+        headers = {'HTTP_ACCEPT_ENCODING': encoding} if encoding is not None else {}
+        return self.client.get(url, **headers)
+
+    def assertCompressed(self, response, encoding, decompress, expected):
+        self.assertEqual(response['Content-Encoding'], encoding)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(expected))
+        self.assertEqual(decompress(response.content), expected)
+
+    def test_gzip(self):
+        expected = self.get('/api/patients/').content
+        response = self.get('/api/patients/', 'gzip, deflate')
+        self.assertCompressed(response, 'gzip', gzip.decompress, expected)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_compressed_etag_is_weak(self):
+        patient = Patient.objects.create(first_name='Awa', last_name='Diallo', medical_history='Asthme. ' * 300)
+        patient.assigned_doctors.add(self.doctor)
+        url = f'/api/patients/{patient.unique_id}/'
+        etag = self.get(url)['ETag']
+        response = self.get(url, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/' + etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @unittest.skipUnless(brotli, "brotli n'est pas installé")
+    def test_brotli_preferred(self):
+        expected = self.get('/api/patients/').content
+        response = self.get('/api/patients/', 'gzip, deflate, br')
+        self.assertCompressed(response, 'br', brotli.decompress, expected)
+
+    def test_identity(self):
+        for encoding in (None, 'identity', 'gzip;q=0, br;q=0'):
+            response = self.get('/api/patients/', encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), encoding)
+            self.assertEqual(len(json.loads(response.content)['results']), 40)
+
+    def test_small_and_excluded_responses_are_not_compressed(self):
+        self.assertFalse(self.get('/api/protected/', 'gzip').has_header('Content-Encoding'))
+        with override_settings(COMPRESSION_EXCLUDED_PATHS=('/api/patients/',)):
+            self.assertFalse(self.get('/api/patients/', 'gzip').has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        response = self.get('/api/sync/', 'gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['patients']), 40)
+
+
+class SparseFieldsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+        Consultation.objects.create(patient=cls.patient, doctor=cls.doctor, reason_for_consultation='Contrôle')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def test_fields_and_expand(self):
+        response = self.client.get('/api/patients/?fields=unique_id,first_name')
+        self.assertEqual(set(response.data['results'][0]), {'unique_id', 'first_name'})
+
+        response = self.client.get(f'/api/patients/{self.patient.unique_id}/?expand=')
+        self.assertNotIn('referrals', response.data)
+        self.assertIn('last_name', response.data)
+
+    def test_sync_rows_ignore_sparse_fields(self):
+        full = json.loads(b''.join(self.client.get('/api/sync/').streaming_content))
+        sparse = json.loads(b''.join(self.client.get('/api/sync/?fields=id&expand=').streaming_content))
+        for key in ('patients', 'consultations'):
+            self.assertEqual(sparse[key], full[key])
+        self.assertIn('reason_for_consultation', sparse['consultations'][0])
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        workplace = Workplace.objects.create(name='Clinique Test', address='1 rue de la Paix')
+        cls.doctor = create_doctor(0, workplace)
+        cls.colleague = create_doctor(1, workplace)
+        cls.workplace = workplace
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+        Referral.objects.create(
+            patient=cls.patient, referred_to=cls.colleague, referred_by=cls.doctor,
+            specialty_requested='Cardiologie', reason_for_referral='Avis',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+        self.url = f'/api/patients/{self.patient.unique_id}/'
+
+    def assertModified(self, etag):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_record_changes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle')
+        etag = self.assertModified(etag)['ETag']
+        Patient.objects.get(pk=self.patient.pk).save()
+        self.assertModified(etag)
+
+    def test_representations_have_distinct_etags(self):
+        full = self.client.get(self.url)['ETag']
+        sparse = self.client.get(self.url + '?fields=first_name')
+        self.assertNotEqual(sparse['ETag'], full)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=full).status_code, 304)
+        self.assertEqual(self.client.get(self.url + '?fields=first_name', HTTP_IF_NONE_MATCH=full).status_code, 200)
+
+    def test_referred_doctor_changes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        user = User.objects.get(pk=self.colleague.user_id)
+        user.last_name = 'Renommé'
+        user.save()
+        response = self.assertModified(etag)
+        self.assertEqual(response.data['referrals'][0]['referred_to_details']['full_name'], 'Prénom1 Renommé')
+
+        colleague = Doctor.objects.get(pk=self.colleague.pk)
+        colleague.specialty = 'Cardiologie'
+        colleague.save()
+        etag = self.assertModified(response['ETag'])['ETag']
+
+        self.workplace.name = 'Clinique Renommée'
+        self.workplace.save()
+        etag = self.assertModified(etag)['ETag']
+
+        colleague.workplaces.clear()
+        response = self.assertModified(etag)
+        self.assertEqual(response.data['referrals'][0]['referred_to_details']['workplaces'], [])
+
+    def test_referring_doctor_deletion_changes_the_etag(self):
+        client = APIClient()
+        client.force_authenticate(self.colleague.user)
+        self.patient.assigned_doctors.add(self.colleague)
+        etag = client.get(self.url)['ETag']
+        self.doctor.delete()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['referrals'][0]['referred_by_details'])
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2)
+class JobLeaseTests(TestCase):
+
+    def claim(self, ago):
+        Job.objects.create(kind=Job.KIND_REBUILD_STATS)
+        job = claim_next('test:1')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=django_timezone.now() - timedelta(seconds=ago))
+        return job
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = self.claim(ago=600)
+        self.assertEqual(requeue_stale(300), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.STATUS_PENDING, ''))
+
+        job = claim_next('test:2')
+        self.assertEqual(job.attempts, 2)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=django_timezone.now() - timedelta(seconds=600))
+        self.assertEqual(requeue_stale(300), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_heartbeat_keeps_the_lease(self):
+        job = self.claim(ago=600)
+        heartbeat([job.pk])
+        self.assertEqual(requeue_stale(300), (0, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+
+    def test_abandon_leaves_finished_jobs_alone(self):
+        job = self.claim(ago=0)
+        Job.objects.filter(pk=job.pk).update(status=Job.STATUS_SUCCEEDED)
+        self.assertEqual(abandon([job.pk], 'interrompu'), (0, 0))
+
+
+class PatientNameSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        names = [('Hélène', 'Dupont'), ('Helene', 'Martin'), ('Jean-Noël', 'Hélias'), ('Zoé', 'Lefèvre'), ('Bérénice', 'Cœur')]
+        cls.patients = {}
+        for first_name, last_name in names:
+            patient = Patient.objects.create(first_name=first_name, last_name=last_name)
+            patient.assigned_doctors.add(cls.doctor)
+            cls.patients[last_name] = patient
+        Patient.objects.create(first_name='Hélène', last_name='Invisible')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def search(self, term):
+        response = self.client.get('/api/doctors/me/patients/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['last_name'] for row in response.data['results'])
+
+    def test_prefix_and_accent_insensitive_matching(self):
+        self.assertEqual(fold_name('  Hélène   CŒUR '), 'helene coeur')
+        self.assertEqual(self.search('helene'), ['Dupont', 'Martin'])
+        self.assertEqual(self.search('HÉL'), ['Dupont', 'Hélias', 'Martin'])
+        self.assertEqual(self.search('dupont hel'), ['Dupont'])
+        self.assertEqual(self.search('zoe lefe'), ['Lefèvre'])
+        self.assertEqual(self.search('coeur'), ['Cœur'])
+        self.assertEqual(self.search('ène'), [])
+
+        patient = self.patients['Martin']
+        patient.last_name = 'Élisée'
+        patient.save()
+        self.assertEqual(self.search('elis'), ['Élisée'])
+
+    def test_prefix_search_uses_the_name_indexes(self):
+        plan = search_patients(Patient.objects.all(), 'hel').explain()
+        self.assertIn('patient_search_name_idx', plan)
+        self.assertIn('patient_search_rev_idx', plan)
+
+@override_settings(SYNC_OVERLAP=0)
+class SyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.colleague = create_doctor(1)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+        cls.consultation = Consultation.objects.create(patient=cls.patient, doctor=cls.doctor, reason_for_consultation='Contrôle')
+        cls.note = Note.objects.create(author=cls.doctor, patient=cls.patient, content='À revoir')
+        cls.hidden = Patient.objects.create(first_name='Moussa', last_name='Traoré')
+        cls.hidden.assigned_doctors.add(cls.colleague)
+        cls.hidden_consultation = Consultation.objects.create(
+            patient=cls.hidden, doctor=cls.colleague, reason_for_consultation='Bilan',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def sync(self, cursor=None):
+        response = self.client.get('/api/sync/', {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        return json.loads(b''.join(response.streaming_content))
+
+    def ids(self, data, key):
+        return [row.get('id', row.get('unique_id')) for row in data[key]]
+
+    def test_full_then_incremental(self):
+        full = self.sync()
+        self.assertTrue(full['full'])
+        self.assertEqual(self.ids(full, 'patients'), [str(self.patient.pk)])
+        self.assertEqual(self.ids(full, 'consultations'), [self.consultation.pk])
+        self.assertEqual(self.ids(full, 'notes'), [self.note.pk])
+
+        delta = self.sync(full['cursor'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(
+            {key: value for key, value in delta.items() if value and key not in ('cursor', 'full')}, {},
+        )
+
+        # Modification, suppression et patient devenu visible avec tout son dossier
+        Consultation.objects.filter(pk=self.consultation.pk).update(diagnosis='Grippe', updated_at=django_timezone.now())
+        note_id = self.note.pk
+        self.note.delete()
+        self.hidden.assigned_doctors.add(self.doctor)
+        delta = self.sync(delta['cursor'])
+        self.assertEqual(delta['deleted'], [{'type': 'note', 'id': str(note_id)}])
+        self.assertEqual(self.ids(delta, 'patients'), [str(self.hidden.pk)])
+        self.assertCountEqual(self.ids(delta, 'consultations'), [self.consultation.pk, self.hidden_consultation.pk])
+
+        # Patient qui n'est plus visible : trace de suppression
+        self.hidden.assigned_doctors.remove(self.doctor)
+        delta = self.sync(delta['cursor'])
+        self.assertEqual(delta['deleted'], [{'type': 'patient', 'id': str(self.hidden.pk)}])
+        self.assertEqual(self.ids(delta, 'consultations'), [])
+
+    def test_record_moved_to_another_patient(self):
+        procedure = MedicalProcedure.objects.create(
+            patient=self.patient, procedure_type='Radiographie', procedure_date=date(2025, 1, 1), operator=self.colleague,
+        )
+        cursors = {}
+
+        def delta(doctor):
+            self.client.force_authenticate(doctor.user)
+            data = self.sync(cursors.get(doctor))
+            cursors[doctor] = data['cursor']
+            return data['deleted'], self.ids(data, 'procedures')
+
+        delta(self.doctor)
+        delta(self.colleague)
+
+        # Vers un patient que seul le collègue voit : le médecin perd l'acte
+        procedure.patient = self.hidden
+        procedure.save()
+        self.assertEqual(delta(self.doctor), ([{'type': 'procedure', 'id': str(procedure.pk)}], []))
+        self.assertEqual(delta(self.colleague), ([], [procedure.pk]))
+
+        # Retour vers le patient d'origine, le médecin voyant désormais les deux : seul le collègue l'oublie
+        self.hidden.assigned_doctors.add(self.doctor)
+        delta(self.doctor)
+        procedure.patient = self.patient
+        procedure.save()
+        self.assertEqual(delta(self.doctor), ([], [procedure.pk]))
+        self.assertEqual(delta(self.colleague), ([{'type': 'procedure', 'id': str(procedure.pk)}], []))
+
+    def test_invalid_and_expired_cursors(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'abc'}).status_code, 400)
+        expired = django_timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION + 1)
+        response = self.client.get('/api/sync/', {'since': make_cursor(expired)})
+        self.assertEqual(response.status_code, 410)
+
+        # Les traces plus anciennes que la conservation sont purgées
+        Tombstone.objects.create(kind=Tombstone.KIND_NOTE, object_id='1', doctor=self.doctor)
+        Tombstone.objects.update(deleted_at=expired)
+        call_command('purge_tombstones', stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.colleague = create_doctor(1)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo', medical_history='Hépatite A en 2010')
+        cls.patient.assigned_doctors.add(cls.doctor)
+        cls.other = Patient.objects.create(first_name='Moussa', last_name='Traoré', medical_history='Hépatite B')
+        cls.other.assigned_doctors.add(cls.colleague)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(row['kind'], row['id'], row['field']) for row in response.data['results']], response.data['results']
+
+    def test_results_are_scoped_ranked_and_highlighted(self):
+        strong = Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle',
+            diagnosis='Hepatite virale, suivi hépatite <chronique>',
+        )
+        weak = Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle',
+            medical_report='Bilan complet sans particularité. ' * 10 + 'Antécédent d\'hépatite.',
+        )
+        note = Note.objects.create(author=self.doctor, content='Contrôle hépatique dans un mois')
+        Note.objects.create(author=self.colleague, patient=self.patient, content='Hépatite à surveiller')
+
+        found, rows = self.search('hepat')
+        self.assertEqual(found[0], ('consultation', strong.pk, 'diagnosis'))
+        self.assertCountEqual(found, [
+            ('consultation', strong.pk, 'diagnosis'), ('consultation', weak.pk, 'medical_report'),
+            ('note', note.pk, 'content'), ('patient', self.patient.pk, 'medical_history'),
+        ])
+        # Texte échappé, passage trouvé entre <mark>
+        self.assertIn('<mark>Hepatite</mark>', rows[0]['snippet'])
+        self.assertIn('&lt;chronique&gt;', rows[0]['snippet'])
+
+        # Syntaxe FTS5 de l'utilisateur ignorée
+        self.assertEqual(self.search('hépatite OR "')[0], [])
+        self.assertEqual(self.client.get('/api/search/', {'q': ' ? '}).status_code, 400)
+
+    def test_index_follows_updates_and_deletions(self):
+        consultation = Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle', medications='Paracétamol',
+        )
+        self.assertEqual(self.search('paracetamol')[0], [('consultation', consultation.pk, 'medications')])
+        consultation.medications = 'Ibuprofène'
+        consultation.save()
+        self.assertEqual(self.search('paracetamol')[0], [])
+        self.assertEqual(len(self.search('ibuprofene')[0]), 1)
+        consultation.delete()
+        self.assertEqual(self.search('ibuprofene')[0], [])
+
+        # Patient qui n'est plus suivi : ses documents disparaissent des résultats
+        self.patient.assigned_doctors.remove(self.doctor)
+        self.assertEqual(self.search('hepatite')[0], [])
+
+class AttachmentStorageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(MEDIA_ROOT=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def consultation(self, content, filename='bilan.pdf'):
+        return Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle',
+            attachments=SimpleUploadedFile(filename, content, content_type='application/pdf'),
+        )
+
+    def blob_files(self):
+        return sorted(path.name for path in Path(settings.MEDIA_ROOT, BLOB_DIR).rglob('*') if path.is_file())
+
+    def gc(self, *args):
+        output = io.StringIO()
+        call_command('gc_attachments', '--grace', '0', *args, stdout=output)
+        return output.getvalue()
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.consultation(b'%PDF bilan sanguin')
+        second = self.consultation(b'%PDF bilan sanguin', 'bilan (1).pdf')
+        procedure = MedicalProcedure.objects.create(
+            patient=self.patient, procedure_type='Radiographie', procedure_date=date(2025, 1, 1),
+            attachments=SimpleUploadedFile('bilan.pdf', b'%PDF bilan sanguin'),
+        )
+        digest = hashlib.sha256(b'%PDF bilan sanguin').hexdigest()
+        self.assertEqual(first.attachments.name, f'cas/{digest}/bilan.pdf')
+        self.assertEqual(second.attachments.name, f'cas/{digest}/bilan_1.pdf')
+        self.assertEqual(self.blob_files(), [digest])
+        self.assertEqual(first.attachments.read(), b'%PDF bilan sanguin')
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual((blob.ref_count, blob.size), (3, 18))
+
+        # Remplacement puis suppressions : les références suivent
+        procedure.attachments = SimpleUploadedFile('autre.pdf', b'%PDF autre')
+        procedure.save()
+        first.delete()
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 1)
+        self.assertEqual(AttachmentBlob.objects.count(), 2)
+        second.delete()
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 0)
+
+        self.assertIn('1 blob(s)', self.gc())
+        self.assertFalse(AttachmentBlob.objects.filter(pk=digest).exists())
+        self.assertEqual(self.blob_files(), [hashlib.sha256(b'%PDF autre').hexdigest()])
+
+    def test_gc_recounts_references_before_collecting(self):
+        consultation = self.consultation(b'%PDF compte rendu')
+        # Compteur faussé (mise à jour sans signal) : le blob ne doit pas être supprimé
+        AttachmentBlob.objects.update(ref_count=0)
+        output = self.gc('--dry-run')
+        self.assertIn('1 compteur(s)', output)
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 0)
+
+        output = self.gc()
+        self.assertIn('0 blob(s)', output)
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 1)
+        self.assertEqual(consultation.attachments.read(), b'%PDF compte rendu')
+
+        # Fichier inconnu de la table : supprimé
+        stray = Path(settings.MEDIA_ROOT, BLOB_DIR, 'ff', 'f' * 64)
+        stray.parent.mkdir(parents=True)
+        stray.write_bytes(b'orphelin')
+        old = time.time() - 60
+        os.utime(stray, (old, old))
+        self.assertIn('1 fichier(s) orphelin(s)', self.gc())
+        self.assertFalse(stray.exists())
+
+    def orphan(self, content):
+        """Blob sans référence dont le fichier est encore sur le disque."""
+        self.consultation(content).delete()
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 0)
+        return digest
+
+    def test_upload_during_collection_keeps_the_blob(self):
+        digest = self.orphan(b'%PDF radiographie')
+        uploads = []
+        quarantine = GcAttachmentsCommand._quarantine
+
+        def quarantine_then_upload(command, path):
+            # L'envoi arrive entre la mise en quarantaine et la suppression de la ligne
+            quarantined = quarantine(command, path)
+            uploads.append(self.consultation(b'%PDF radiographie'))
+            return quarantined
+
+        with mock.patch.object(GcAttachmentsCommand, '_quarantine', quarantine_then_upload):
+            self.assertIn('0 blob(s)', self.gc())
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 1)
+        self.assertEqual(self.blob_files(), [digest])
+        self.assertEqual(uploads[0].attachments.read(), b'%PDF radiographie')
+
+    def test_collection_during_upload_keeps_the_blob(self):
+        digest = self.orphan(b'%PDF scanner')
+        register = AttachmentBlobManager.register
+
+        def register_then_collect(manager, *args):
+            # Le ramassage passe entre la déclaration du blob et le test d'existence du fichier
+            register(manager, *args)
+            self.assertIn('1 blob(s)', self.gc())
+
+        # Sans délai de grâce, le balayage prendrait aussi le fichier temporaire de l'envoi en cours
+        with mock.patch.object(AttachmentBlobManager, 'register', register_then_collect), \
+                mock.patch.object(GcAttachmentsCommand, '_sweep_files', return_value=(0, 0)):
+            consultation = self.consultation(b'%PDF scanner')
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 1)
+        self.assertEqual(self.blob_files(), [digest])
+        self.assertEqual(consultation.attachments.read(), b'%PDF scanner')
+
+    def test_interrupted_collection_is_restored(self):
+        consultation = self.consultation(b'%PDF ordonnance')
+        path = Path(consultation.attachments.path)
+        quarantined = path.with_name(path.name + '.gc')
+        path.rename(quarantined)
+        old = time.time() - 60
+        os.utime(quarantined, (old, old))
+        self.gc()
+        self.assertEqual(consultation.attachments.read(), b'%PDF ordonnance')
+
+class AttachmentDownloadTests(TestCase):
+    # Le stockage normalise le nom (compte_rendu_é.pdf) ; l'accent impose filename*=
+    FILENAME = 'compte rendu é.pdf'
+    CONTENT = bytes(range(256)) * 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        consultation = Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_consultation='Contrôle',
+            attachments=SimpleUploadedFile(self.FILENAME, self.CONTENT),
+        )
+        self.url = f'/api/attachments/consultation/{consultation.pk}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def assertDisposition(self, response):
+        self.assertEqual(
+            response['Content-Disposition'], "inline; filename*=utf-8''compte_rendu_%C3%A9.pdf"
+        )
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertDisposition(response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[100:200])
+        self.assertDisposition(response)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.CONTENT)}-').status_code, 416)
+        # If-Range périmé : fichier complet
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"autre"').status_code, 200)
+
+    @override_settings(ATTACHMENT_SENDFILE='x-sendfile')
+    def test_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].startswith(settings.MEDIA_ROOT))
+        self.assertDisposition(response)
+
+    def test_stream_file_escapes_filename(self):
+        path = Path(settings.MEDIA_ROOT) / 'export.pdf'
+        path.write_bytes(b'%PDF')
+        response = stream_file(path, 'fiche "Zoé".pdf')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''fiche%20%22Zo%C3%A9%22.pdf")
+        response.close()
+
+
+class AttachmentDerivativeTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor(0)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+
+    def setUp(self):
+        for name in ('MEDIA_ROOT', 'JOB_ROOT'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            overridden = override_settings(**{name: directory.name}, JOBS_EAGER=True)
+            overridden.enable()
+            self.addCleanup(overridden.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def image(self, color):
+        content = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(content, 'PNG')
+        return SimpleUploadedFile('radio.png', content.getvalue(), content_type='image/png')
+
+    def upload(self, color):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/consultations/', {
+                'patient': str(self.patient.pk), 'reason_for_consultation': 'Contrôle', 'attachments': self.image(color),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_derivatives_are_recorded_and_served(self):
+        pk = self.upload('red')
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual(sorted(blob.derivatives), ['preview', 'thumb'])
+
+        data = self.client.get(f'/api/consultations/{pk}/').data
+        self.assertEqual(data['attachments'], f'http://testserver/api/attachments/consultation/{pk}/')
+        self.assertEqual(data['attachments'], data['attachments_url'])
+        self.assertNotIn('/media/', str(data))
+        self.assertEqual(self.client.get(data['attachments_thumbnail_url']).status_code, 200)
+
+        # Dérivé non (encore) produit : pas d'URL
+        AttachmentBlob.objects.update(derivatives=[])
+        self.assertIsNone(self.client.get(f'/api/consultations/{pk}/').data['attachments_thumbnail_url'])
+
+    def test_list_reads_derivatives_without_per_row_queries(self):
+        self.upload('red')
+        with self.assertQueryBudget(10) as small:
+            self.client.get('/api/consultations/')
+        for color in ('green', 'blue', 'white'):
+            self.upload(color)
+        with self.assertQueryBudget(10) as large:
+            response = self.client.get('/api/consultations/')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertTrue(all(row['attachments_preview_url'] for row in response.data['results']))
+
+
+class PatientExportCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.workplace = Workplace.objects.create(name='Clinique A', address='Rue 1')
+        cls.doctor = create_doctor(0, cls.workplace)
+        cls.colleague = create_doctor(1)
+        cls.patient = Patient.objects.create(first_name='Awa', last_name='Diallo')
+        cls.patient.assigned_doctors.add(cls.doctor)
+        Consultation.objects.create(patient=cls.patient, doctor=cls.colleague, reason_for_consultation='Contrôle')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(EXPORT_ROOT=directory.name, JOBS_EAGER=True)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def export(self, status=202):
+        # Fichier absent : travail créé (202), exécuté au commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(f'/api/patients/{self.patient.pk}/export.pdf/')
+        self.assertEqual(response.status_code, status)
+        response.close()
+        return os.listdir(settings.EXPORT_ROOT)
+
+    def test_cached_file_is_reused(self):
+        files = self.export()
+        self.assertEqual(len(files), 1)
+        jobs = Job.objects.count()
+        self.assertEqual(self.export(status=200), files)
+        self.assertEqual(Job.objects.count(), jobs)
+
+    def test_repeated_requests_share_the_pending_job(self):
+        url = f'/api/patients/{self.patient.pk}/export.pdf/'
+        # Le travail n'est pas encore exécuté : les GET suivants retrouvent le même
+        first, second = self.client.get(url), self.client.get(url)
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Job.objects.filter(kind=Job.KIND_EXPORT_PDF).count(), 1)
+
+        # Nouvelle version du dossier : un autre travail
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor, reason_for_consultation='Suivi')
+        self.assertNotEqual(self.client.get(url).data['id'], first.data['id'])
+        self.assertEqual(Job.objects.filter(kind=Job.KIND_EXPORT_PDF).count(), 2)
+
+        # Travail terminé mais fichier absent (expiré, purgé) : un nouveau GET en relance un
+        Job.objects.update(status=Job.STATUS_SUCCEEDED)
+        self.client.get(url)
+        self.assertEqual(Job.objects.filter(kind=Job.KIND_EXPORT_PDF).count(), 3)
+
+    def test_doctor_changes_produce_a_new_file(self):
+        changes = [
+            lambda: User.objects.filter(pk=self.doctor.user_id).update(last_name='Renommé'),
+            lambda: Doctor.objects.filter(pk=self.doctor.pk).update(specialty='Cardiologie'),
+            lambda: self.doctor.workplaces.add(Workplace.objects.create(name='Clinique B', address='Rue 2')),
+            lambda: Workplace.objects.filter(pk=self.workplace.pk).update(name='Clinique A bis'),
+            # Auteur d'une consultation, affiché dans le PDF
+            lambda: User.objects.filter(pk=self.colleague.user_id).update(first_name='Renommé'),
+        ]
+        files = self.export()
+        for change in changes:
+            change()
+            current = self.export()
+            self.assertEqual(len(current), 1)
+            self.assertNotEqual(current, files)
+            files = current
+
+    def test_expired_files_are_regenerated_and_purged(self):
+        path = patient_record_path(self.patient, self.doctor)
+        self.assertEqual(cached_patient_record(self.patient, self.doctor), path)
+        expired = time.time() - settings.EXPORT_MAX_AGE - 60
+        os.utime(path, (expired, expired))
+        self.assertIsNone(cached_patient_record(self.patient, self.doctor))
+
+        # Export d'un patient supprimé depuis : seul le fichier expiré disparaît
+        orphan = Path(settings.EXPORT_ROOT) / 'patient-ancien-1-1-0.pdf'
+        orphan.write_bytes(b'%PDF')
+        os.utime(orphan, (expired, expired))
+        other = Patient.objects.create(first_name='Moussa', last_name='Traoré')
+        recent = patient_record_path(other, self.doctor)
+        call_command('purge_exports', stdout=io.StringIO())
+        self.assertEqual(os.listdir(settings.EXPORT_ROOT), [os.path.basename(recent)])
+
+        self.assertEqual(patient_record_path(self.patient, self.doctor), path)
+        self.assertEqual(cached_patient_record(self.patient, self.doctor), path)
@@ -0,0 +1,113 @@
+"""
+Miniatures et aperçus des pièces jointes image (scans, photos d'examen).
+
+Les listes de consultations et d'actes n'ont besoin que d'une vignette, et l'écran de détail
+d'une image lisible à l'écran : ces dérivés JPEG sont produits après l'envoi par un travail de
+fond (Job.KIND_THUMBNAILS, exécuté par `runworker`) et rangés à côté du fichier d'origine.
+Pour un blob adressé par contenu (storage.py) : blobs/ab/<empreinte>.thumb.jpg, partagé par
+toutes les pièces jointes identiques ; pour un fichier classique : <nom>.thumb.jpg.
+Les dérivés produits sont notés sur le blob (AttachmentBlob.derivatives) : les sérialiseurs
+savent quelles URL d'aperçu rendre sans interroger le disque.
+"""
+import os
+import tempfile
+
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
+from PIL import Image, ImageOps
+
+from .models import AttachmentBlob
+from .storage import PREFIX, attachment_storage, digest_of
+
+# Dérivé -> taille maximale (largeur, hauteur) et qualité JPEG
+VARIANTS = {
+    'thumb': ((256, 256), 75),
+    'preview': ((1280, 1280), 82),
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def is_image(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_name(name, variant):
+    """Nom (relatif à MEDIA_ROOT) du dérivé `variant` de la pièce jointe `name`."""
+    digest = digest_of(name)
+    base = attachment_storage.blob_name(digest) if digest else os.path.splitext(name)[0]
+    return f"{base}.{variant}.jpg"
+
+
+def derivative_exists(name, variant):
+    return is_image(name) and os.path.exists(attachment_storage.path(derivative_name(name, variant)))
+
+
+def record_derivatives(name):
+    """Note sur le blob de `name` les dérivés présents sur le disque et retourne leur liste."""
+    variants = [variant for variant in VARIANTS if derivative_exists(name, variant)]
+    digest = digest_of(name)
+    if digest:
+        AttachmentBlob.objects.filter(pk=digest).update(derivatives=variants)
+    return variants
+
+
+def recorded_derivatives(name):
+    """
+    Dérivés disponibles pour `name` : ceux notés sur son blob (une requête), ou ceux présents
+    sur le disque pour un fichier classique, sans blob.
+    """
+    digest = digest_of(name)
+    if not is_image(name):
+        return []
+    if digest is None:
+        return [variant for variant in VARIANTS if derivative_exists(name, variant)]
+    return AttachmentBlob.objects.filter(pk=digest).values_list('derivatives', flat=True).first() or []
+
+
+def with_derivatives(queryset, field):
+    """
+    Annote chaque objet de `queryset` avec `<field>_derivatives`, les dérivés notés sur le blob
+    de sa pièce jointe `field` (sous-requête sur la clé primaire de AttachmentBlob).
+    """
+    digest = Substr(OuterRef(field), len(PREFIX) + 1, 64)
+    blobs = AttachmentBlob.objects.filter(digest=digest).values('derivatives')[:1]
+    return queryset.annotate(**{f'{field}_derivatives': Subquery(blobs)})
+
+
+def _render(image, path, size, quality):
+    copy = image.copy()
+    copy.thumbnail(size, Image.Resampling.LANCZOS)
+    directory = os.path.dirname(path)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            copy.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def generate_derivatives(name):
+    """
+    Produit les dérivés manquants de la pièce jointe `name` et retourne la liste des dérivés
+    écrits. Le fichier d'origine n'est décodé qu'une fois, à la plus grande taille nécessaire.
+    """
+    missing = {
+        variant: attachment_storage.path(derivative_name(name, variant))
+        for variant in VARIANTS
+        if not os.path.exists(attachment_storage.path(derivative_name(name, variant)))
+    }
+    if not missing:
+        record_derivatives(name)
+        return []
+    with Image.open(attachment_storage.path(name)) as image:
+        # JPEG : décodage directement à une résolution réduite (bien plus rapide sur un scan)
+        image.draft('RGB', max(VARIANTS[variant][0] for variant in missing))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    for variant, path in missing.items():
+        size, quality = VARIANTS[variant]
+        _render(image, path, size, quality)
+    record_derivatives(name)
+    return list(missing)
@@ -5,7 +5,7 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 from .views import (
-    ProtectedView, DoctorRegisterView, UserLoginView,
+    ProtectedView, DoctorRegisterView, UserLoginView, LoginMetricsView,
     DoctorProfileUpdateView, DoctorProfileView,
     DoctorPatientListView,
     PatientViewSet, DoctorViewSet, AppointmentViewSet, ConsultationViewSet,
@@ -15,7 +15,8 @@ from .views import (
     NoteViewSet, ForumPostViewSet, ForumCommentViewSet, WorkplaceViewSet, DeletedAppointmentsListView,
     DoctorStatsView, DoctorPatientStatsView,
     # Import de la nouvelle vue
-    GlobalStatsView 
+    GlobalStatsView,
+    StatsRebuildView, JobViewSet, AttachmentDownloadView, SearchView, SyncView
 )
 
 router = DefaultRouter()
@@ -30,9 +31,11 @@ router.register(r'workplaces', WorkplaceViewSet, basename='workplace')
 router.register(r'notes', NoteViewSet, basename='note')
 router.register(r'forum/posts', ForumPostViewSet, basename='forum-post')
 router.register(r'forum/comments', ForumCommentViewSet, basename='forum-comment')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('login/', UserLoginView.as_view(), name='login'),
+    path('login/metrics/', LoginMetricsView.as_view(), name='login-metrics'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/doctor/', DoctorRegisterView.as_view(), name='doctor_register'),
     path('profile/', DoctorProfileView.as_view(), name='profile_detail'),
@@ -44,6 +47,11 @@ urlpatterns = [
     
     # NOUVELLE ROUTE POUR LES STATISTIQUES GLOBALES
     path('stats/global/', GlobalStatsView.as_view(), name='global-stats'),
+    path('stats/rebuild/', StatsRebuildView.as_view(), name='stats-rebuild'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('attachments/<str:kind>/<int:pk>/', AttachmentDownloadView.as_view(), name='attachment-download'),
+    path('attachments/<str:kind>/<int:pk>/<str:variant>/', AttachmentDownloadView.as_view(), name='attachment-derivative'),
     
     path('', include(router.urls)), 
     path('protected/', ProtectedView.as_view(), name='protected'),
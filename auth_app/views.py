@@ -1,22 +1,45 @@
 # Fichier : votre_app/views.py
 
+import hashlib
+import json
+import math
+import mimetypes
+import os
+from datetime import date
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
 from django.db import transaction, IntegrityError
+from django.db.models.fields.files import FieldFile
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date
+from django.utils.http import content_disposition_header, http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets, generics, status, serializers
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import MultiPartParser
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q, Count, F, Value
-from django.db.models.functions import Concat # Import de Concat pour le nom complet
+from django.db.models import Q, Count, F, Prefetch, Window
+from django.db.models.functions import RowNumber
 import uuid
 
 from .models import (
     Patient, Doctor, Appointment, Consultation, MedicalProcedure,
-    Referral, ForumPost, ForumComment, Workplace, DeletedAppointment, Note
+    Referral, ForumPost, ForumComment, Workplace, DeletedAppointment, Note, StatsCounter, Job, PatientVisibility,
+    fold_name,
 )
 from .serializers import (
     PatientSerializer, DoctorSerializer, AppointmentSerializer, ConsultationSerializer,
@@ -25,9 +48,57 @@ from .serializers import (
     PatientListSerializer, UserLoginSerializer, WorkplaceSerializer, DoctorUpdateSerializer,
     DoctorRegistrationSerializer, DeletedAppointmentSerializer, NoteSerializer,
     # Import du nouveau Serializer pour les stats
-    GlobalStatsSerializer 
+    GlobalStatsSerializer,
+    JobSerializer
 )
 from .permissions import IsDoctor, IsCreator
+from .attachments import serve_attachment
+from .thumbnails import VARIANTS, derivative_exists, derivative_name
+from .exports import cached_patient_record, patient_record_name
+from .imports import INITIAL_CONSULTATION_REASON, ImportFormatError, check_filename
+from .signals import bulk_post_create
+from .login import LoginSaturated, client_ip, login_executor, login_limiter, login_metrics
+from .stats import workplace_statistics
+from . import cache, jobs, search, sync
+
+
+def parse_query_date(request, name):
+    """Lit un paramètre de requête optionnel au format AAAA-MM-JJ."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise serializers.ValidationError({name: "Date invalide, format attendu : AAAA-MM-JJ."})
+    return parsed
+
+def visible_patients(doctor):
+    """
+    Patients visibles par le médecin, lus depuis la table de visibilité matérialisée.
+    Une seule jointure indexée, sans DISTINCT : chaque couple (médecin, patient) est unique.
+    Trié par ligne de visibilité décroissante, ce qui sert la pagination par l'index (doctor_id, id).
+    """
+    return Patient.objects.filter(visibilities__doctor=doctor).annotate(
+        visibility_id=F('visibilities__id')
+    ).order_by('-visibility_id')
+
+def prefix_filter(field, prefix):
+    """
+    « field commence par prefix », exprimé en intervalle [prefix, prefix suivant[ : SQLite le sert
+    par un parcours de plage de l'index, là où LIKE 'prefix%' (insensible à la casse) lit toute la table.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+def search_patients(queryset, term):
+    """Patients dont le nom ou le prénom (ou « nom prénom », « prénom nom ») commence par `term`, accents ignorés."""
+    term = fold_name(term)
+    if not term:
+        return queryset
+    return queryset.filter(prefix_filter('search_name', term) | prefix_filter('search_name_reversed', term))
 
 # --- Vues d'Authentification et d'Utilisateur ---
 class DoctorRegisterView(generics.CreateAPIView):
@@ -42,37 +113,99 @@ class DoctorRegisterView(generics.CreateAPIView):
         except Exception as e:
             raise serializers.ValidationError({"error": f"Une erreur est survenue lors de la création du compte: {e}"})
 
-class UserLoginView(APIView):
-    permission_classes = [AllowAny]
-    def post(self, request):
-        serializer = UserLoginSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        email = serializer.validated_data.get('email')
-        password = serializer.validated_data.get('password')
-
-        user = authenticate(request, username=email, password=password)
-
-        if user is not None:
-            if not hasattr(user, 'doctor'):
-                return Response({"message": "Compte non reconnu comme un médecin."}, status=status.HTTP_403_FORBIDDEN)
-            
-            refresh = RefreshToken.for_user(user)
-            user_data = {
-                "email": user.email,
-                "full_name": f"{user.first_name} {user.last_name}",
-            }
-            if hasattr(user, 'doctor'):
-                user_data["specialty"] = user.doctor.specialty
-            return Response({
-                "message": "Connexion réussie",
-                "refresh": str(refresh),
-                "access": str(refresh.access_token),
-                "user": user_data
-            }, status=status.HTTP_200_OK)
+# Taille des blocs envoyés par les réponses fichier en flux
+EXPORT_STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def stream_file(path, filename, content_type=None):
+    """Réponse de téléchargement diffusée par blocs depuis le disque."""
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = StreamingHttpResponse(FileWrapper(open(path, 'rb'), EXPORT_STREAM_BLOCK_SIZE), content_type=content_type)
+    response['Content-Length'] = os.path.getsize(path)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def job_accepted(job, request):
+    """Réponse 202 pour un travail mis en file : son état se suit sur /jobs/{id}/."""
+    data = JobSerializer(job, context={'request': request}).data
+    location = request.build_absolute_uri(reverse('job-detail', args=[job.pk]))
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+def _login(request, email, password):
+    """Authentifie et émet les jetons ; exécuté dans le pool de connexion (hachage du mot de passe)."""
+    user = authenticate(request, username=email, password=password)
+    if user is None:
+        return status.HTTP_401_UNAUTHORIZED, {"message": "Identifiants invalides."}
+    if not hasattr(user, 'doctor'):
+        return status.HTTP_403_FORBIDDEN, {"message": "Compte non reconnu comme un médecin."}
+
+    refresh = RefreshToken.for_user(user)
+    user_data = {
+        "email": user.email,
+        "full_name": f"{user.first_name} {user.last_name}",
+        "specialty": user.doctor.specialty,
+    }
+    return status.HTTP_200_OK, {
+        "message": "Connexion réussie",
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "user": user_data
+    }
+
+
+def _json(data, status_code, headers=None):
+    return JsonResponse(data, status=status_code, headers=headers, json_dumps_params={'ensure_ascii': False})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UserLoginView(View):
+    """
+    Connexion asynchrone (vue Django native : DRF n'a pas de vues asynchrones). Le hachage du mot
+    de passe est confié au pool borné de `login.py` et attendu sans bloquer : servie en ASGI
+    (asgi.py), la vue ne retient aucun worker pendant le calcul. 503 quand la file d'attente du
+    pool est pleine ; seuls les identifiants refusés comptent dans le quota par IP, au-delà
+    duquel la vue répond 429 sans vérifier le mot de passe.
+    """
+    http_method_names = ['post', 'options']
+
+    async def post(self, request):
+        address = client_ip(request)
+        retry_after = login_limiter.retry_after(address, settings.LOGIN_RATE_LIMIT, settings.LOGIN_RATE_WINDOW)
+        if retry_after:
+            return _json({"message": "Trop de tentatives de connexion, réessayez plus tard."},
+                         status.HTTP_429_TOO_MANY_REQUESTS, {'Retry-After': str(math.ceil(retry_after))})
+
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return _json({"detail": "JSON invalide."}, status.HTTP_400_BAD_REQUEST)
         else:
-            return Response({"message": "Identifiants invalides."}, status=status.HTTP_401_UNAUTHORIZED)
+            data = request.POST
+        serializer = UserLoginSerializer(data=data)
+        if not serializer.is_valid():
+            return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            status_code, payload = await login_executor.run(
+                _login, request, serializer.validated_data['email'], serializer.validated_data['password']
+            )
+        except LoginSaturated:
+            return _json({"message": "Service de connexion saturé, réessayez dans un instant."},
+                         status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': '1'})
+        if status_code == status.HTTP_401_UNAUTHORIZED:
+            login_limiter.hit(address, settings.LOGIN_RATE_WINDOW)
+        return _json(payload, status_code)
+
+
+class LoginMetricsView(APIView):
+    """Profondeur de file et compteurs du pool de connexion (processus courant)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(login_metrics())
 
 class ProtectedView(APIView):
     permission_classes = [IsAuthenticated, IsDoctor]
@@ -100,11 +233,10 @@ class PatientViewSet(ModelViewSet):
     
     def get_queryset(self):
         doctor = self.request.user.doctor
-        return Patient.objects.filter(
-            Q(consultations__doctor=doctor) |
-            Q(assigned_doctors=doctor) |
-            Q(referrals__referred_to=doctor)
-        ).distinct().prefetch_related('medical_procedures', 'consultations')
+        if self.action == 'export_pdf':
+            # L'export lit lui-même le dossier par paquets
+            return visible_patients(doctor)
+        return PatientSerializer.setup_eager_loading(visible_patients(doctor), self.request)
     
     def perform_create(self, serializer):
         try:
@@ -114,20 +246,107 @@ class PatientViewSet(ModelViewSet):
                 Consultation.objects.create(
                     patient=patient,
                     doctor=doctor,
-                    reason_for_consultation="Consultation initiale (ajout du patient par le médecin)"
+                    reason_for_consultation=INITIAL_CONSULTATION_REASON
                 )
                 patient.assigned_doctors.add(doctor)
         except IntegrityError:
             raise serializers.ValidationError({"error": "Erreur lors de la création du patient et de la consultation initiale."})
 
+    @staticmethod
+    def record_etag(version, representation=''):
+        # L'âge calculé par le sérialiseur change avec la date : l'ETag aussi
+        tag = f'{version}-{date.today():%Y%m%d}'
+        if representation:
+            # ?fields= / ?expand= : une autre représentation du même dossier
+            tag += '-' + hashlib.sha1(representation.encode()).hexdigest()[:8]
+        return f'"{tag}"'
+
+    def _validators(self, version, updated_at):
+        params = self.request.query_params
+        representation = '&'.join(f'{name}={params[name]}' for name in ('fields', 'expand') if name in params)
+        return {
+            'ETag': self.record_etag(version, representation),
+            'Last-Modified': http_date(updated_at.timestamp()),
+            'Cache-Control': 'private, no-cache',
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Dossier complet, avec ETag (version du dossier) et Last-Modified. Une requête conditionnelle
+        (If-None-Match / If-Modified-Since) sur un dossier inchangé reçoit 304 après une seule
+        lecture indexée, sans chargement des historiques ni sérialisation.
+        """
+        try:
+            stamp = visible_patients(request.user.doctor).filter(pk=kwargs['pk']).values('version', 'updated_at').first()
+        except (ValueError, DjangoValidationError):
+            stamp = None
+        if stamp is not None:
+            headers = self._validators(stamp['version'], stamp['updated_at'])
+            not_modified = get_conditional_response(
+                request, etag=headers['ETag'], last_modified=int(stamp['updated_at'].timestamp()),
+            )
+            if not_modified is not None:
+                for name, value in headers.items():
+                    not_modified[name] = value
+                return not_modified
+
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        for name, value in self._validators(instance.version, instance.updated_at).items():
+            response[name] = value
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Import en masse depuis un fichier CSV ou XLSX (champ `file`), exécuté en tâche de fond.
+        Répond 202 avec le travail créé ; son résultat détaille les lignes rejetées.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({"file": "Aucun fichier fourni."})
+        try:
+            check_filename(upload.name)
+        except ImportFormatError as exc:
+            raise serializers.ValidationError({"file": str(exc)})
+        job = jobs.enqueue(Job.KIND_IMPORT_PATIENTS, request.user, path=jobs.save_input(upload), filename=upload.name)
+        return job_accepted(job, request)
+
+    @action(detail=True, methods=['get'], url_path='export.pdf')
+    def export_pdf(self, request, pk=None):
+        """
+        Dossier complet du patient en PDF. Servi en flux s'il est déjà en cache pour la version
+        courante du dossier, sinon produit en tâche de fond (202 avec le travail créé, ou celui
+        déjà en cours pour la même version : les GET répétés ne relancent pas l'export).
+        """
+        patient = self.get_object()
+        doctor = request.user.doctor
+        path = cached_patient_record(patient, doctor)
+        if path is None:
+            job = jobs.enqueue_once(
+                Job.KIND_EXPORT_PDF, request.user, patient_id=str(patient.pk), record=patient_record_name(patient, doctor),
+            )
+            job.refresh_from_db()
+            # Avec JOBS_EAGER, le travail est déjà terminé
+            if job.status != Job.STATUS_SUCCEEDED:
+                return job_accepted(job, request)
+            path = job.result_file
+        return stream_file(path, f"fiche_patient_{patient.pk}.pdf")
+
 class DoctorViewSet(ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
 
+    def get_queryset(self):
+        return DoctorSerializer.setup_eager_loading(super().get_queryset(), self.request)
+
 class WorkplaceViewSet(viewsets.ModelViewSet):
     queryset = Workplace.objects.all()
     serializer_class = WorkplaceSerializer
+
+    def get_queryset(self):
+        return WorkplaceSerializer.setup_eager_loading(super().get_queryset(), self.request)
     
     def get_permissions(self):
         if self.action in ['create']:
@@ -153,43 +372,14 @@ class WorkplaceViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def statistics(self, request, pk=None):
         workplace = self.get_object()
-        doctors_in_clinic = workplace.doctors.all()
-        
-        all_patients = Patient.objects.filter(
-            Q(appointments__workplace=workplace) |
-            Q(consultations__doctor__in=doctors_in_clinic) |
-            Q(medical_procedures__operator__in=doctors_in_clinic)
-        ).distinct().count()
-        
-        all_appointments = Appointment.objects.filter(workplace=workplace).count()
-        all_consultations = Consultation.objects.filter(doctor__in=doctors_in_clinic).count()
-        all_medical_procedures = MedicalProcedure.objects.filter(operator__in=doctors_in_clinic).count()
-
-        doctor_stats = []
-        for doctor in doctors_in_clinic:
-            consultations_count = Consultation.objects.filter(doctor=doctor).count()
-            appointments_count = Appointment.objects.filter(doctor=doctor).count()
-            procedures_count = MedicalProcedure.objects.filter(operator=doctor).count()
-            
-            doctor_stats.append({
-                "id": doctor.id,
-                "name": f"Dr. {doctor.user.first_name} {doctor.user.last_name}",
-                "consultations": consultations_count,
-                "appointments": appointments_count,
-                "medical_procedures": procedures_count
-            })
-
-        data = {
-            "total_stats": {
-                "doctors": doctors_in_clinic.count(),
-                "patients": all_patients,
-                "appointments": all_appointments,
-                "consultations": all_consultations,
-                "medical_procedures": all_medical_procedures,
-            },
-            "doctors_breakdown": doctor_stats
-        }
-
+        since = parse_query_date(request, 'since')
+        until = parse_query_date(request, 'until')
+        data = cache.cached(
+            'workplace-statistics',
+            [(cache.WORKPLACE, workplace.pk)],
+            lambda: workplace_statistics(workplace, since=since, until=until),
+            params={'since': since, 'until': until},
+        )
         return Response(data, status=status.HTTP_200_OK)
 
 class DeletedAppointmentsListView(generics.ListAPIView):
@@ -197,6 +387,9 @@ class DeletedAppointmentsListView(generics.ListAPIView):
     serializer_class = DeletedAppointmentSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
 
+    def get_queryset(self):
+        return DeletedAppointmentSerializer.setup_eager_loading(super().get_queryset(), self.request)
+
 class AppointmentViewSet(ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
@@ -226,25 +419,87 @@ class AppointmentViewSet(ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     def get_queryset(self):
-        return Appointment.objects.filter(doctor=self.request.user.doctor)
+        queryset = Appointment.objects.filter(doctor=self.request.user.doctor).order_by('appointment_date')
+        return AppointmentSerializer.setup_eager_loading(queryset, self.request)
+
+class BatchCreateMixin:
+    """
+    Action POST /batch/ : crée une liste d'objets en une requête (resynchronisation des clients
+    hors ligne). Tout ou rien : le lot est validé en entier (many=True), puis inséré par
+    bulk_create dans une seule transaction. Le médecin connecté est renseigné dans `batch_owner_field`.
+    """
+    batch_owner_field = None
 
-class ConsultationViewSet(ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError({"detail": "Une liste d'objets est attendue."})
+        if len(request.data) > settings.API_MAX_BATCH_SIZE:
+            raise serializers.ValidationError({"detail": f"Lot limité à {settings.API_MAX_BATCH_SIZE} objets."})
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        self.preload_related(serializer.child, request.data)
+        if not serializer.is_valid():
+            # Un seul objet invalide rejette tout le lot : on indique lesquels
+            results = [
+                {"index": index, "status": status.HTTP_400_BAD_REQUEST if errors else status.HTTP_424_FAILED_DEPENDENCY, "errors": errors}
+                for index, errors in enumerate(serializer.errors)
+            ]
+            return Response({"created": 0, "results": results}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = serializer.child.Meta.model
+        owner = {self.batch_owner_field: request.user.doctor}
+        with transaction.atomic():
+            instances = model.objects.bulk_create([model(**data, **owner) for data in serializer.validated_data])
+            bulk_post_create.send(sender=model, instances=instances)
+
+        results = [
+            {"index": index, "status": status.HTTP_201_CREATED, "data": data}
+            for index, data in enumerate(self.get_serializer(instances, many=True).data)
+        ]
+        return Response({"created": len(instances), "results": results}, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def preload_related(child, items):
+        """
+        Clés étrangères du lot (patient...) chargées en une requête par champ : sans cela,
+        la validation lit chaque objet référencé séparément. Une valeur absente du
+        préchargement (inconnue, mal formée) suit la validation habituelle.
+        """
+        for name, field in child.fields.items():
+            if field.read_only or not isinstance(field, serializers.PrimaryKeyRelatedField):
+                continue
+            values = {item.get(name) for item in items if isinstance(item, dict)}
+            values = [value for value in values if isinstance(value, (str, int)) and not isinstance(value, bool)]
+            try:
+                found = {str(pk): obj for pk, obj in field.get_queryset().in_bulk(values).items()}
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+            field.to_internal_value = lambda data, found=found, lookup=field.to_internal_value: (
+                found.get(str(data)) or lookup(data)
+            )
+
+class ConsultationViewSet(BatchCreateMixin, ModelViewSet):
     serializer_class = ConsultationSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
+    batch_owner_field = 'doctor'
     
     def get_queryset(self, *args, **kwargs):
-        return Consultation.objects.filter(doctor=self.request.user.doctor).order_by('-consultation_date')
+        queryset = Consultation.objects.filter(doctor=self.request.user.doctor).order_by('-consultation_date')
+        return ConsultationSerializer.setup_eager_loading(queryset, self.request)
 
     def perform_create(self, serializer):
         doctor = self.request.user.doctor
         serializer.save(doctor=doctor)
 
-class MedicalProcedureViewSet(ModelViewSet):
+class MedicalProcedureViewSet(BatchCreateMixin, ModelViewSet):
     serializer_class = MedicalProcedureSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
+    batch_owner_field = 'operator'
     
     def get_queryset(self):
-        return MedicalProcedure.objects.filter(operator=self.request.user.doctor)
+        queryset = MedicalProcedure.objects.filter(operator=self.request.user.doctor).order_by('-procedure_date')
+        return MedicalProcedureSerializer.setup_eager_loading(queryset, self.request)
 
     def perform_create(self, serializer):
         serializer.save(operator=self.request.user.doctor)
@@ -258,10 +513,11 @@ class ReferralViewSet(ModelViewSet):
     # CORRECTION : Filtre le queryset pour n'afficher que les références impliquant le médecin connecté
     def get_queryset(self):
         current_doctor = self.request.user.doctor
-        return Referral.objects.filter(
+        queryset = Referral.objects.filter(
             Q(referred_by=current_doctor) |  # Références faites par ce médecin
             Q(referred_to=current_doctor)    # Références reçues par ce médecin
         ).order_by('-date_of_referral').distinct()
+        return ReferralSerializer.setup_eager_loading(queryset, self.request)
 
     def perform_create(self, serializer):
         # Assigner automatiquement le médecin connecté en tant que référent
@@ -275,15 +531,37 @@ class ReferralViewSet(ModelViewSet):
 # Note: PatientReferralViewSet est supprimé car le ReferralViewSet générique gère toutes les opérations.
 
 class ForumPostViewSet(viewsets.ModelViewSet):
-    queryset = ForumPost.objects.all().order_by('-created_at')
     serializer_class = ForumPostSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
 
+    def get_queryset(self):
+        queryset = ForumPost.objects.select_related('author__user').order_by('-created_at')
+        if self.action in ('list', 'retrieve'):
+            rendered = ForumPostSerializer.requested_fields(self.request, ['comments_count', 'comments'])
+            if 'comments_count' in rendered:
+                queryset = queryset.annotate(comments_count=Count('comments'))
+            if 'comments' in rendered:
+                # Seuls les N derniers commentaires de chaque post, en une requête fenêtrée
+                latest = ForumComment.objects.select_related('author__user').annotate(
+                    rank=Window(RowNumber(), partition_by=F('post_id'), order_by=[F('created_at').desc(), F('pk').desc()])
+                ).filter(rank__lte=ForumPostSerializer.LATEST_COMMENTS).order_by('created_at', 'pk')
+                queryset = queryset.prefetch_related(Prefetch('comments', queryset=latest, to_attr='latest_comments'))
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.doctor)
 
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        """Fil complet des commentaires d'un post, paginé par curseur."""
+        post = self.get_object()
+        queryset = ForumComment.objects.filter(post=post).select_related('author__user').order_by('created_at')
+        page = self.paginate_queryset(queryset)
+        serializer = ForumCommentSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
 class ForumCommentViewSet(viewsets.ModelViewSet):
-    queryset = ForumComment.objects.all().order_by('created_at')
+    queryset = ForumComment.objects.select_related('author__user').order_by('created_at')
     serializer_class = ForumCommentSerializer
     permission_classes = [IsAuthenticated, IsDoctor]
 
@@ -307,11 +585,7 @@ class DoctorPatientListView(generics.ListAPIView):
     
     def get_queryset(self, *args, **kwargs):
         doctor = get_object_or_404(Doctor, user=self.request.user)
-        queryset = Patient.objects.filter(
-            Q(consultations__doctor=doctor) |
-            Q(assigned_doctors=doctor) |
-            Q(referrals__referred_to=doctor)
-        ).distinct()
+        queryset = visible_patients(doctor)
         
         patient_id_filter = self.request.query_params.get('id', None)
         if patient_id_filter:
@@ -319,7 +593,11 @@ class DoctorPatientListView(generics.ListAPIView):
                 uuid.UUID(patient_id_filter)
                 queryset = queryset.filter(unique_id=patient_id_filter)
             except ValueError:
-                queryset = Patient.objects.none()
+                queryset = queryset.none()
+
+        search_term = self.request.query_params.get('search')
+        if search_term:
+            queryset = search_patients(queryset, search_term)
         return queryset
 
 # Vues pour les statistiques du docteur
@@ -328,17 +606,19 @@ class DoctorStatsView(generics.GenericAPIView):
 
     def get(self, request, *args, **kwargs):
         doctor = request.user.doctor
-        
+        data = cache.cached('doctor-stats', [(cache.DOCTOR, doctor.pk)], lambda: self.compute_stats(doctor))
+        return Response(data, status=status.HTTP_200_OK)
+
+    def compute_stats(self, doctor):
         total_patients = doctor.assigned_patients.count()
         total_consultations = doctor.consultations.count()
         total_medical_procedures = doctor.operated_procedures.count()
 
-        data = {
+        return {
             'total_patients': total_patients,
             'total_consultations': total_consultations,
             'total_medical_procedures': total_medical_procedures,
         }
-        return Response(data, status=status.HTTP_200_OK)
 
 class DoctorPatientStatsView(generics.ListAPIView):
     serializer_class = PatientListSerializer
@@ -357,6 +637,10 @@ class DoctorPatientStatsView(generics.ListAPIView):
         return patients
 
     def list(self, request, *args, **kwargs):
+        data = cache.cached('doctor-patient-stats', [(cache.DOCTOR, request.user.doctor.pk)], self.compute_stats)
+        return Response(data, status=status.HTTP_200_OK)
+
+    def compute_stats(self):
         queryset = self.get_queryset()
         data = []
         for patient in queryset:
@@ -367,7 +651,7 @@ class DoctorPatientStatsView(generics.ListAPIView):
                 'medical_procedures_count': patient.medical_procedures_count,
                 'referrals_count': patient.referrals_count,
             })
-        return Response(data, status=status.HTTP_200_OK)
+        return data
 
 
 # ----------------------------------------------------------------------
@@ -378,58 +662,184 @@ class GlobalStatsView(APIView):
     """
     Vue pour récupérer les statistiques globales de l'application, 
     y compris les totaux et les agrégations par clinique et par médecin.
+    Les valeurs sont lues dans la table de compteurs StatsCounter, maintenue par les signaux.
     """
     permission_classes = [IsAuthenticated, IsDoctor] 
 
     def get(self, request, format=None):
-        
+        data = cache.cached('global-stats', [(cache.GLOBAL, 0)], self.compute_stats)
+
+        # Le sérialiseur est uniquement là pour documenter la structure des données.
+        serializer = GlobalStatsSerializer(data) 
+        return Response(serializer.data)
+
+    def compute_stats(self):
+        # Toutes les lignes de compteurs en une seule requête, sans jointure
+        counters = StatsCounter.objects.order_by('scope', 'label', 'object_id')
+        global_row = None
+        stats_by_workplace = []
+        stats_by_doctor = []
+        for row in counters:
+            if row.scope == StatsCounter.SCOPE_GLOBAL:
+                global_row = row
+            elif row.scope == StatsCounter.SCOPE_WORKPLACE:
+                stats_by_workplace.append({
+                    'id': row.object_id,
+                    'name': row.label,
+                    'consultation_count': row.consultations,
+                    'patient_count': row.patients,
+                    'procedure_count': row.procedures,
+                })
+            else:
+                stats_by_doctor.append({
+                    'id': row.object_id,
+                    'full_name': row.label,
+                    'specialty': row.specialty,
+                    'consultation_count': row.consultations,
+                    'patient_count': row.patients,
+                    'referral_count': row.referrals,
+                    'procedure_count': row.procedures,
+                })
+
         # 1. STATISTIQUES GLOBALES
+        global_row = global_row or StatsCounter()
         global_stats = {
-            'total_doctors': Doctor.objects.count(),
-            'total_workplaces': Workplace.objects.count(),
-            'total_patients': Patient.objects.count(),
-            'total_consultations': Consultation.objects.count(),
-            'total_referrals': Referral.objects.count(),
-            'total_procedures': MedicalProcedure.objects.count(),
+            'total_doctors': global_row.doctors,
+            'total_workplaces': global_row.workplaces,
+            'total_patients': global_row.patients,
+            'total_consultations': global_row.consultations,
+            'total_referrals': global_row.referrals,
+            'total_procedures': global_row.procedures,
         }
 
-        # 2. STATISTIQUES AGRÉGÉES PAR CLINIQUE (WORKPLACE)
-        stats_by_workplace = Workplace.objects.annotate(
-            consultation_count=Count('doctors__consultations', distinct=True),
-            patient_count=Count('doctors__assigned_patients', distinct=True),
-            procedure_count=Count('doctors__operated_procedures', distinct=True)
-        ).values(
-            'id', 
-            'name', 
-            'consultation_count', 
-            'patient_count', 
-            'procedure_count'
-        ).order_by('name')
-
-        # 3. STATISTIQUES AGRÉGÉES PAR MÉDECIN (DOCTOR)
-        stats_by_doctor = Doctor.objects.annotate(
-            full_name=Concat(F('user__first_name'), Value(' '), F('user__last_name')),
-            consultation_count=Count('consultations', distinct=True),
-            patient_count=Count('assigned_patients', distinct=True), 
-            referral_count=Count('referred_by_me', distinct=True), 
-            procedure_count=Count('operated_procedures', distinct=True)
-        ).values(
-            'id', 
-            'full_name', 
-            'specialty',
-            'consultation_count', 
-            'patient_count', 
-            'referral_count', 
-            'procedure_count'
-        ).order_by('full_name')
-
         # COMBINAISON ET SÉRIALISATION
         data = {
             **global_stats,
-            'stats_by_workplace': list(stats_by_workplace),
-            'stats_by_doctor': list(stats_by_doctor),
+            # 2. STATISTIQUES AGRÉGÉES PAR CLINIQUE (WORKPLACE)
+            'stats_by_workplace': stats_by_workplace,
+            # 3. STATISTIQUES AGRÉGÉES PAR MÉDECIN (DOCTOR)
+            'stats_by_doctor': stats_by_doctor,
         }
+        return data
 
-        # Le sérialiseur est uniquement là pour documenter la structure des données.
-        serializer = GlobalStatsSerializer(data) 
-        return Response(serializer.data)
\ No newline at end of file
+class StatsRebuildView(APIView):
+    """Met en file le recalcul complet des compteurs de statistiques (commande rebuild_stats)."""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        return job_accepted(jobs.enqueue(Job.KIND_REBUILD_STATS, request.user), request)
+
+
+class SearchView(APIView):
+    """
+    Recherche plein texte dans les consultations (diagnostic, traitement, compte rendu), les notes
+    du médecin et les antécédents de ses patients, classée par pertinence (voir search.py).
+    GET /search/?q=<texte>&limit=20&offset=0
+    """
+    permission_classes = [IsAuthenticated, IsDoctor]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not search.match_expression(query):
+            return Response({"detail": "Le paramètre q est requis."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"detail": "limit et offset doivent être des entiers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Une ligne de plus que demandé : indique s'il existe une page suivante, sans COUNT
+        results = search.search(request.user.doctor, query, limit + 1, offset)
+        next_url = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+        return Response({"next": next_url, "results": results})
+
+
+class SyncView(APIView):
+    """
+    Synchronisation différentielle : GET /sync/ (complète), puis GET /sync/?since=<curseur> avec
+    le curseur de la réponse précédente (voir sync.py). Réponse JSON produite en flux.
+    """
+    permission_classes = [IsAuthenticated, IsDoctor]
+
+    def get(self, request):
+        try:
+            since = sync.parse_cursor(request.query_params.get('since'))
+        except sync.CursorExpired as exc:
+            # 410 : le client repart d'une synchronisation complète
+            return Response({"detail": str(exc)}, status=status.HTTP_410_GONE)
+        except sync.CursorError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            sync.stream_changes(request.user.doctor, since, {'request': request}),
+            content_type='application/json; charset=utf-8',
+        )
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """État des travaux de fond de l'utilisateur connecté, et téléchargement de leur résultat."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(created_by=self.request.user).order_by('-id')
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != Job.STATUS_SUCCEEDED or not job.result_file:
+            return Response({"detail": "Aucun fichier disponible pour ce travail."}, status=status.HTTP_409_CONFLICT)
+        if not os.path.exists(job.result_file):
+            return Response({"detail": "Le fichier n'est plus disponible, relancez l'export."}, status=status.HTTP_410_GONE)
+        filename = (job.result or {}).get('filename') or os.path.basename(job.result_file)
+        return stream_file(job.result_file, filename)
+
+
+class AttachmentDownloadView(APIView):
+    """
+    Pièce jointe d'une consultation, d'un acte ou d'un référencement, réservée aux médecins
+    qui voient le patient concerné (ou qui sont l'auteur de l'élément).
+    GET /attachments/<consultation|procedure|referral>/<id>/
+    GET /attachments/<consultation|procedure|referral>/<id>/<thumb|preview>/ : dérivé JPEG d'une image
+    """
+    permission_classes = [IsAuthenticated, IsDoctor]
+
+    # type -> (modèle, champ fichier, champs désignant les médecins auteurs)
+    SOURCES = {
+        'consultation': (Consultation, 'attachments', ('doctor_id',)),
+        'procedure': (MedicalProcedure, 'attachments', ('operator_id',)),
+        'referral': (Referral, 'attached_documents', ('referred_by_id', 'referred_to_id')),
+    }
+
+    def perform_content_negotiation(self, request, force=False):
+        # Le client demande un fichier (Accept: application/pdf...) : les erreurs restent en JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, kind, pk, variant=None):
+        if kind not in self.SOURCES or (variant is not None and variant not in VARIANTS):
+            raise NotFound()
+        model, field, owner_fields = self.SOURCES[kind]
+        instance = get_object_or_404(model, pk=pk)
+        doctor = request.user.doctor
+        allowed = doctor.pk in [getattr(instance, name) for name in owner_fields] or PatientVisibility.objects.filter(
+            doctor=doctor, patient_id=instance.patient_id
+        ).exists()
+        fieldfile = getattr(instance, field)
+        # Même réponse qu'un élément inexistant : on ne révèle pas l'existence du fichier
+        if not allowed or not fieldfile:
+            raise NotFound()
+        if variant:
+            # Dérivé rangé à côté de l'original, servi avec les mêmes en-têtes (ETag, Range)
+            if not derivative_exists(fieldfile.name, variant):
+                raise NotFound("Aperçu non disponible.")
+            fieldfile = FieldFile(instance, fieldfile.field, derivative_name(fieldfile.name, variant))
+        try:
+            return serve_attachment(request, fieldfile)
+        except FileNotFoundError:
+            raise NotFound("Fichier introuvable sur le serveur.")
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Point d'entrée de production : gunicorn telemedicine_project.asgi:application -k uvicorn_worker.UvicornWorker.
+La vue de connexion asynchrone (auth_app.views.UserLoginView) y attend le hachage des mots de
+passe, confié au pool borné de auth_app/login.py, sans retenir de worker ; les autres vues,
+synchrones, sont exécutées par Django dans un thread par requête. Servie en WSGI, la vue de
+connexion fonctionne mais bloque son worker pendant le hachage.
 """
 
 import os
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # Doit être en premier
     'django.middleware.security.SecurityMiddleware',
+    'auth_app.middleware.CompressionMiddleware', # gzip / brotli des réponses de l'API
     'whitenoise.middleware.WhiteNoiseMiddleware', # INDISPENSABLE pour les fichiers statiques sur Render
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,13 +71,68 @@ WSGI_APPLICATION = 'telemedicine_project.wsgi.application'
 
 # Database
 # Note: SQLite3 fonctionne sur Render mais les données s'effacent à chaque redémarrage (disque éphémère).
+# Profils de base de données : les PRAGMAS sont appliqués à chaque nouvelle connexion par le
+# signal connection_created (voir auth_app/signals.py).
+DATABASE_PROFILES = {
+    # Comportement SQLite par défaut : journal "rollback", une connexion par requête
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+        'PRAGMAS': {},
+    },
+    # WAL : les lectures ne bloquent plus les écritures, et les écritures n'attendent plus les lectures
+    'production': {
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)), # Connexions persistantes (secondes)
+        'OPTIONS': {
+            'timeout': 20,
+            # Prend le verrou d'écriture dès le BEGIN des blocs atomiques : évite les échecs
+            # immédiats "database is locked" lors de la promotion d'une transaction de lecture
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL', # Sûr en mode WAL, évite un fsync par transaction
+            'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)), # ms
+            'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)), # Valeur négative = Kio (~64 Mo)
+            'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)), # 256 Mo
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'production')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_HEALTH_CHECKS': True,
+        **DATABASE_PROFILES[DATABASE_PROFILE],
     }
 }
 
+# Cache
+# filebased par défaut : les numéros de génération (auth_app/cache.py) doivent être partagés par
+# tous les workers gunicorn d'une machine, sans quoi un worker sert des statistiques ou un
+# utilisateur invalidés par un autre. CACHE_BACKEND=locmem (un cache par processus) ne convient
+# qu'à un processus unique (runserver, tests ponctuels).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'filebased')
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'altheon',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator' },
@@ -105,6 +161,28 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Pièces jointes cliniques (/api/attachments/...) : délégation de l'envoi au serveur web.
+# '' : servies par Django ; 'x-accel-redirect' : nginx (location interne ATTACHMENT_ACCEL_PREFIX
+# pointant sur MEDIA_ROOT) ; 'x-sendfile' : Apache mod_xsendfile.
+ATTACHMENT_SENDFILE = os.environ.get('ATTACHMENT_SENDFILE', '')
+ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
+# Cache des exports PDF de dossiers patients (régénérables, non versionnés)
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', os.path.join(BASE_DIR, 'exports'))
+EXPORT_MAX_AGE = int(os.environ.get('EXPORT_MAX_AGE', 24 * 3600))  # secondes ; au-delà, régénéré et supprimé par purge_exports
+
+# File de travaux de fond (auth_app/jobs.py, commande runworker)
+JOB_ROOT = os.environ.get('JOB_ROOT', os.path.join(BASE_DIR, 'jobs'))  # fichiers d'entrée des imports, non servis
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_HEARTBEAT = int(os.environ.get('JOB_HEARTBEAT', 30))  # secondes entre deux prolongations du bail des travaux en cours
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 300))  # secondes sans prolongation avant de relancer un travail orphelin
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))  # au-delà, un travail interrompu passe en échec
+JOBS_EAGER = os.environ.get('JOBS_EAGER', '0') == '1'  # exécution immédiate, sans worker (développement)
+
+# Synchronisation différentielle des clients (/api/sync/)
+SYNC_OVERLAP = int(os.environ.get('SYNC_OVERLAP', 5))  # secondes relues à chaque synchronisation (écritures concurrentes)
+SYNC_TOMBSTONE_RETENTION = int(os.environ.get('SYNC_TOMBSTONE_RETENTION', 90))  # jours ; au-delà, resynchronisation complète
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ---
@@ -114,12 +192,48 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth_app.authentication.DoctorJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Pagination par curseur (keyset) pour toutes les listes
+    'DEFAULT_PAGINATION_CLASS': 'auth_app.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
+    # JSON rendu et lu par orjson s'il est installé (auth_app/renderers.py), sinon par le module json ;
+    # remplacer par rest_framework.renderers.JSONRenderer / rest_framework.parsers.JSONParser pour revenir à DRF
+    'DEFAULT_RENDERER_CLASSES': (
+        'auth_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'auth_app.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
+# Compression des réponses (auth_app/middleware.py) : brotli si le paquet est installé, sinon gzip
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))  # octets ; en dessous, envoyé tel quel
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))  # 0-11 ; au-delà de 5, trop lent pour du dynamique
+# Réponses portant des jetons : jamais compressées (attaques de type BREACH)
+COMPRESSION_EXCLUDED_PATHS = ('/api/login/', '/api/token/refresh/')
+# Plafond du paramètre ?page_size= accepté par KeysetPagination
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
+# Nombre maximal d'objets par requête sur les actions /batch/
+API_MAX_BATCH_SIZE = int(os.environ.get('API_MAX_BATCH_SIZE', 500))
+
+# Cache en mémoire de la résolution utilisateur/médecin par jeton (DoctorJWTAuthentication)
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))  # secondes, 0 pour désactiver
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+
+# Connexion (UserLoginView) : pool de hachage borné et quota de tentatives par IP
+LOGIN_WORKERS = int(os.environ.get('LOGIN_WORKERS', 4))  # 0 : hachage dans le thread synchrone partagé (tests)
+LOGIN_MAX_PENDING = int(os.environ.get('LOGIN_MAX_PENDING', 32))  # au-delà : 503
+LOGIN_RATE_LIMIT = int(os.environ.get('LOGIN_RATE_LIMIT', 10))  # échecs par IP et par fenêtre, au-delà : 429
+LOGIN_RATE_WINDOW = int(os.environ.get('LOGIN_RATE_WINDOW', 60))  # secondes
+# Proxys de confiance devant l'application (Render : 1) ; 0 si les clients se connectent directement,
+# sans quoi un en-tête X-Forwarded-For forgé suffirait à contourner le quota
+LOGIN_TRUSTED_PROXIES = int(os.environ.get('LOGIN_TRUSTED_PROXIES', 1))
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), # Augmenté à 60min pour plus de confort